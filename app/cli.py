@@ -1,22 +1,104 @@
-from typing import Annotated
+from functools import partial
+from importlib import import_module
+from importlib.resources import files
+from json import loads as json_loads
+from typing import Annotated, Any, Callable
 
 import typer
+from click import Command, Context, Group
 from typer import Typer, Option
+from typer.core import TyperGroup
+from typer.main import get_group
 
-from app.utils import detect_veepeenet_versions
+# Command modules are imported only when one of their commands is invoked
+_COMMAND_MODULES = {
+    'config': 'app.controller.commands.configure',
+    'update-geodata': 'app.controller.commands.configure',
+    'update-xray': 'app.controller.commands.configure',
+    'exporter': 'app.controller.commands.exporter',
+    'status': 'app.controller.commands.state',
+    'start': 'app.controller.commands.state',
+    'stop': 'app.controller.commands.state',
+    'restart': 'app.controller.commands.state',
+    'reset-stats': 'app.controller.commands.state',
+    '_store-stats': 'app.controller.commands.state',
+    'stats-collector': 'app.controller.commands.stats',
+    'top': 'app.controller.commands.stats',
+    'clients': 'app.controller.commands.clients',
+    'routing': 'app.controller.commands.routing',
+    'outbounds': 'app.controller.commands.outbound',
+    'stats': 'app.controller.commands.stats',
+    'batch': 'app.controller.commands.batch',
+    'apply': 'app.controller.commands.apply',
+    'serve': 'app.controller.commands.serve',
+}
+
+
+class LazyGroup(TyperGroup):
+
+    def __init__(self, **attrs: Any) -> None:
+        super().__init__(**attrs)
+        self._loaded_modules: set[str] = set()
+
+    def list_commands(self, ctx: Context) -> list[str]:
+        self._load_modules(*_COMMAND_MODULES.values())
+        return super().list_commands(ctx)
+
+    def get_command(self, ctx: Context, cmd_name: str) -> Command | None:
+        if ctx.resilient_parsing and _COMMAND_MODULES.get(cmd_name) not in self._loaded_modules:
+            # Shell completion, the commands completing names are served without importing their modules
+            from app.controller.completions import get_completion_commands  # pylint: disable=import-outside-toplevel
+            completion_commands = get_completion_commands(cmd_name)
+            if completion_commands:
+                return _CompletionGroup(
+                    name=cmd_name, commands=completion_commands,
+                    load_group=partial(self._get_loaded_command, ctx, cmd_name))
+        return self._get_loaded_command(ctx, cmd_name)
+
+    def _get_loaded_command(self, ctx: Context, cmd_name: str) -> Command | None:
+        module_name = _COMMAND_MODULES.get(cmd_name)
+        if module_name:
+            self._load_modules(module_name)
+        return super().get_command(ctx, cmd_name)
+
+    def _load_modules(self, *module_names: str) -> None:
+        new_modules = [name for name in dict.fromkeys(module_names) if name not in self._loaded_modules]
+        if not new_modules:
+            return
+        for module_name in new_modules:
+            import_module(module_name)
+            self._loaded_modules.add(module_name)
+        self.commands = get_group(app).commands
+
+
+class _CompletionGroup(TyperGroup):
+
+    def __init__(self, load_group: Callable[[], Command | None], **attrs: Any) -> None:
+        super().__init__(**attrs)
+        self._load_group = load_group
+
+    def list_commands(self, ctx: Context) -> list[str]:
+        group = self._load_group()
+        return group.list_commands(ctx) if isinstance(group, Group) else super().list_commands(ctx)
+
+    def get_command(self, ctx: Context, cmd_name: str) -> Command | None:
+        if cmd_name in self.commands:
+            return self.commands[cmd_name]
+        group = self._load_group()
+        return group.get_command(ctx, cmd_name) if isinstance(group, Group) else None
 
 
 def _version_callback(value: bool) -> None:
     if value:
-        versions = detect_veepeenet_versions()
+        versions = json_loads(files('app.resources').joinpath('versions.json').read_text('utf-8'))
         typer.echo(
-            f'VeePeeNET {versions.veepeenet_version} '
-            f'build {versions.veepeenet_build} '
-            f'(Xray {versions.xray_version})')
+            f'VeePeeNET {versions["veepeenet_version"]} '
+            f'build {versions["veepeenet_build"]} '
+            f'(Xray {versions["xray_version"]})')
         raise typer.Exit()
 
 
-app = Typer()
+app = Typer(cls=LazyGroup)
 
 
 @app.callback()
@@ -31,7 +113,9 @@ def show_version(
 clients = Typer()
 routing = Typer()
 outbounds = Typer()
+stats = Typer()
 
 app.add_typer(clients, name='clients', help='Manage clients')
 app.add_typer(routing, name='routing', help='Manage routing')
 app.add_typer(outbounds, name='outbounds', help='Manage outbounds')
+app.add_typer(stats, name='stats', help='Show traffic history')
@@ -0,0 +1,57 @@
+from dataclasses import dataclass, field
+from json import dumps as json_dumps, loads as json_loads
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from xxhash import xxh64
+
+_INDEX_FORMAT = 1
+
+
+@dataclass
+class CompletionIndex:
+    clients: list[str] = field(default_factory=list)
+    rules: list[str] = field(default_factory=list)
+    outbounds: list[tuple[str, str | None]] = field(default_factory=list)
+
+
+def get_completion_index_path(config_path: Path) -> Path:
+    return config_path.with_name(f'.{config_path.name}.completion')
+
+
+def read_completion_index(config_path: Path) -> CompletionIndex | None:
+    try:
+        config_hash = xxh64(config_path.read_bytes()).hexdigest()
+        content = json_loads(get_completion_index_path(config_path).read_bytes())
+        if content['format'] != _INDEX_FORMAT or content['config'] != config_hash:
+            return None
+        return CompletionIndex(
+            clients=[str(name) for name in content['clients']],
+            rules=[str(name) for name in content['rules']],
+            outbounds=[(str(tag), protocol) for tag, protocol in content['outbounds']])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def write_completion_index(config_path: Path, config_content: bytes, index: CompletionIndex) -> bool:
+    content = json_dumps({
+        'format': _INDEX_FORMAT,
+        'config': xxh64(config_content).hexdigest(),
+        'clients': index.clients,
+        'rules': index.rules,
+        'outbounds': index.outbounds,
+    }, separators=(',', ':'))
+    index_path = get_completion_index_path(config_path)
+    tmp_path: Path | None = None
+    try:
+        with NamedTemporaryFile('w', encoding='utf-8', dir=index_path.parent,
+                                prefix=f'.{index_path.name}.', delete=False) as tmp:
+            tmp_path = Path(tmp.name)
+            tmp.write(content)
+        tmp_path.chmod(0o644)
+        tmp_path.replace(index_path)
+        return True
+    except OSError:
+        if tmp_path:
+            tmp_path.unlink(missing_ok=True)
+        return False
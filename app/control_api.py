@@ -0,0 +1,204 @@
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler
+from json import dumps as json_dumps
+from os import chmod
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable
+from urllib.parse import unquote
+
+from pydantic import BaseModel
+from typer import Exit
+
+from app.controller.common import (
+    get_runtime_stats,
+    get_stored_stats,
+    get_vless_inbound,
+    load_config,
+    stderr_console,
+    stdout_console,
+)
+from app.controller.commands.apply import get_state_operations
+from app.controller.commands.batch import (
+    BatchOperation, parse_batch_operations, run_batch_operations, to_batch_operations)
+from app.controller.commands.clients import get_clients_view
+from app.controller.commands.outbound import get_outbounds_view
+from app.controller.commands.routing import get_routing_view
+from app.controller.data import ClientIndex
+from app.defaults import XRAY_CONFIG_PATH, CONTROL_STATS_TTL
+from app.model.state import State
+from app.model.xray import Xray
+from app.utils import get_file_key
+
+JSON_CONTENT_TYPE = 'application/json'
+_MAX_BODY_SIZE = 64 * 1024 * 1024
+
+Response = tuple[int, bytes]
+
+
+@dataclass
+class Snapshot:
+    config: Xray
+    key: tuple[int, int, int] | None
+    client_index: ClientIndex
+    responses: dict[str, bytes] = field(default_factory=dict)
+
+    @classmethod
+    def create(cls, config: Xray, key: tuple[int, int, int] | None) -> 'Snapshot':
+        return Snapshot(
+            config=config, key=key, client_index=ClientIndex.from_inbound(get_vless_inbound(config)))
+
+
+class ControlState:
+
+    def __init__(self, config_path: Path = XRAY_CONFIG_PATH, stats_ttl: float = CONTROL_STATS_TTL):
+        self.config_path = config_path
+        self.stats_ttl = stats_ttl
+        # A single writer changes a freshly loaded model, readers keep the previous snapshot until replaced
+        self._write_lock = Lock()
+        self._snapshot: Snapshot | None = None
+        self._stats: tuple[float, bytes] | None = None
+
+    def get(self, path: str) -> Response:
+        if path == '/stats':
+            return 200, self._get_stats()
+
+        snapshot = self._get_snapshot()
+        response = snapshot.responses.get(path)
+        if response is not None:
+            return 200, response
+
+        if path == '/clients':
+            response = _to_json(get_clients_view(snapshot.config, client_index=snapshot.client_index))
+        elif path.startswith('/clients/'):
+            name = unquote(path.removeprefix('/clients/'))
+            if name not in snapshot.client_index:
+                return _error(404, f'Client {name} not found')
+            response = _to_json(get_clients_view(
+                snapshot.config, client_names=[name], client_index=snapshot.client_index).clients[0])
+        elif path == '/routing':
+            response = _to_json(get_routing_view(snapshot.config))
+        elif path == '/outbounds':
+            response = _to_json(get_outbounds_view(snapshot.config))
+        else:
+            return _error(404, f'Unknown path {path}')
+        snapshot.responses[path] = response
+        return 200, response
+
+    def post(self, path: str, body: bytes) -> Response:
+        if path == '/batch':
+            return self._write(lambda _: parse_batch_operations(body.decode('utf-8').splitlines()))
+        if path == '/apply':
+            return self._write(lambda config: to_batch_operations(
+                enumerate(get_state_operations(config, State.model_validate_json(body)), start=1)))
+        return _error(404, f'Unknown path {path}')
+
+    def _get_snapshot(self) -> Snapshot:
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.key != get_file_key(self.config_path):
+            with self._write_lock:
+                snapshot = self._snapshot
+                key = get_file_key(self.config_path)
+                if snapshot is None or snapshot.key != key:
+                    snapshot = Snapshot.create(load_config(self.config_path), key)
+                    self._snapshot = snapshot
+        return snapshot
+
+    def _write(self, get_operations: Callable[[Xray], list[BatchOperation]]) -> Response:
+        with self._write_lock:
+            error: tuple[int, str, int | None] | None = None
+            with stdout_console.capture() as output, stderr_console.capture() as errors:
+                key = get_file_key(self.config_path)
+                config = load_config(self.config_path)
+                operations: list[BatchOperation] = []
+                applied = False
+                try:
+                    operations = get_operations(config)
+                    applied = bool(operations) and run_batch_operations(operations, xray_config=config)
+                except Exit as e:
+                    error = 400, '', e.exit_code
+                except ValueError as e:
+                    error = 400, str(e), None
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    error = 500, str(e), None
+            if error is not None:
+                status, message, code = error
+                return _error(status, message or errors.get().strip() or 'Operation failed', code)
+            self._snapshot = Snapshot.create(config, get_file_key(self.config_path) if applied else key)
+        return 200, _to_json({
+            'applied': applied, 'operations': len(operations), 'output': output.get().strip()})
+
+    def _get_stats(self) -> bytes:
+        stats = self._stats
+        if stats is None or monotonic() - stats[0] >= self.stats_ttl:
+            display_stats = get_stored_stats()
+            display_stats += get_runtime_stats()
+            stats = monotonic(), _to_json(display_stats)
+            self._stats = stats
+        return stats[1]
+
+
+class ControlServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def create_control_server(socket_path: Path, state: ControlState) -> ControlServer:
+
+    class ControlHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            try:
+                response = state.get(self.path.split('?', 1)[0].rstrip('/') or '/')
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                response = _error(500, str(e))
+            self._send(*response)
+
+        def do_POST(self) -> None:  # pylint: disable=invalid-name
+            try:
+                response = self._post()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                response = _error(500, str(e))
+            self._send(*response)
+
+        def _post(self) -> Response:
+            length = self.headers.get('Content-Length')
+            if length is None:
+                return _error(411, 'Content-Length header is required')
+            if not length.strip().isdecimal():
+                return _error(400, f'Invalid Content-Length "{length}"')
+            if int(length) > _MAX_BODY_SIZE:
+                return _error(413, 'Request body is too large')
+            return state.post(self.path.split('?', 1)[0].rstrip('/'), self.rfile.read(int(length)))
+
+        def _send(self, status: int, body: bytes) -> None:
+            self.send_response(status)
+            self.send_header('Content-Type', JSON_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self) -> str:
+            return str(self.client_address or 'unix')
+
+        def log_message(self, format: str, *args: object) -> None:  # pylint: disable=redefined-builtin
+            pass
+
+    socket_path.unlink(missing_ok=True)
+    server = ControlServer(str(socket_path), ControlHandler)
+    chmod(socket_path, 0o600)
+    return server
+
+
+def _to_json(value: BaseModel | dict[str, Any]) -> bytes:
+    if isinstance(value, BaseModel):
+        return value.model_dump_json(by_alias=True, exclude_none=True).encode('utf-8')
+    return json_dumps(value, ensure_ascii=False).encode('utf-8')
+
+
+def _error(status: int, message: str, code: int | None = None) -> Response:
+    error: dict[str, Any] = {'error': message}
+    if code is not None:
+        error['code'] = code
+    return status, _to_json(error)
@@ -0,0 +1,196 @@
+from json import dumps as json_dumps
+from pathlib import Path
+from sys import stdin
+from typing import Annotated, Any, Callable
+from uuid import UUID
+
+from pydantic import ValidationError
+from rich.text import Text
+from typer import Option, Exit, get_text_stream
+
+from app.cli import app
+from app.controller.common import (
+    check_root,
+    check_xray_config,
+    error_handler,
+    get_disabled_emails,
+    get_vless_inbound,
+    load_config,
+    print_error,
+    stdout_console,
+)
+from app.controller.commands.batch import run_batch_operations, to_batch_operations
+from app.controller.data import ClientData, ClientIndex, RuleData
+from app.defaults import (
+    XRAY_CONFIG_PATH,
+    VLESS_SEND_INTERFACE,
+    USER_RULE_PRIORITY_MIN,
+    USER_RULE_PRIORITY_MAX,
+    STYLE_REGULAR,
+    STYLE_OK,
+    STYLE_VALUE,
+    EXIT_APPLY_ERROR,
+    EXIT_APPLY_INVALID_STATE,
+)
+from app.model.state import ClientState, OutboundState, RuleState, State
+from app.model.vless_outbound import VlessOutbound
+from app.model.xray import Xray
+
+
+@app.command(name='apply', help='Apply desired clients, routing rules and Vless outbounds from JSON file')
+@error_handler(default_message='Error applying state', default_code=EXIT_APPLY_ERROR)
+def apply_state(
+        file: Annotated[str, Option(
+            '--file', '-f', help='JSON file with desired state ("-" for stdin)')] = '-',
+        dry_run: Annotated[bool, Option(
+            '--dry-run', help='Print required operations as NDJSON without applying them')] = False,
+        _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
+    check_root()
+    check_xray_config()
+    state = _read_state(file)
+    xray_config = load_config(XRAY_CONFIG_PATH)
+    records = get_state_operations(xray_config, state)
+
+    if dry_run:
+        stream = get_text_stream('stdout')
+        for record in records:
+            stream.write(json_dumps(record, ensure_ascii=False) + '\n')
+        stream.flush()
+        return
+    if not records:
+        stdout_console.print(Text('Configuration already matches the state', STYLE_OK))
+        return
+
+    run_batch_operations(to_batch_operations(enumerate(records, start=1)), _debug, xray_config)
+    stdout_console.print(Text.assemble(
+        ('State applied, operations: ', STYLE_OK),
+        (str(len(records)), STYLE_VALUE)))
+
+
+def get_state_operations(xray_config: Xray, state: State) -> list[dict[str, Any]]:
+    client_index = ClientIndex.from_inbound(get_vless_inbound(xray_config))
+    namespace = UUID(xray_config.veepeenet and xray_config.veepeenet.namespace)
+
+    def get_email(name: str) -> str:
+        if name in client_index:
+            return client_index.get_email(name)
+        return ClientData(name=name, namespace=namespace).to_model().email or ''
+
+    removed_rules, added_rules = _diff_rules(xray_config, state.rules, get_email)
+    records: list[dict[str, Any]] = [
+        {'command': 'routing remove-rule', 'name': name} for name in removed_rules]
+    records.extend(_diff_outbounds(xray_config, state.outbounds))
+    records.extend(_diff_clients(xray_config, state.get_clients(), client_index, get_email))
+    records.extend({'command': 'routing add-rule', **rule.model_dump(exclude_none=True)}
+                   for rule in added_rules)
+    return records
+
+
+def _diff_clients(
+        xray_config: Xray,
+        desired_clients: list[ClientState] | None,
+        client_index: ClientIndex,
+        get_email: Callable[[str], str]) -> list[dict[str, Any]]:
+    if desired_clients is None:
+        return []
+
+    desired_names = {client.name for client in desired_clients}
+    disabled_emails = get_disabled_emails(xray_config)
+    names_by_command = {
+        'clients remove': [name for name in client_index.names if name not in desired_names],
+        'clients add': list(dict.fromkeys(
+            client.name for client in desired_clients if client.name not in client_index)),
+        'clients disable': list(dict.fromkeys(
+            client.name for client in desired_clients
+            if client.disabled and get_email(client.name) not in disabled_emails)),
+        'clients enable': list(dict.fromkeys(
+            client.name for client in desired_clients
+            if not client.disabled and client.name in client_index
+            and get_email(client.name) in disabled_emails)),
+    }
+    return [{'command': command, 'client_names': names}
+            for command, names in names_by_command.items() if names]
+
+
+def _diff_rules(
+        xray_config: Xray,
+        desired_rules: list[RuleState] | None,
+        get_email: Callable[[str], str]) -> tuple[list[str], list[RuleState]]:
+    if desired_rules is None:
+        return [], []
+
+    existing_rules = {rule.name: rule for rule in _get_user_rules(xray_config)}
+    removed_names: list[str] = []
+    added_rules: list[RuleState] = []
+    desired_names: set[str] = set()
+    for number, rule in enumerate(desired_rules):
+        priority = rule.priority if rule.priority is not None else (number + 1) * 10
+        rule = rule.model_copy(update={'priority': priority})
+        desired_names.add(rule.name)
+        existing_rule = existing_rules.get(rule.name)
+        desired_data = RuleData(
+            name=rule.name, outbound_name=rule.outbound, protocols=rule.protocol, ports=rule.ports,
+            domains=rule.domain, ips=rule.ip, users=[get_email(name) for name in rule.client or []],
+            priority=priority)
+        if existing_rule is not None and _normalize_rule(existing_rule) == _normalize_rule(desired_data):
+            continue
+        if existing_rule is not None:
+            removed_names.append(rule.name)
+        added_rules.append(rule)
+    removed_names.extend(name for name in existing_rules if name not in desired_names)
+    return removed_names, added_rules
+
+
+def _diff_outbounds(xray_config: Xray, desired_outbounds: list[OutboundState] | None) -> list[dict[str, Any]]:
+    if desired_outbounds is None:
+        return []
+
+    existing_outbounds = {outbound.tag: outbound for outbound in xray_config.outbounds or []
+                          if isinstance(outbound, VlessOutbound) and outbound.tag}
+    desired_names = {outbound.name for outbound in desired_outbounds}
+    records: list[dict[str, Any]] = [{'command': 'outbounds remove', 'name': name}
+                                     for name in existing_outbounds if name not in desired_names]
+    for outbound in desired_outbounds:
+        existing_outbound = existing_outbounds.get(outbound.name)
+        if existing_outbound is None:
+            records.append({'command': 'outbounds add', **outbound.model_dump()})
+        elif _get_outbound_state(existing_outbound) != outbound:
+            records.append({'command': 'outbounds change', **outbound.model_dump()})
+    return records
+
+
+def _get_outbound_state(outbound: VlessOutbound) -> OutboundState:
+    reality_settings = outbound.stream_settings.reality_settings
+    return OutboundState(
+        name=outbound.tag or '',
+        address=outbound.settings.address,
+        uuid=outbound.settings.id,
+        sni=reality_settings.server_name,
+        short_id=reality_settings.short_id,
+        password=reality_settings.password,
+        spider_x=reality_settings.spider_x,
+        port=outbound.settings.port,
+        fingerprint=reality_settings.fingerprint,
+        interface=outbound.send_through or VLESS_SEND_INTERFACE)
+
+
+def _get_user_rules(xray_config: Xray) -> list[RuleData]:
+    rules = xray_config.routing.rules if xray_config.routing and xray_config.routing.rules else []
+    return [rule_data for rule_data in (RuleData.from_model(rule, number) for number, rule in enumerate(rules))
+            if USER_RULE_PRIORITY_MIN <= rule_data.priority <= USER_RULE_PRIORITY_MAX]
+
+
+def _normalize_rule(rule: RuleData) -> tuple[Any, ...]:
+    return (rule.outbound_name, rule.protocols or None, rule.ports or None, rule.domains or None,
+            rule.ips or None, rule.users or None, rule.priority)
+
+
+def _read_state(file: str) -> State:
+    content = stdin.read() if file == '-' else Path(file).read_text(encoding='utf-8')
+    try:
+        return State.model_validate_json(content)
+    except ValidationError as e:
+        print_error(Text.assemble(
+            ('Invalid state file:\n', STYLE_REGULAR),
+            (str(e), 'dim')))
+        raise Exit(code=EXIT_APPLY_INVALID_STATE) from e
@@ -0,0 +1,156 @@
+from inspect import Parameter, signature, unwrap
+from json import loads as json_loads
+from sys import stdin
+from types import NoneType, UnionType
+from typing import (
+    Annotated, Any, Callable, Iterable, Literal, NoReturn, TextIO, Union, get_args, get_origin, get_type_hints)
+
+from rich.text import Text
+from typer import Option, Exit, Typer
+from typer.main import get_command_name
+
+from app.cli import app
+from app.controller.common import (
+    check_root,
+    check_xray_config,
+    commit_batch,
+    error_handler,
+    open_batch,
+    print_error,
+    stdout_console,
+)
+from app.controller.commands import (
+    clients as clients_commands,
+    outbound as outbound_commands,
+    routing as routing_commands,
+)
+from app.defaults import (
+    STYLE_REGULAR,
+    STYLE_OK,
+    STYLE_WARN,
+    STYLE_ACCENT_NEUTRAL,
+    STYLE_VALUE,
+    EXIT_BATCH_ERROR,
+    EXIT_BATCH_INVALID_OPERATION,
+)
+from app.model.xray import Xray
+
+_BATCH_GROUPS: dict[str, Typer] = {
+    'clients': clients_commands.clients,
+    'routing': routing_commands.routing,
+    'outbounds': outbound_commands.outbounds,
+}
+_READ_ONLY_COMMANDS = {'list', 'export'}
+
+BatchOperation = tuple[str, Callable[..., Any], dict[str, Any]]
+
+
+@app.command(help='Apply clients, routing and outbounds operations from NDJSON file at once')
+@error_handler(default_message='Error applying batch operations', default_code=EXIT_BATCH_ERROR)
+def batch(
+        file: Annotated[str, Option(
+            '--file', '-f',
+            help='NDJSON file with one operation per line ("-" for stdin), '
+                 'e.g. {"command": "clients add", "client_names": ["alice"]}')] = '-',
+        _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
+    check_root()
+    check_xray_config()
+    if file == '-':
+        operations = parse_batch_operations(stdin)
+    else:
+        with open(file, 'rt', encoding='utf-8') as operations_file:
+            operations = parse_batch_operations(operations_file)
+
+    if not run_batch_operations(operations, _debug):
+        stdout_console.print(Text('No changes to apply', STYLE_WARN))
+        return
+    stdout_console.print(Text.assemble(
+        ('Applied operations: ', STYLE_OK),
+        (str(len(operations)), STYLE_VALUE)))
+
+
+def run_batch_operations(
+        operations: list[BatchOperation], debug: bool = False, xray_config: Xray | None = None) -> bool:
+    with open_batch(xray_config) as batch_config:
+        for number, (command_name, command, params) in enumerate(operations, start=1):
+            try:
+                command(**params, _debug=debug)
+            except Exit:
+                print_error(Text.assemble(
+                    ('Operation ', STYLE_REGULAR),
+                    (f'#{number} {command_name}', STYLE_ACCENT_NEUTRAL),
+                    (' failed, no changes were saved', STYLE_REGULAR)))
+                raise
+    return commit_batch(batch_config)
+
+
+def parse_batch_operations(lines: TextIO | Iterable[str]) -> list[BatchOperation]:
+    records: list[tuple[int, Any]] = []
+    for line_number, line in enumerate(lines, start=1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        try:
+            records.append((line_number, json_loads(stripped)))
+        except ValueError:
+            _fail_operation(line_number, 'invalid JSON')
+    return to_batch_operations(records)
+
+
+def to_batch_operations(records: Iterable[tuple[int, Any]]) -> list[BatchOperation]:
+    commands = _get_batch_commands()
+    operations: list[BatchOperation] = []
+    for line_number, record in records:
+        if not isinstance(record, dict):
+            _fail_operation(line_number, 'operation must be a JSON object')
+        params = {str(key).replace('-', '_'): value for key, value in record.items()}
+        command_name = params.pop('command', None)
+        command = commands.get(command_name) if isinstance(command_name, str) else None
+        if command is None:
+            _fail_operation(line_number, f'unknown command {command_name!r}')
+        error = _check_params(command, params)
+        if error:
+            _fail_operation(line_number, error)
+        operations.append((command_name, command, params))
+    return operations
+
+
+def _get_batch_commands() -> dict[str, Callable[..., Any]]:
+    commands: dict[str, Callable[..., Any]] = {}
+    for group_name, group in _BATCH_GROUPS.items():
+        for command_info in group.registered_commands:
+            if command_info.callback is None:
+                continue
+            name = command_info.name or get_command_name(command_info.callback.__name__)
+            if name not in _READ_ONLY_COMMANDS:
+                commands[f'{group_name} {name}'] = command_info.callback
+    return commands
+
+
+def _check_params(command: Callable[..., Any], params: dict[str, Any]) -> str | None:
+    parameters = signature(command).parameters
+    hints = get_type_hints(unwrap(command))
+    for name in params:
+        if name.startswith('_') or name not in parameters:
+            return f'unknown parameter {name!r}'
+    for name, parameter in parameters.items():
+        if not name.startswith('_') and parameter.default is Parameter.empty and name not in params:
+            return f'missing parameter {name!r}'
+
+    for name, value in params.items():
+        hint_types = get_args(hints[name]) if get_origin(hints[name]) in (Union, UnionType) else (hints[name],)
+        if isinstance(value, str) and any(get_origin(hint_type) is list for hint_type in hint_types):
+            params[name] = [value]
+        allowed_values = [allowed for hint_type in hint_types if get_origin(hint_type) is Literal
+                          for allowed in get_args(hint_type)]
+        if allowed_values and value not in allowed_values and not (value is None and NoneType in hint_types):
+            return f'invalid value {value!r} of parameter {name!r}'
+    return None
+
+
+def _fail_operation(line_number: int, reason: str) -> NoReturn:
+    print_error(Text.assemble(
+        ('Invalid operation at line ', STYLE_REGULAR),
+        (str(line_number), STYLE_ACCENT_NEUTRAL),
+        (f': {reason}', STYLE_REGULAR)))
+    raise Exit(code=EXIT_BATCH_INVALID_OPERATION)
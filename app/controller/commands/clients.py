@@ -1,10 +1,14 @@
+from csv import writer as csv_writer
+from itertools import chain
+from json import dumps as json_dumps
 from pathlib import Path
-from typing import Annotated
+from typing import Annotated, Iterable, Iterator, TextIO
+from urllib.parse import quote_plus as safe_url_encode
 from uuid import UUID
 
 from rich.console import Console
 from rich.text import Text
-from typer import Argument, Context, Option, Exit
+from typer import Argument, Context, Option, Exit, get_text_stream
 
 from app.cli import clients
 from app.controller.common import (
@@ -12,15 +16,19 @@ from app.controller.common import (
     load_config,
     check_xray_config,
     check_root,
+    get_disabled_emails,
     get_vless_inbound,
     save_config,
     stdout_console,
     get_runtime_stats,
     get_stored_stats,
     print_error,
+    is_config_applied,
+    apply_clients_changes,
+    apply_routing_changes,
 )
 from app.controller.completions import complete_client_name
-from app.controller.data import ClientData, RuleData
+from app.controller.data import ClientData, ClientIndex, RuleData, StatsData
 from app.defaults import (
     XRAY_CONFIG_PATH,
     STYLE_ACCENT_NEUTRAL,
@@ -33,50 +41,73 @@ from app.defaults import (
     DISABLED_CLIENTS_RULE_PRIORITY,
 )
 from app.model.routing import Rule, Routing
+from app.model.types import ClientsExportFormatType
 from app.model.xray import Xray
 from app.model.veepeenet import VeePeeNetStats
 from app.utils import (
-    get_new_items,
-    get_vless_client_url,
+    get_reality_password,
+    read_client_names,
     remove_duplicates,
-    get_existing_items,
 )
 from app.view import ClientsView, ClientView, TrafficStatsView
 
 
 @clients.command(help='Register clients to service')
 @error_handler(default_message='Error adding clients to service', default_code=EXIT_CLIENTS_ERROR)
-def add(client_names: Annotated[list[str],
-        Argument(help='List of new client of server')],
+def add(client_names: Annotated[list[str] | None,
+        Argument(help='List of new client of server')] = None,
+        from_file: Annotated[str | None, Option(
+            '--from-file',
+            help='Read client names from file ("-" for stdin), one name or NDJSON object per line')] = None,
         _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
     check_root()
     check_xray_config()
-    _add_clients(client_names)
+    _add_clients(_get_client_names(client_names, from_file))
 
 
 @clients.command(help='Remove clients from service')
 @error_handler(default_message='Error removing clients from service',
                default_code=EXIT_CLIENTS_ERROR)
-def remove(client_names: Annotated[list[str],
+def remove(client_names: Annotated[list[str] | None,
         Argument(help='List of clients to remove from Xray Vless Reality server',
-                 autocompletion=complete_client_name)],
+                 autocompletion=complete_client_name)] = None,
+           from_file: Annotated[str | None, Option(
+               '--from-file',
+               help='Read client names from file ("-" for stdin), one name or NDJSON object per line')] = None,
            _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
     check_root()
     check_xray_config()
-    _remove_clients(client_names)
+    _remove_clients(_get_client_names(client_names, from_file))
 
 
 @clients.command(help='List clients of service', name='list')
 @error_handler(default_message='Error listing clients of service', default_code=EXIT_CLIENTS_ERROR)
 def show(
+        client_names: Annotated[list[str] | None, Argument(
+            help='Show only these clients', autocompletion=complete_client_name)] = None,
         json: Annotated[bool, Option(help='Show JSON formatted info')] = False,
+        no_stats: Annotated[bool, Option('--no-stats', help='Do not query traffic statistics')] = False,
         _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
     check_xray_config()
     xray_config = load_config(XRAY_CONFIG_PATH)
-    display_stats = get_stored_stats()
-    display_stats += get_runtime_stats()
-
-    view = get_clients_view(xray_config, display_stats)
+    client_index = ClientIndex.from_inbound(get_vless_inbound(xray_config))
+    if client_names:
+        client_names, unknown_names = _split_client_names_by_existence(client_names, client_index)
+        if unknown_names:
+            print_error(Text.assemble(
+                ('Unknown clients: ', STYLE_REGULAR),
+                Text(', ', STYLE_REGULAR).join([Text(name, STYLE_ACCENT_NEUTRAL) for name in unknown_names]),
+            ))
+            raise Exit(code=EXIT_CLIENTS_ERROR)
+
+    display_stats: VeePeeNetStats | None = None
+    if not no_stats:
+        display_stats = get_stored_stats()
+        display_stats += get_runtime_stats(
+            subject=StatsData.SubjectType.CLIENT,
+            name=client_index.get_email(client_names[0]) if client_names and len(client_names) == 1 else None)
+
+    view = get_clients_view(xray_config, display_stats, client_names, client_index)
     if json:
         stdout_console.print_json(view.model_dump_json(exclude_none=True), indent=2)
     else:
@@ -88,9 +119,21 @@ def show(
 def show_default(
         ctx: Context,
         json: Annotated[bool, Option(help='Show JSON formatted info')] = False,
+        no_stats: Annotated[bool, Option('--no-stats', help='Do not query traffic statistics')] = False,
         _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
     if ctx.invoked_subcommand is None:
-        show(json=json, _debug=_debug)
+        show(json=json, no_stats=no_stats, _debug=_debug)
+
+
+@clients.command(help='Export clients URLs in machine-readable format')
+@error_handler(default_message='Error exporting clients of service', default_code=EXIT_CLIENTS_ERROR)
+def export(
+        export_format: Annotated[ClientsExportFormatType, Option(
+            '--format', help='Output format: tsv, ndjson or csv')] = 'tsv',
+        _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
+    check_xray_config()
+    xray_config = load_config(XRAY_CONFIG_PATH)
+    write_clients_export(iter_clients_urls(xray_config), export_format, get_text_stream('stdout'))
 
 
 @clients.command(help='Disable clients access to service')
@@ -113,33 +156,90 @@ def enable(client_names: Annotated[list[str],
     _set_clients_disabled_state(client_names, disabled=False)
 
 
-def get_clients_view(xray_config: Xray, stats: VeePeeNetStats | None = None) -> ClientsView:
-    inbound = get_vless_inbound(xray_config)
-    disabled_emails = _get_disabled_emails(xray_config)
+def get_clients_view(
+        xray_config: Xray,
+        stats: VeePeeNetStats | None = None,
+        client_names: Iterable[str] | None = None,
+        client_index: ClientIndex | None = None) -> ClientsView:
+    disabled_emails = get_disabled_emails(xray_config)
+    if client_index is None:
+        client_index = ClientIndex.from_inbound(get_vless_inbound(xray_config))
 
-    clients_data = [ClientData.from_model(client, i)
-                    for i, client in enumerate(inbound.settings.clients or [])]
     clients_views: list[ClientView] = []
-    for client_data in clients_data:
-        client_ts = stats.client.get(client_data.name) if stats else None
-        client_email = client_data.to_model().email
+    for name in client_names if client_names is not None else client_index.names:
+        stats_view: TrafficStatsView | None = None
+        if stats is not None:
+            client_ts = stats.client.get(name)
+            stats_view = TrafficStatsView(
+                uplink=client_ts.uplink, downlink=client_ts.downlink) if client_ts else TrafficStatsView()
         clients_views.append(ClientView(
-            name=client_data.name,
-            url=get_vless_client_url(client_data.name, xray_config) or 'error',
-            disabled=client_email in disabled_emails,
-            stats=TrafficStatsView(
-                uplink=client_ts.uplink, downlink=client_ts.downlink) if client_ts else TrafficStatsView()))
+            name=name,
+            url=get_vless_client_url(name, xray_config, client_index) or 'error',
+            disabled=client_index.get_email(name) in disabled_emails,
+            stats=stats_view))
     return ClientsView(clients=clients_views)
 
 
-def _get_disabled_emails(xray_config: Xray) -> set[str]:
-    rules = xray_config.routing.rules if xray_config.routing and xray_config.routing.rules else []
-    for index, rule in enumerate(rules):
-        rule_data = RuleData.from_model(rule, index)
-        if (rule_data.name == DISABLED_CLIENTS_RULE_NAME
-                and rule_data.priority == DISABLED_CLIENTS_RULE_PRIORITY):
-            return set(rule_data.users or [])
-    return set()
+def iter_clients_urls(xray_config: Xray) -> Iterator[tuple[str, str]]:
+    client_index = ClientIndex.from_inbound(get_vless_inbound(xray_config))
+    for name in client_index.names:
+        yield name, get_vless_client_url(name, xray_config, client_index) or 'error'
+
+
+def get_vless_client_url(
+        client_name: str, xray_config: Xray, client_index: ClientIndex | None = None) -> str | None:
+    inbound = xray_config.get_vless_inbound()
+    if not inbound:
+        raise ValueError('Vless inbound not found in Xray config')
+    if client_index is None:
+        client_index = ClientIndex.from_inbound(inbound)
+    position = client_index.get_position(client_name)
+    if position is None:
+        return None
+
+    client = client_index.clients[position]
+    sni = inbound.stream_settings.reality_settings.server_names[0]
+    password = get_reality_password(xray_config)
+    spx = safe_url_encode(f'/{client_name}')
+    server_name = xray_config.veepeenet and (xray_config.veepeenet.name or xray_config.veepeenet.host)
+    return (f'vless://{client.id}@{xray_config.veepeenet and xray_config.veepeenet.host}:'
+            f'{inbound.port}'
+            '?flow=xtls-rprx-vision'
+            '&type=raw'
+            '&security=reality'
+            '&fp=chrome'
+            f'&sni={sni}'
+            f'&pbk={password}'
+            f'&sid={inbound.stream_settings.reality_settings.short_ids[position]}'
+            f'&spx={spx}'
+            f'#{client_name}@{server_name}')
+
+
+def write_clients_export(
+        rows: Iterable[tuple[str, str]], export_format: ClientsExportFormatType, stream: TextIO) -> None:
+    if export_format == 'csv':
+        writer = csv_writer(stream, lineterminator='\n')
+        writer.writerow(('name', 'url'))
+        for row in rows:
+            writer.writerow(row)
+    elif export_format == 'ndjson':
+        for name, url in rows:
+            stream.write(json_dumps({'name': name, 'url': url}, ensure_ascii=False) + '\n')
+    else:
+        for name, url in rows:
+            stream.write(f'{name}\t{url}\n')
+    stream.flush()
+
+
+def _get_client_names(client_names: list[str] | None, from_file: str | None) -> Iterable[str]:
+    if not client_names and not from_file:
+        print_error(Text.assemble(
+            ('Specify client names or ', STYLE_REGULAR),
+            ('--from-file', STYLE_ACCENT_NEUTRAL)))
+        raise Exit(code=EXIT_CLIENTS_ERROR)
+    if from_file:
+        return chain(client_names or [], read_client_names(from_file))
+    return client_names or []
 
 
 def _update_disabled_rule(xray_config: Xray, disabled_emails: set[str]) -> None:
@@ -166,26 +266,16 @@ def _update_disabled_rule(xray_config: Xray, disabled_emails: set[str]) -> None:
     xray_config.routing.rules = updated_rules or None
 
 
-def _get_client_emails_by_name(xray_config: Xray) -> dict[str, str]:
-    inbound = get_vless_inbound(xray_config)
-    clients_data = [ClientData.from_model(client, i)
-                    for i, client in enumerate(inbound.settings.clients or [])]
-    return {
-        client_data.name: client_data.to_model().email
-        for client_data in clients_data
-    } # type: ignore
-
-
 def _split_client_names_by_disabled_state(
         names: list[str],
-        name_to_email: dict[str, str],
+        client_index: ClientIndex,
         disabled_emails: set[str],
         disabled: bool) -> tuple[list[str], list[str]]:
     unchanged_names: list[str] = []
     changed_names: list[str] = []
 
     for name in names:
-        is_disabled = name_to_email[name] in disabled_emails
+        is_disabled = client_index.get_email(name) in disabled_emails
         if is_disabled == disabled:
             unchanged_names.append(name)
         else:
@@ -199,9 +289,9 @@ def _set_clients_disabled_state(
         disabled: bool,
         xray_config_path: Path = XRAY_CONFIG_PATH) -> None:
     xray_config = load_config(xray_config_path)
-    name_to_email = _get_client_emails_by_name(xray_config)
+    client_index = ClientIndex.from_inbound(get_vless_inbound(xray_config))
     unique_names = remove_duplicates(names)
-    unknown_names = get_new_items(list(name_to_email), unique_names)
+    unknown_names = [name for name in unique_names if name not in client_index]
     if unknown_names:
         unknown_names_rich = Text(', ', STYLE_REGULAR).join(
             [Text(name, STYLE_ACCENT_NEUTRAL) for name in unknown_names])
@@ -211,10 +301,10 @@ def _set_clients_disabled_state(
         ))
         raise Exit(code=EXIT_CLIENTS_ERROR)
 
-    disabled_emails = _get_disabled_emails(xray_config)
-    target_emails = {name_to_email[name] for name in unique_names}
+    disabled_emails = get_disabled_emails(xray_config)
+    target_emails = {client_index.get_email(name) for name in unique_names}
     unchanged_names, changed_names = _split_client_names_by_disabled_state(
-        unique_names, name_to_email, disabled_emails, disabled)
+        unique_names, client_index, disabled_emails, disabled)
 
     if unchanged_names:
         unchanged_names_rich = Text(', ', STYLE_REGULAR).join(
@@ -247,59 +337,79 @@ def _set_clients_disabled_state(
         ('Disabled clients: ', STYLE_REGULAR) if disabled else ('Enabled clients: ', STYLE_REGULAR),
         changed_names_rich,
     ))
+    apply_routing_changes(xray_config)
+
+
+def _split_client_names_by_existence(
+        names: Iterable[str], client_index: ClientIndex) -> tuple[list[str], list[str]]:
+    seen_names: set[str] = set()
+    existing_names: list[str] = []
+    missing_names: list[str] = []
+
+    for name in names:
+        if name in seen_names:
+            continue
+        seen_names.add(name)
+        if name in client_index:
+            existing_names.append(name)
+        else:
+            missing_names.append(name)
 
+    return existing_names, missing_names
 
-def _add_clients(names: list[str], xray_config_path: Path = XRAY_CONFIG_PATH) -> None:
+
+def _add_clients(names: Iterable[str], xray_config_path: Path = XRAY_CONFIG_PATH) -> None:
     xray_config = load_config(xray_config_path)
     inbound = get_vless_inbound(xray_config)
-    reality_settings = inbound.stream_settings.reality_settings
     namespace = UUID(xray_config.veepeenet and xray_config.veepeenet.namespace)
 
-    existing_clients_data = [ClientData.from_model(client, i)
-                             for i, client in enumerate(inbound.settings.clients or [])]
-    existing_names = [client_data.name for client_data in existing_clients_data]
-    new_names = get_new_items(existing_names, remove_duplicates(names))
-    already_existing_names = get_existing_items(existing_names, names)
+    client_index = ClientIndex.from_inbound(inbound)
+    already_existing_names, new_names = _split_client_names_by_existence(names, client_index)
 
     if already_existing_names:
-        skipped_names = Text(', ', STYLE_REGULAR).join(
-            [Text(name, STYLE_ACCENT_NEUTRAL) for name in already_existing_names])
-        stdout_console.print(Text.assemble(
-            ('These clients ', STYLE_REGULAR),
-            ('already exist ', STYLE_WARN),
-            ('and will be skipped: ', STYLE_REGULAR),
-            skipped_names
-        ))
+        _print_skipped_clients(already_existing_names)
     if not new_names:
         stdout_console.print(Text('No new clients found', STYLE_WARN))
         return
 
-    existing_short_ids = [client_data.short_id for client_data in existing_clients_data]
+    existing_clients_data = client_index.to_data()
+    existing_short_ids = list(client_index.short_ids)
     for name in new_names:
         data = ClientData(name=name, namespace=namespace)
         existing_short_ids.append(data.short_id)
         existing_clients_data.append(data)
 
     inbound.settings.clients = [client_data.to_model() for client_data in existing_clients_data]
-    reality_settings.short_ids = existing_short_ids
+    inbound.stream_settings.reality_settings.short_ids = existing_short_ids
 
+    config_applied = is_config_applied()
     save_config(xray_config, xray_config_path)
     added_names = Text(', ', STYLE_REGULAR).join(
         [Text(name, STYLE_ACCENT_UP) for name in new_names])
     stdout_console.print(Text('Added new clients: ', STYLE_REGULAR).append(added_names))
+    apply_clients_changes(
+        xray_config,
+        added_clients=inbound.settings.clients[len(client_index):],
+        refresh_backup=config_applied)
+
+
+def _print_skipped_clients(names: Iterable[str]) -> None:
+    skipped_names = Text(', ', STYLE_REGULAR).join([Text(name, STYLE_ACCENT_NEUTRAL) for name in names])
+    stdout_console.print(Text.assemble(
+        ('These clients ', STYLE_REGULAR),
+        ('already exist ', STYLE_WARN),
+        ('and will be skipped: ', STYLE_REGULAR),
+        skipped_names
+    ))
 
 
-def _remove_clients(names: list[str], xray_config_path: Path = XRAY_CONFIG_PATH) -> None:
+def _remove_clients(names: Iterable[str], xray_config_path: Path = XRAY_CONFIG_PATH) -> None:
     xray_config = load_config(xray_config_path)
     inbound = get_vless_inbound(xray_config)
-    existing_clients = inbound.settings.clients
     reality_settings = inbound.stream_settings.reality_settings
 
-    existing_clients_data = [ClientData.from_model(client, i)
-                             for i, client in enumerate(existing_clients or [])]
-    existing_names = [client_data.name for client_data in existing_clients_data]
-    removable_names = get_existing_items(existing_names, remove_duplicates(names))
-    unknown_names = get_new_items(existing_names, names)
+    client_index = ClientIndex.from_inbound(inbound)
+    removable_names, unknown_names = _split_client_names_by_existence(names, client_index)
 
     if unknown_names:
         unknown_names_rich = Text(', ', STYLE_REGULAR).join(
@@ -315,14 +425,21 @@ def _remove_clients(names: list[str], xray_config_path: Path = XRAY_CONFIG_PATH)
         stdout_console.print(Text('No removable clients found', STYLE_WARN))
         return
 
-    remaining_clients_data = [cd for cd in existing_clients_data if cd.name not in removable_names]
+    removable_set = set(removable_names)
+    remaining_clients_data = [client_index.get_data(position) for position in range(len(client_index))
+                              if client_index.names[position] not in removable_set]
     inbound.settings.clients = [client_data.to_model() for client_data in remaining_clients_data]
     reality_settings.short_ids = [cd.short_id for cd in remaining_clients_data]
-    disabled_emails = _get_disabled_emails(xray_config)
+    disabled_emails = get_disabled_emails(xray_config)
     remaining_emails = {client_data.to_model().email for client_data in remaining_clients_data}
     _update_disabled_rule(xray_config, disabled_emails & remaining_emails)
 
+    config_applied = is_config_applied()
     save_config(xray_config, xray_config_path)
     removed_names = Text(', ', STYLE_REGULAR).join(
         [Text(name, STYLE_ACCENT_DOWN) for name in removable_names])
     stdout_console.print(Text('Removed clients: ', STYLE_REGULAR).append(removed_names))
+    apply_clients_changes(
+        xray_config,
+        removed_emails=[client_index.get_email(name) for name in removable_names],
+        refresh_backup=config_applied)
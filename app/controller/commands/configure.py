@@ -54,6 +54,7 @@ from app.model.xray import Xray
 from app.utils import (
     detect_current_ipv4,
     gen_xray_private_key,
+    get_reality_password,
     install_geo_data,
     get_xray_github_releases,
     install_xray_distrib,
@@ -111,6 +112,7 @@ def config(
         _update_config(
             xray_config, host, port, reality_host, reality_port, reality_names, name)
 
+    get_reality_password(xray_config)
     save_config(xray_config, XRAY_CONFIG_PATH)
     stdout_console.print(Text('Vless inbound configured', STYLE_REGULAR))
 
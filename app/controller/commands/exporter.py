@@ -0,0 +1,56 @@
+from typing import Annotated
+
+from rich.text import Text
+from typer import Option, Exit
+
+from app.cli import app
+from app.controller.common import check_root, error_handler, print_error, serve_until_stopped
+from app.defaults import (
+    XRAY_API_HOST,
+    XRAY_API_PORT,
+    VEEPEENET_STATS_PATH,
+    VEEPEENET_STATS_JOURNAL_PATH,
+    EXPORTER_LISTEN,
+    EXPORTER_REFRESH_INTERVAL,
+    STYLE_REGULAR,
+    STYLE_ACCENT_NEUTRAL,
+    EXIT_EXPORTER_ERROR,
+    EXIT_EXPORTER_INVALID_LISTEN,
+)
+from app.exporter import MetricsCache, create_metrics_server
+from app.stats_journal import StatsJournal
+from app.xray_api import XrayStatsClient
+
+
+@app.command(help='Serve traffic and service metrics for Prometheus')
+@error_handler(default_message='Error serving metrics', default_code=EXIT_EXPORTER_ERROR)
+def exporter(
+        listen: Annotated[str, Option(help='Address to listen on, HOST:PORT')] = EXPORTER_LISTEN,
+        interval: Annotated[float, Option(
+            help='Metrics refresh interval in seconds', min=1)] = EXPORTER_REFRESH_INTERVAL,
+        _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
+    check_root()
+    host, port = _parse_listen(listen)
+
+    cache = MetricsCache(
+        XrayStatsClient(XRAY_API_HOST, XRAY_API_PORT),
+        StatsJournal(VEEPEENET_STATS_PATH, VEEPEENET_STATS_JOURNAL_PATH),
+        interval=interval)
+    server = create_metrics_server(host, port, cache)
+    cache.start()
+    try:
+        serve_until_stopped(
+            server, 'metrics-server', Text(f'Serving metrics on http://{listen}/metrics', STYLE_REGULAR))
+    finally:
+        cache.stop()
+
+def _parse_listen(listen: str) -> tuple[str, int]:
+    host, _, port = listen.rpartition(':')
+    if not host or not port.isdigit() or not 0 < int(port) < 65536:
+        print_error(Text.assemble(
+            ('Invalid listen address: ', STYLE_REGULAR),
+            (listen, STYLE_ACCENT_NEUTRAL),
+            (' (expected HOST:PORT)', STYLE_REGULAR),
+        ))
+        raise Exit(code=EXIT_EXPORTER_INVALID_LISTEN)
+    return host.strip('[]'), int(port)
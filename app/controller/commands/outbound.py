@@ -18,6 +18,7 @@ from app.controller.common import (
     get_stored_stats,
 )
 from app.controller.completions import complete_outbound_name, complete_vless_outbound_name
+from app.controller.data import StatsData
 from app.defaults import (
     XRAY_CONFIG_PATH,
     VLESS_OUTBOUND_SPIDER_X,
@@ -59,11 +60,14 @@ from app.view import OutboundsView, OutboundView, TrafficStatsView
 @error_handler(default_message='Error retrieving Vless outbounds', default_code=EXIT_OUTBOUND_ERROR)
 def show(
         json: Annotated[bool, Option(help='Show JSON formatted info')] = False,
+        no_stats: Annotated[bool, Option('--no-stats', help='Do not query traffic statistics')] = False,
         _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
     check_xray_config()
     xray_config = load_config(XRAY_CONFIG_PATH)
-    display_stats = get_stored_stats()
-    display_stats += get_runtime_stats()
+    display_stats: VeePeeNetStats | None = None
+    if not no_stats:
+        display_stats = get_stored_stats()
+        display_stats += get_runtime_stats(subject=StatsData.SubjectType.OUTBOUND)
 
     view = get_outbounds_view(xray_config, display_stats)
     print_view(view, json)
@@ -73,9 +77,10 @@ def show(
 def show_default(
         ctx: Context,
         json: Annotated[bool, Option(help='Show JSON formatted info')] = False,
+        no_stats: Annotated[bool, Option('--no-stats', help='Do not query traffic statistics')] = False,
         _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
     if ctx.invoked_subcommand is None:
-        show(json=json, _debug=_debug)
+        show(json=json, no_stats=no_stats, _debug=_debug)
 
 
 def get_outbounds_view(xray_config: Xray, stats: VeePeeNetStats | None = None) -> OutboundsView:
@@ -83,9 +88,12 @@ def get_outbounds_view(xray_config: Xray, stats: VeePeeNetStats | None = None) -
     for i, outbound in enumerate(xray_config.outbounds or []):
         default_name = f'outbound_{i}'
         tag = getattr(outbound, 'tag', None) or default_name
-        outbound_ts = stats.outbound.get(tag) if stats else None
-        outbound_stats = TrafficStatsView(
-            uplink=outbound_ts.uplink, downlink=outbound_ts.downlink) if outbound_ts else TrafficStatsView()
+        outbound_stats: TrafficStatsView | None = None
+        if stats is not None:
+            outbound_ts = stats.outbound.get(tag)
+            outbound_stats = TrafficStatsView(
+                uplink=outbound_ts.uplink,
+                downlink=outbound_ts.downlink) if outbound_ts else TrafficStatsView()
         if isinstance(outbound, VlessOutbound):
             outbound_views.append(OutboundView(
                 name=outbound.tag or default_name,
@@ -5,8 +5,9 @@ from rich.text import Text
 from typer import Option, Argument, Context, Exit
 
 from app.cli import routing
-from app.controller.data import RuleData, ClientData
+from app.controller.data import RuleData, ClientIndex
 from app.controller.common import (
+    apply_routing_changes,
     error_handler,
     load_config,
     check_xray_config,
@@ -79,6 +80,7 @@ def get_routing_view(xray_config: Xray) -> RoutingView:
     if xray_config.routing is None:
         return RoutingView()
     domain_strategy = _get_domain_strategy(xray_config)
+    client_index = ClientIndex.from_inbound(xray_config.get_vless_inbound())
     rules_view: list[RuleView] = []
     if xray_config.routing and xray_config.routing.rules:
         rules = xray_config.routing.rules
@@ -94,7 +96,7 @@ def get_routing_view(xray_config: Xray) -> RoutingView:
             ips=rule_data.ips,
             ports=rule_data.ports,
             protocols=rule_data.protocols, # pyright: ignore[reportArgumentType]
-            users=([ClientData.get_name_by_email(email) for email in rule_data.users]
+            users=([client_index.get_name_by_email(email) for email in rule_data.users]
                    if rule_data.users else None),
             outbound_name=rule_data.outbound_name,
             priority=rule_data.priority
@@ -181,7 +183,7 @@ def add_rule(
         raise Exit(code=EXIT_ROUTING_RULE_EXISTS)
 
     user_rules = [rule for rule in all_rules if _is_user_rule(rule)]
-    client_emails = _resolve_client_emails(xray_config, client)
+    client_emails = _resolve_client_emails(ClientIndex.from_inbound(get_vless_inbound(xray_config)), client)
     if client and client_emails is None:
         raise Exit(code=EXIT_ROUTING_CLIENT_NOT_FOUND)
 
@@ -362,14 +364,15 @@ def change_rule(
         raise Exit(code=EXIT_ROUTING_RULE_NOT_FOUND)
 
     client_emails = None
+    client_index = ClientIndex.from_inbound(get_vless_inbound(xray_config))
     if action == 'put':
-        client_emails = _resolve_client_emails(xray_config, client)
+        client_emails = _resolve_client_emails(client_index, client)
         if client and client_emails is None:
             raise Exit(code=EXIT_ROUTING_CLIENT_NOT_FOUND)
     elif client and rule_to_change.users:
         selected_clients = set(client)
         client_emails = [email for email in rule_to_change.users
-                         if ClientData.get_name_by_email(email) in selected_clients]
+                         if client_index.get_name_by_email(email) in selected_clients]
 
     if action == 'put':
         _add_conditions(
@@ -541,29 +544,23 @@ def _save_rules(xray_config: Xray, rules: list[RuleData] | None = None) -> None:
         get_vless_inbound(xray_config).sniffing.enabled = False
 
     save_config(xray_config, XRAY_CONFIG_PATH)
+    apply_routing_changes(xray_config)
 
 
-def _resolve_client_emails(xray_config: Xray, client_names: list[str] | None) -> list[str] | None:
+def _resolve_client_emails(client_index: ClientIndex, client_names: list[str] | None) -> list[str] | None:
     if not client_names:
         return None
 
-    clients = get_vless_inbound(xray_config).settings.clients or []
-    clients_by_name = {
-        ClientData.get_name_by_email(client.email): client.email
-        for client in clients
-        if client.email
-    }
     emails: list[str] = []
 
     for client_name in client_names:
-        email = clients_by_name.get(client_name)
-        if email is None:
+        if client_name not in client_index:
             print_error(Text.assemble(
                 ('Client ', STYLE_REGULAR),
                 (client_name, STYLE_ACCENT_NEUTRAL),
                 (' not found', STYLE_REGULAR)))
             return None
-        emails.append(email)
+        emails.append(client_index.get_email(client_name))
     return emails
 
 
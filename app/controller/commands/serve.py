@@ -0,0 +1,31 @@
+from pathlib import Path
+from typing import Annotated
+
+from rich.text import Text
+from typer import Option
+
+from app.cli import app
+from app.control_api import ControlState, create_control_server
+from app.controller.common import check_root, check_xray_config, error_handler, serve_until_stopped
+from app.defaults import CONTROL_SOCKET_PATH, CONTROL_STATS_TTL, STYLE_REGULAR, EXIT_SERVE_ERROR
+
+
+@app.command(help='Serve HTTP/JSON control API on Unix socket')
+@error_handler(default_message='Error serving control API', default_code=EXIT_SERVE_ERROR)
+def serve(
+        socket: Annotated[str, Option(help='Unix socket path')] = CONTROL_SOCKET_PATH,
+        stats_ttl: Annotated[float, Option(
+            help='Time in seconds to reuse queried traffic statistics', min=0)] = CONTROL_STATS_TTL,
+        _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
+    check_root()
+    check_xray_config()
+    socket_path = Path(socket)
+
+    state = ControlState(stats_ttl=stats_ttl)
+    state.get('/clients')
+    server = create_control_server(socket_path, state)
+    try:
+        serve_until_stopped(
+            server, 'control-server', Text(f'Serving control API on {socket_path}', STYLE_REGULAR))
+    finally:
+        socket_path.unlink(missing_ok=True)
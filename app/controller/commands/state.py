@@ -19,17 +19,15 @@ from app.controller.common import (
     stdout_console,
     get_runtime_stats,
     get_stored_stats,
+    store_xray_stats,
+    is_config_applied,
 )
 from app.controller.data import StatsData
 from app.controller.commands.routing import get_routing_view
 from app.controller.commands.clients import get_clients_view
 from app.controller.commands.outbound import get_outbounds_view
 from app.defaults import (
-    XRAY_API_HOST,
-    XRAY_API_PORT,
     XRAY_CONFIG_PATH,
-    XRAY_CONFIG_BACKUP_PATH,
-    VEEPEENET_STATS_PATH,
     STYLE_REGULAR,
     EXIT_STATE_ERROR,
     EXIT_STATE_START_FAILED,
@@ -42,11 +40,7 @@ from app.utils import (
     is_xray_service_running,
     is_xray_service_enabled,
     get_xray_service_uptime,
-    is_json_content_same,
-    query_xray_stats,
-    save_stats,
 )
-from app.model.veepeenet import VeePeeNetStats
 from app.view import ServerView, TrafficStatsView
 
 
@@ -63,10 +57,13 @@ def status(json: Annotated[bool, Option(help='Show JSON formatted info')] = Fals
     xray_version = get_xray_distrib_version()
     running = is_xray_service_running()
 
+    inbound_tag = inbound.tag or 'vless-inbound'
     display_stats = get_stored_stats()
-    display_stats += get_runtime_stats()
+    if json:
+        display_stats += get_runtime_stats()
+    else:
+        display_stats += get_runtime_stats(subject=StatsData.SubjectType.INBOUND, name=inbound_tag)
 
-    inbound_tag = inbound.tag or 'vless-inbound'
     inbound_ts = display_stats.inbound.get(inbound_tag)
     inbound_stats_view = TrafficStatsView(
         uplink=inbound_ts.uplink, downlink=inbound_ts.downlink) if inbound_ts else TrafficStatsView()
@@ -82,10 +79,7 @@ def status(json: Annotated[bool, Option(help='Show JSON formatted info')] = Fals
         server_status='running' if running else 'stopped',
         enabled=is_xray_service_enabled(),
         uptime=get_xray_service_uptime() if running else None,
-        restart_required=not is_json_content_same(
-            XRAY_CONFIG_PATH,
-            XRAY_CONFIG_BACKUP_PATH,
-            exclude_top_level_keys={'veepeenet'}),
+        restart_required=not is_config_applied(),
         server_host=xray_config.veepeenet.host,
         server_port=str(inbound.port),
         reality_address=inbound.stream_settings.reality_settings.dest,
@@ -158,16 +152,4 @@ def reset_stats(_debug: Annotated[bool, Option('--debug', hidden=True)] = False)
 def store_stats(_debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
     check_root()
 
-    api_stats = query_xray_stats(XRAY_API_HOST, XRAY_API_PORT, reset=True)
-    if not api_stats:
-        return
-
-    runtime_stats = VeePeeNetStats()
-    for stat in api_stats:
-        stats_data = StatsData.from_api(stat)
-        if stats_data:
-            runtime_stats += stats_data.to_model()
-
-    stored_stats = get_stored_stats()
-    stored_stats += runtime_stats
-    save_stats(stored_stats, VEEPEENET_STATS_PATH)
+    store_xray_stats()
@@ -0,0 +1,243 @@
+from datetime import UTC, datetime
+from heapq import nlargest
+from signal import SIGINT, SIGTERM, signal
+from time import monotonic, sleep, time
+from typing import Annotated, Literal, cast, get_args
+
+from rich.live import Live
+from rich.text import Text
+from typer import Option, Exit
+
+from app.cli import app, stats
+from app.controller.common import (
+    check_root,
+    error_handler,
+    print_error,
+    print_view,
+    stdout_console,
+)
+from app.controller.completions import complete_client_name, complete_outbound_name
+from app.controller.data import StatsAggregator, StatsRateTracker
+from app.defaults import (
+    XRAY_API_HOST,
+    XRAY_API_PORT,
+    VEEPEENET_STATS_PATH,
+    VEEPEENET_STATS_JOURNAL_PATH,
+    VEEPEENET_STATS_HISTORY_PATH,
+    STATS_COLLECTOR_INTERVAL,
+    STATS_COLLECTOR_FLUSH_INTERVAL,
+    STATS_TOP_LIMIT,
+    STATS_TOP_INTERVAL,
+    STYLE_REGULAR,
+    STYLE_ACCENT_NEUTRAL,
+    EXIT_STATS_ERROR,
+    EXIT_STATS_INVALID_DURATION,
+    EXIT_STATS_INVALID_FILTER,
+    EXIT_STATS_API_UNAVAILABLE,
+)
+from app.model.types import StatsResolutionType
+from app.model.veepeenet import TrafficStats
+from app.stats_collector import StatsCollector
+from app.stats_history import HistoryBucket, StatsHistory
+from app.stats_journal import StatsJournal
+from app.utils import parse_duration
+from app.xray_api import XrayStatsClient, get_stats_client
+from app.view import (
+    TrafficBucketView,
+    TrafficHistoryView,
+    TrafficRatesView,
+    TrafficRateView,
+    TrafficStatsView,
+    TrafficTopItemView,
+    TrafficTopView,
+)
+
+
+@stats.command(help='Show traffic history in time buckets')
+@error_handler(default_message='Error retrieving traffic history', default_code=EXIT_STATS_ERROR)
+def history(
+        client: Annotated[str | None, Option(
+            help='Show traffic of this client', autocompletion=complete_client_name)] = None,
+        outbound: Annotated[str | None, Option(
+            help='Show traffic of this outbound', autocompletion=complete_outbound_name)] = None,
+        since: Annotated[str, Option(help='Time window, e.g. 30m, 24h, 7d')] = '24h',
+        resolution: Annotated[str | None, Option(
+            help=f'Bucket size: {", ".join(get_args(StatsResolutionType))} (chosen by window by default)',
+        )] = None,
+        json: Annotated[bool, Option(help='Show JSON formatted info')] = False,
+        _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
+    if client and outbound:
+        print_error(Text('Options --client and --outbound are mutually exclusive', STYLE_REGULAR))
+        raise Exit(code=EXIT_STATS_INVALID_FILTER)
+    if resolution is not None and resolution not in get_args(StatsResolutionType):
+        print_error(Text.assemble(
+            ('Invalid resolution: ', STYLE_REGULAR),
+            (resolution, STYLE_ACCENT_NEUTRAL),
+        ))
+        raise Exit(code=EXIT_STATS_INVALID_FILTER)
+    bucket_resolution = cast(StatsResolutionType | None, resolution)
+
+    now = time()
+    since_time = now - _parse_window(since)
+    subject: Literal['client', 'inbound', 'outbound'] = 'inbound'
+    name: str | None = None
+    if client:
+        subject, name = 'client', client
+    elif outbound:
+        subject, name = 'outbound', outbound
+
+    stats_history = StatsHistory(VEEPEENET_STATS_HISTORY_PATH)
+    total, bucket_views = _get_bucket_views(
+        stats_history.query(since_time, now, bucket_resolution, subject, name), subject)
+    view = TrafficHistoryView(
+        subject=subject,
+        name=name,
+        since=datetime.fromtimestamp(since_time, UTC),
+        resolution=stats_history.get_resolution(since_time, now, bucket_resolution),
+        total=total,
+        buckets=bucket_views)
+    print_view(view, json)
+
+
+@stats.command(help='Show clients or outbounds with the most traffic over a time window')
+@error_handler(default_message='Error showing top traffic', default_code=EXIT_STATS_ERROR)
+def top(
+        window: Annotated[str, Option(help='Time window, e.g. 30m, 1h, 7d')] = '1h',
+        outbounds: Annotated[bool, Option('--outbounds', help='Show outbounds instead of clients')] = False,
+        limit: Annotated[int, Option(help='Number of entries to show', min=1)] = STATS_TOP_LIMIT,
+        json: Annotated[bool, Option(help='Show JSON formatted info')] = False,
+        _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
+    now = time()
+    subject: Literal['client', 'outbound'] = 'outbound' if outbounds else 'client'
+    total = StatsHistory(VEEPEENET_STATS_HISTORY_PATH).total(now - _parse_window(window), now, subject)
+
+    ranked = sorted(
+        getattr(total, subject).items(),
+        key=lambda item: (-(item[1].uplink + item[1].downlink), item[0]))[:limit]
+    view = TrafficTopView(
+        subject=subject,
+        window=window,
+        items=[TrafficTopItemView(name=name, stats=TrafficStatsView(uplink=ts.uplink, downlink=ts.downlink))
+               for name, ts in ranked])
+    print_view(view, json)
+
+
+@app.command('stats-collector', help='Collect traffic statistics from Xray API until stopped')
+@error_handler(default_message='Error collecting traffic statistics', default_code=EXIT_STATS_ERROR)
+def stats_collector(
+        interval: Annotated[float, Option(
+            help='Xray API polling interval in seconds', min=1)] = STATS_COLLECTOR_INTERVAL,
+        flush_interval: Annotated[float, Option(
+            help='Interval in seconds between writes to the stats history',
+            min=1)] = STATS_COLLECTOR_FLUSH_INTERVAL,
+        _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
+    check_root()
+
+    flush_interval = max(flush_interval, interval)
+    collector = StatsCollector(
+        XrayStatsClient(XRAY_API_HOST, XRAY_API_PORT),
+        StatsJournal(VEEPEENET_STATS_PATH, VEEPEENET_STATS_JOURNAL_PATH),
+        StatsHistory(VEEPEENET_STATS_HISTORY_PATH),
+        interval=interval,
+        flush_interval=flush_interval)
+    for signal_number in (SIGTERM, SIGINT):
+        signal(signal_number, lambda *_: collector.stop())
+
+    stdout_console.print(Text(
+        f'Collecting traffic statistics every {interval:g}s, flushing every {flush_interval:g}s',
+        STYLE_REGULAR))
+    collector.run()
+
+
+@app.command('top', help='Show clients and outbounds with the highest current traffic rate')
+@error_handler(default_message='Error showing traffic rates', default_code=EXIT_STATS_ERROR)
+def live_top(
+        interval: Annotated[float, Option(help='Sampling interval in seconds', min=0.5)] = STATS_TOP_INTERVAL,
+        limit: Annotated[int, Option(help='Number of entries to show', min=1)] = STATS_TOP_LIMIT,
+        count: Annotated[int, Option(help='Number of refreshes (0 to run until interrupted)', min=0)] = 0,
+        json: Annotated[bool, Option(help='Show one JSON formatted sample and exit')] = False,
+        _debug: Annotated[bool, Option('--debug', hidden=True)] = False) -> None:
+    client = get_stats_client(XRAY_API_HOST, XRAY_API_PORT)
+    journal = StatsJournal(VEEPEENET_STATS_PATH, VEEPEENET_STATS_JOURNAL_PATH)
+    tracker = StatsRateTracker()
+    tracker.update(_query_totals(client, journal), monotonic())
+
+    if json:
+        sleep(interval)
+        tracker.update(_query_totals(client, journal), monotonic())
+        print_view(_get_rates_view(tracker, interval, limit), json)
+        return
+
+    try:
+        with Live(_get_rates_view(tracker, interval, limit).rich_repr(),
+                  console=stdout_console, auto_refresh=False) as live:
+            refreshes = 0
+            while not count or refreshes < count:
+                sleep(interval)
+                tracker.update(_query_totals(client, journal), monotonic())
+                live.update(_get_rates_view(tracker, interval, limit).rich_repr(), refresh=True)
+                refreshes += 1
+    except KeyboardInterrupt:
+        pass
+
+
+def _get_bucket_views(
+        buckets: list[HistoryBucket], subject: str) -> tuple[TrafficStatsView, list[TrafficBucketView]]:
+    total = TrafficStats()
+    bucket_views: list[TrafficBucketView] = []
+    for bucket in buckets:
+        bucket_ts = TrafficStats()
+        for traffic in getattr(bucket.stats, subject).values():
+            bucket_ts += traffic
+        total += bucket_ts
+        bucket_views.append(TrafficBucketView(
+            start=datetime.fromtimestamp(bucket.start, UTC),
+            stats=TrafficStatsView(uplink=bucket_ts.uplink, downlink=bucket_ts.downlink)))
+    return TrafficStatsView(uplink=total.uplink, downlink=total.downlink), bucket_views
+
+
+def _query_totals(client: XrayStatsClient, journal: StatsJournal) -> StatsAggregator:
+    # The stats collector reads the counters with reset, so rates are taken from the stored totals plus
+    # the runtime counters. If the collector moved the counters into the journal between the two reads, retry
+    stored = journal.read_cached()
+    while True:
+        totals = StatsAggregator()
+        for stats_name, value in _query_counters(client):
+            totals.add(stats_name, value)
+        current = journal.read_cached()
+        if current is stored:
+            return totals.add_stats(stored)
+        stored = current
+
+
+def _query_counters(client: XrayStatsClient) -> list[tuple[str, int]]:
+    try:
+        return client.query_counters()
+    except RuntimeError as e:
+        print_error(Text(f'Xray API is not available: {e}', STYLE_REGULAR))
+        raise Exit(code=EXIT_STATS_API_UNAVAILABLE) from e
+
+
+def _get_rates_view(tracker: StatsRateTracker, interval: float, limit: int) -> TrafficRatesView:
+    return TrafficRatesView(
+        interval=interval,
+        clients=_get_top_rates(tracker.client, limit),
+        outbounds=_get_top_rates(tracker.outbound, limit))
+
+
+def _get_top_rates(rates: dict[str, list[float]], limit: int) -> list[TrafficRateView]:
+    top_rates = nlargest(limit, rates.items(), key=lambda item: item[1][0] + item[1][1])
+    return [TrafficRateView(name=name, uplink=uplink, downlink=downlink)
+            for name, (uplink, downlink) in top_rates if uplink or downlink]
+
+
+def _parse_window(value: str) -> int:
+    try:
+        return parse_duration(value)
+    except ValueError as e:
+        print_error(Text.assemble(
+            ('Invalid time window: ', STYLE_REGULAR),
+            (value, STYLE_ACCENT_NEUTRAL),
+            (' (expected e.g. 30m, 24h, 7d)', STYLE_REGULAR),
+        ))
+        raise Exit(code=EXIT_STATS_INVALID_DURATION) from e
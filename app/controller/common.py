@@ -1,8 +1,14 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
 from functools import wraps
+from json import loads as json_loads
 from os import getuid
 from pathlib import Path
+from signal import SIGINT, SIGTERM, signal
+from socketserver import BaseServer
+from threading import Event, Thread
 from time import sleep
-from typing import Callable, Any, Literal
+from typing import Callable, Any, Iterator, Literal
 from urllib.parse import urljoin
 
 from rich.console import Console
@@ -10,6 +16,7 @@ from rich.panel import Panel
 from rich.text import Text
 from typer import Exit
 
+from app.completion_index import CompletionIndex, write_completion_index
 from app.defaults import (
     XRAY_BINARY_PATH,
     XRAY_SERVICE_UNIT_PATH,
@@ -20,18 +27,28 @@ from app.defaults import (
     XRAY_CONFIG_BACKUP_PATH,
     XRAY_API_HOST,
     XRAY_API_PORT,
+    XRAY_GEO_IP_DATA_PATH,
+    XRAY_GEO_SITE_DATA_PATH,
     VEEPEENET_STATS_PATH,
+    VEEPEENET_STATS_JOURNAL_PATH,
+    VEEPEENET_STATS_HISTORY_PATH,
     STATE_PENDING_TIMEOUT,
+    DISABLED_CLIENTS_RULE_NAME,
+    DISABLED_CLIENTS_RULE_PRIORITY,
     STYLE_REGULAR,
     STYLE_VALUE,
     STYLE_WARN,
     STYLE_OK,
+    STYLE_ACCENT_NEUTRAL,
     EXIT_NOT_ROOT,
     EXIT_NO_CONFIG,
 )
 from app.model.veepeenet import VeePeeNetStats
-from app.model.vless_inbound import VlessInbound
+from app.model.vless_inbound import Client, VlessInbound
 from app.model.xray import Xray
+from app.preflight import get_config_problems
+from app.stats_history import StatsHistory
+from app.stats_journal import StatsJournal
 from app.utils import (
     detect_veepeenet_versions,
     get_xray_distrib_version,
@@ -39,6 +56,7 @@ from app.utils import (
     stop_xray_service,
     install_xray_distrib,
     write_text_file,
+    write_bytes_file_atomic,
     is_xray_service_installed,
     install_xray_service,
     is_xray_service_enabled,
@@ -48,19 +66,39 @@ from app.utils import (
     restart_xray_service,
     reset_failed_xray_service,
     validate_xray_config,
+    get_config_test_key,
+    is_config_tested,
+    save_config_tested,
     backup_config,
     restore_config,
     get_xray_service_journal,
     query_xray_stats,
     reset_xray_stats,
-    load_stats,
-    save_stats,
+    is_config_digest_same,
+    save_config_digest,
+    add_xray_inbound_users,
+    remove_xray_inbound_users,
+    replace_xray_routing_rules,
+    load_json_cache,
+    save_json_cache,
+    gc_paused,
 )
-from app.controller.data import StatsData
+from app.controller.data import ClientIndex, RuleData, StatsAggregator, StatsData
 
 stdout_console = Console()
 stderr_console = Console(stderr=True)
 
+
+@dataclass
+class _BatchState:
+    config: Xray | None = None
+
+
+# While a batch is open, commands share one in-memory model of the managed config:
+# load_config returns it, save_config and live apply are deferred until the batch is committed
+_batch = _BatchState()
+
+
 def print_error(message: str | Text) -> None:
     stderr_console.print(
         Panel(message, title='Error', title_align='left', border_style='red')
@@ -144,15 +182,69 @@ def check_xray_config(xray_config_path: Path = XRAY_CONFIG_PATH) -> None:
 
 
 def load_config(xray_config_path: Path) -> Xray:
-    config_content = xray_config_path.read_text('utf-8')
-    return Xray.model_validate_json(config_content, by_alias=True)
+    if _batch.config is not None and xray_config_path == XRAY_CONFIG_PATH:
+        return _batch.config
+    config_content = xray_config_path.read_bytes()
+    cache_path = get_config_cache_path(xray_config_path)
+    cached = load_json_cache(cache_path, config_content) if cache_path else None
+    if isinstance(cached, tuple) and len(cached) == 2:
+        saved, config_data = cached
+        with gc_paused():
+            config = Xray.model_validate(config_data, by_alias=True)
+        if saved:
+            # The file was written by save_config, saving the same model again would not change it
+            config.mark_clean(xray_config_path)
+        return config
+
+    try:
+        config_data = json_loads(config_content)
+    except ValueError:
+        return Xray.model_validate_json(config_content, by_alias=True)
+    if cache_path:
+        save_json_cache(cache_path, config_content, (False, config_data))
+    with gc_paused():
+        config = Xray.model_validate(config_data, by_alias=True)
+    if cache_path:
+        write_completion_index(xray_config_path, config_content, get_completion_index(config))
+    return config
 
 
 def save_config(config: Xray, xray_config_path: Path) -> None:
-    write_text_file(
-        xray_config_path,
-        config.model_dump_json(by_alias=True, exclude_none=True, indent=2),
-        0o644)
+    if config is _batch.config or not config.is_dirty(xray_config_path):
+        return
+    config_text = config.model_dump_json(by_alias=True, exclude_none=True, indent=2)
+    write_text_file(xray_config_path, config_text, 0o644)
+    config.mark_clean(xray_config_path)
+    config_content = config_text.encode('utf-8')
+    cache_path = get_config_cache_path(xray_config_path)
+    if cache_path:
+        config_data = json_loads(config_text)
+        save_json_cache(cache_path, config_content, (True, config_data))
+        save_config_digest(xray_config_path, config_content, config_data)
+        write_completion_index(xray_config_path, config_content, get_completion_index(config))
+
+
+def get_completion_index(config: Xray) -> CompletionIndex:
+    rules = config.routing.rules if config.routing and config.routing.rules else []
+    outbounds: list[tuple[str, str | None]] = []
+    for outbound in config.outbounds or []:
+        if isinstance(outbound, dict):
+            tag, protocol = outbound.get('tag'), outbound.get('protocol')
+        else:
+            tag, protocol = outbound.tag, outbound.protocol
+        if tag:
+            outbounds.append((str(tag), str(protocol) if protocol else None))
+    return CompletionIndex(
+        clients=ClientIndex.from_inbound(config.get_vless_inbound()).names,
+        rules=[RuleData.from_model(rule, number).name for number, rule in enumerate(rules)],
+        outbounds=outbounds)
+
+
+def get_config_cache_path(xray_config_path: Path) -> Path | None:
+    # Only the managed config has sidecar files, backups and other configs are parsed on every load
+    if xray_config_path != XRAY_CONFIG_PATH:
+        return None
+    return xray_config_path.with_name(f'.{xray_config_path.name}.cache')
 
 
 def get_vless_inbound(xray_config: Xray) -> VlessInbound:
@@ -162,6 +254,106 @@ def get_vless_inbound(xray_config: Xray) -> VlessInbound:
     raise ValueError('Vless inbound not found in config')
 
 
+def get_disabled_emails(xray_config: Xray) -> set[str]:
+    rules = xray_config.routing.rules if xray_config.routing and xray_config.routing.rules else []
+    for index, rule in enumerate(rules):
+        rule_data = RuleData.from_model(rule, index)
+        if (rule_data.name == DISABLED_CLIENTS_RULE_NAME
+                and rule_data.priority == DISABLED_CLIENTS_RULE_PRIORITY):
+            return set(rule_data.users or [])
+    return set()
+
+
+def is_config_applied() -> bool:
+    return is_config_digest_same(XRAY_CONFIG_PATH, XRAY_CONFIG_BACKUP_PATH)
+
+
+def print_restart_required(reason: str = 'Changes could not be applied to running service') -> None:
+    stdout_console.print(Text.assemble(
+        (f'{reason}, ', STYLE_WARN),
+        ('restart required', STYLE_ACCENT_NEUTRAL)))
+
+
+def apply_clients_changes(
+        xray_config: Xray,
+        added_clients: list[Client] | None = None,
+        removed_emails: list[str] | None = None,
+        refresh_backup: bool = False) -> bool:
+    if _batch.config is not None or not is_xray_service_running():
+        return False
+
+    inbound = get_vless_inbound(xray_config)
+    if not _is_short_ids_applied(_load_applied_config(), xray_config):
+        print_restart_required('Xray loads short ids of new clients only on start')
+        return False
+    with stdout_console.status(Text('Applying changes to running service', STYLE_REGULAR)):
+        applied = (
+            remove_xray_inbound_users(
+                XRAY_API_HOST, XRAY_API_PORT, inbound.tag or 'vless-inbound', removed_emails or [])
+            and add_xray_inbound_users(XRAY_API_HOST, XRAY_API_PORT, inbound, added_clients or []))
+    if not applied:
+        print_restart_required()
+        return False
+
+    if refresh_backup:
+        backup_config(XRAY_CONFIG_PATH, XRAY_CONFIG_BACKUP_PATH)
+    stdout_console.print(Text('Changes applied to running service', STYLE_OK))
+    return True
+
+
+def apply_routing_changes(xray_config: Xray) -> bool:
+    if _batch.config is not None or not is_xray_service_running():
+        return False
+    if not _is_applied_except_rules(xray_config):
+        print_restart_required()
+        return False
+
+    rules = xray_config.routing.rules if xray_config.routing and xray_config.routing.rules else []
+    with stdout_console.status(Text('Applying routing to running service', STYLE_REGULAR)):
+        applied = replace_xray_routing_rules(XRAY_API_HOST, XRAY_API_PORT, rules)
+    if not applied:
+        print_restart_required()
+        return False
+
+    backup_config(XRAY_CONFIG_PATH, XRAY_CONFIG_BACKUP_PATH)
+    stdout_console.print(Text('Routing applied to running service', STYLE_OK))
+    return True
+
+
+def apply_config_changes(xray_config: Xray) -> None:
+    if not is_xray_service_running() or is_config_applied():
+        return
+    if not _apply_live_changes(xray_config):
+        restart_service(test_config=False)
+
+
+@contextmanager
+def open_batch(xray_config: Xray | None = None) -> Iterator[Xray]:
+    batch_config = xray_config or load_config(XRAY_CONFIG_PATH)
+    # Only changes made by the batch operations have to be committed
+    batch_config.mark_clean(XRAY_CONFIG_PATH)
+    _batch.config = batch_config
+    try:
+        yield batch_config
+    finally:
+        _batch.config = None
+
+
+def commit_batch(xray_config: Xray) -> bool:
+    if not xray_config.is_dirty(XRAY_CONFIG_PATH):
+        return False
+    original_content = XRAY_CONFIG_PATH.read_bytes()
+    save_config(xray_config, XRAY_CONFIG_PATH)
+    try:
+        _test_config_or_fail()
+    except RuntimeError:
+        write_bytes_file_atomic(XRAY_CONFIG_PATH, original_content, 0o644)
+        stderr_console.print(Text('Configuration restored to its state before the batch', STYLE_WARN))
+        raise
+    apply_config_changes(xray_config)
+    return True
+
+
 def start_service() -> None:
     if is_xray_service_running():
         stdout_console.print(Text.assemble(
@@ -201,8 +393,9 @@ def stop_service() -> None:
     stdout_console.print(Text('Service stopped', STYLE_WARN))
 
 
-def restart_service() -> None:
-    _test_config_or_fail()
+def restart_service(test_config: bool = True) -> None:
+    if test_config:
+        _test_config_or_fail()
     was_running = is_xray_service_running()
     _store_runtime_stats()
 
@@ -219,23 +412,45 @@ def restart_service() -> None:
         _handle_service_failure('restart', was_running)
 
 
-def get_runtime_stats(reset: bool = False) -> VeePeeNetStats:
-    veepeenet_stats = VeePeeNetStats()
-
+def get_runtime_stats(
+        reset: bool = False,
+        subject: StatsData.SubjectType | None = None,
+        name: str | None = None) -> VeePeeNetStats:
     if not is_xray_service_running():
-        return veepeenet_stats
-
-    stats = query_xray_stats(XRAY_API_HOST, XRAY_API_PORT, reset=reset)
-    for stat in stats:
-        stats_data = StatsData.from_api(stat)
-        if stats_data:
-            veepeenet_stats += stats_data.to_model()
+        return VeePeeNetStats()
 
-    return veepeenet_stats
+    stats = query_xray_stats(
+        XRAY_API_HOST, XRAY_API_PORT, reset=reset, pattern=StatsData.get_pattern(subject, name))
+    return StatsAggregator(subject_filter=subject, name_filter=name).update(stats).to_model()
 
 
 def get_stored_stats() -> VeePeeNetStats:
-    return load_stats(VEEPEENET_STATS_PATH)
+    return StatsJournal(VEEPEENET_STATS_PATH, VEEPEENET_STATS_JOURNAL_PATH).read()
+
+
+def store_xray_stats() -> None:
+    # The counters are stored before they are reset, so a failure in between keeps the stored part, and the
+    # reset query only stores the traffic that arrived since. Everything runs under the journal lock, which
+    # the stats collector also holds while it resets and journals the counters, so they are not counted twice
+    deltas: list[VeePeeNetStats] = []
+    try:
+        with StatsJournal(VEEPEENET_STATS_PATH, VEEPEENET_STATS_JOURNAL_PATH) as journal, journal.lock():
+            snapshot = query_xray_stats(XRAY_API_HOST, XRAY_API_PORT)
+            deltas.append(StatsAggregator().update(snapshot).to_model())
+            journal.append(deltas[-1])
+
+            stored = dict(snapshot)
+            remainder = StatsAggregator()
+            for stats_name, value in query_xray_stats(XRAY_API_HOST, XRAY_API_PORT, reset=True):
+                last = stored.get(stats_name, 0)
+                # A lower value means Xray was restarted in between and the counter started over
+                remainder.add(stats_name, value - last if value >= last else value)
+            deltas.append(remainder.to_model())
+            journal.append(deltas[-1])
+    finally:
+        history = StatsHistory(VEEPEENET_STATS_HISTORY_PATH)
+        for delta in deltas:
+            history.record(delta)
 
 
 def clear_stats() -> None:
@@ -244,7 +459,7 @@ def clear_stats() -> None:
     if running and not reset_xray_stats(XRAY_API_HOST, XRAY_API_PORT):
         raise RuntimeError('Failed to reset Xray API stats')
 
-    save_stats(VeePeeNetStats(), VEEPEENET_STATS_PATH)
+    StatsJournal(VEEPEENET_STATS_PATH, VEEPEENET_STATS_JOURNAL_PATH).reset()
 
     if running:
         stdout_console.print(Text('Traffic statistics reset in stats file and Xray API', STYLE_OK))
@@ -252,23 +467,56 @@ def clear_stats() -> None:
         stdout_console.print(Text('Traffic statistics reset in stats file', STYLE_OK))
 
 
+def serve_until_stopped(server: BaseServer, thread_name: str, message: Text) -> None:
+    stopped = Event()
+    for signal_number in (SIGTERM, SIGINT):
+        signal(signal_number, lambda *_: stopped.set())
+
+    Thread(target=server.serve_forever, name=thread_name, daemon=True).start()
+    stdout_console.print(message)
+    try:
+        stopped.wait()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
 def _store_runtime_stats() -> None:
     if not is_xray_service_running():
         return
 
-    runtime_stats = get_runtime_stats(reset=True)
-    stored_stats = get_stored_stats()
-    stored_stats += runtime_stats
+    store_xray_stats()
 
-    save_stats(stored_stats, VEEPEENET_STATS_PATH)
 
 def _test_config_or_fail() -> None:
+    # Xray loads the geodata while testing, so the result also depends on the binary and geodata files
+    test_key = get_config_test_key(
+        XRAY_CONFIG_PATH, (XRAY_BINARY_PATH, XRAY_GEO_IP_DATA_PATH, XRAY_GEO_SITE_DATA_PATH))
+    if test_key is not None and is_config_tested(XRAY_CONFIG_PATH, test_key):
+        return
+    _check_config_or_fail()
     success, output = validate_xray_config(XRAY_CONFIG_PATH)
     if not success:
         print_error(Text.assemble(
             ('Xray config test failed:\n', STYLE_REGULAR),
             (output, 'dim')))
         raise RuntimeError(f'Xray config test failed: {output}')
+    if test_key is not None:
+        save_config_tested(XRAY_CONFIG_PATH, test_key)
+
+
+def _check_config_or_fail() -> None:
+    try:
+        xray_config = load_config(XRAY_CONFIG_PATH)
+    except ValueError:
+        # A config the model cannot read is left to the Xray test
+        return
+    problems = get_config_problems(xray_config, XRAY_GEO_IP_DATA_PATH, XRAY_GEO_SITE_DATA_PATH)
+    if problems:
+        print_error(Text.assemble(
+            ('Xray config preflight check failed:\n', STYLE_REGULAR),
+            ('\n'.join(f'- {problem}' for problem in problems), 'dim')))
+        raise RuntimeError(f'Xray config preflight check failed: {"; ".join(problems)}')
 
 def _handle_service_failure(action: Literal['start', 'restart'], was_running: bool) -> None:
     journal = get_xray_service_journal()
@@ -298,6 +546,94 @@ def _handle_service_failure(action: Literal['start', 'restart'], was_running: bo
         stderr_console.print(Text('No backup available to restore', STYLE_WARN))
     raise RuntimeError(f'Failed to {action} service')
 
+def _load_applied_config() -> Xray | None:
+    if not XRAY_CONFIG_BACKUP_PATH.exists():
+        return None
+    try:
+        return load_config(XRAY_CONFIG_BACKUP_PATH)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_applied_except_rules(xray_config: Xray) -> bool:
+    applied_config = _load_applied_config()
+    if applied_config is None:
+        return False
+    return _dump_without_rules(applied_config) == _dump_without_rules(xray_config)
+
+
+def _apply_live_changes(xray_config: Xray) -> bool:
+    applied_config = _load_applied_config()
+    if (applied_config is None
+            or _dump_without_live_changes(applied_config) != _dump_without_live_changes(xray_config)
+            or not _is_short_ids_applied(applied_config, xray_config)):
+        return False
+
+    applied_clients = _get_clients_by_email(applied_config)
+    clients = _get_clients_by_email(xray_config)
+    removed_emails = [email for email, client in applied_clients.items() if clients.get(email) != client]
+    added_clients = [client for email, client in clients.items() if applied_clients.get(email) != client]
+    applied_rules = (applied_config.routing.rules
+                     if applied_config.routing and applied_config.routing.rules else [])
+    rules = xray_config.routing.rules if xray_config.routing and xray_config.routing.rules else []
+
+    inbound = get_vless_inbound(xray_config)
+    with stdout_console.status(Text('Applying changes to running service', STYLE_REGULAR)):
+        applied = (
+            remove_xray_inbound_users(
+                XRAY_API_HOST, XRAY_API_PORT, inbound.tag or 'vless-inbound', removed_emails)
+            and add_xray_inbound_users(XRAY_API_HOST, XRAY_API_PORT, inbound, added_clients)
+            and (rules == applied_rules or replace_xray_routing_rules(XRAY_API_HOST, XRAY_API_PORT, rules)))
+    if not applied:
+        return False
+
+    backup_config(XRAY_CONFIG_PATH, XRAY_CONFIG_BACKUP_PATH)
+    stdout_console.print(Text('Changes applied to running service', STYLE_OK))
+    return True
+
+
+def _is_short_ids_applied(applied_config: Xray | None, xray_config: Xray) -> bool:
+    # Xray reads Reality short ids only on start and HandlerService can not update them. A short id left
+    # from a removed client does no harm, only new short ids need a restart
+    applied_short_ids = _get_short_ids(applied_config)
+    short_ids = _get_short_ids(xray_config)
+    return applied_short_ids is not None and short_ids is not None and short_ids <= applied_short_ids
+
+
+def _get_short_ids(xray_config: Xray | None) -> set[str] | None:
+    inbound = xray_config and xray_config.get_vless_inbound()
+    if not inbound:
+        return None
+    return set(inbound.stream_settings.reality_settings.short_ids)
+
+
+def _get_clients_by_email(xray_config: Xray) -> dict[str, Client]:
+    inbound = xray_config.get_vless_inbound()
+    if not inbound:
+        return {}
+    return {client.email or '': client for client in inbound.settings.clients or []}
+
+
+def _dump_without_live_changes(xray_config: Xray) -> dict[str, Any]:
+    content = _dump_without_rules(xray_config)
+    for inbound in content.get('inbounds') or []:
+        if isinstance(inbound, dict) and inbound.get('protocol') == 'vless':
+            # Short ids are checked separately by _is_short_ids_applied
+            inbound.get('settings', {}).pop('clients', None)
+            inbound.get('streamSettings', {}).get('realitySettings', {}).pop('shortIds', None)
+    return content
+
+
+def _dump_without_rules(xray_config: Xray) -> dict[str, Any]:
+    content = xray_config.model_dump(by_alias=True, exclude_none=True, exclude={'veepeenet'})
+    routing = content.get('routing')
+    if isinstance(routing, dict):
+        routing.pop('rules', None)
+        if not routing:
+            del content['routing']
+    return content
+
+
 def _update_config() -> None:
     config = load_config(XRAY_CONFIG_PATH)
     save_config(config, XRAY_CONFIG_PATH)
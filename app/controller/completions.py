@@ -1,70 +1,109 @@
 from contextlib import suppress
-from typing import Iterator, Any
+from typing import Any, Callable, Iterator, get_args
 
+from click import Choice, Command, INT, Parameter
 from typer import Context
+from typer.core import TyperArgument, TyperOption
 
-from app.controller.common import load_config
-from app.controller.data import ClientData, RuleData
+from app.completion_index import CompletionIndex, read_completion_index
 from app.defaults import XRAY_CONFIG_PATH
-from app.model.xray import Outbound
+from app.model.types import FingerprintType
 
 
 def complete_client_name(_ctx: Context, _args: list[str], incomplete: str) -> Iterator[str]:
     with suppress(BaseException):
-        config = load_config(XRAY_CONFIG_PATH)
-        vless_inbound = config.get_vless_inbound()
-        clients = vless_inbound.settings.clients if vless_inbound else []
-        clients_names = (ClientData.from_model(client, i).name
-                         for i, client in enumerate(clients or []))
-        for name in clients_names:
+        for name in _get_completion_index().clients:
             if name.startswith(incomplete):
                 yield name
 
 
 def complete_route_name(_ctx: Context, _args: list[str], incomplete: str) -> Iterator[str]:
     with suppress(BaseException):
-        config = load_config(XRAY_CONFIG_PATH)
-        rules = config.routing.rules if config.routing and config.routing.rules else []
-        rules_names = (RuleData.from_model(rule, i).name for i, rule in enumerate(rules))
-        for name in rules_names:
+        for name in _get_completion_index().rules:
             if name.startswith(incomplete):
                 yield name
 
 
 def complete_outbound_name(_ctx: Context, _args: list[str], incomplete: str) -> Iterator[str]:
     with suppress(BaseException):
-        for outbound in _get_outbounds(incomplete):
-            if isinstance(outbound, dict):
-                tag = outbound.get('tag')
-                if not tag:
-                    continue
-                yield str(tag)
-            else:
-                tag: str | None = outbound.tag
-                if not tag:
-                    continue
+        for tag, _ in _get_completion_index().outbounds:
+            if tag.startswith(incomplete):
                 yield tag
 
+
 def complete_vless_outbound_name(_ctx: Context, _args: list[str], incomplete: str) -> Iterator[str]:
     with suppress(BaseException):
-        for outbound in _get_outbounds(incomplete):
-            if isinstance(outbound, dict):
-                tag = outbound.get('tag')
-                protocol = outbound.get('protocol')
-            else:
-                tag = outbound.tag
-                protocol = outbound.protocol
-            if protocol == 'vless' and tag:
-                yield str(tag)
-
-
-def _get_outbounds(incomplete: str) -> Iterator[Outbound | dict[str, Any]]:
-    config = load_config(XRAY_CONFIG_PATH)
-    outbounds = config.outbounds or []
-    for outbound in outbounds:
-        if isinstance(outbound, dict):
-            tag = outbound.get('tag', '')
-        else:
-            tag = outbound.tag or ''
-        if tag.startswith(incomplete):
-            yield outbound
+        for tag, protocol in _get_completion_index().outbounds:
+            if protocol == 'vless' and tag.startswith(incomplete):
+                yield tag
+
+
+def get_completion_commands(group_name: str) -> dict[str, Command]:
+    # Light copies of the commands which complete names, TAB uses them instead of the command modules.
+    # They declare the same parameters as the real commands, tests/test_cli.py keeps them in sync
+    return _COMPLETION_COMMANDS.get(group_name, {})
+
+
+def _get_completion_index() -> CompletionIndex:
+    index = read_completion_index(XRAY_CONFIG_PATH)
+    if index is not None:
+        return index
+    # The index is missing or outdated (e.g. config.json was edited by hand), parse the config instead
+    from app.controller.common import get_completion_index, load_config  # pylint: disable=import-outside-toplevel
+    return get_completion_index(load_config(XRAY_CONFIG_PATH))
+
+
+def _argument(name: str, autocompletion: Callable[..., Any] | None = None, nargs: int = 1,
+              choices: tuple[str, ...] = ()) -> Parameter:
+    return TyperArgument(param_decls=[name], nargs=nargs, type=Choice(choices) if choices else None,
+                         autocompletion=autocompletion)
+
+
+def _option(*param_decls: str, autocompletion: Callable[..., Any] | None = None, **attrs: Any) -> Parameter:
+    return TyperOption(param_decls=list(param_decls), autocompletion=autocompletion, **attrs)
+
+
+def _command(name: str, *params: Parameter) -> tuple[str, Command]:
+    return name, Command(name, params=[*params, _option('--debug', '_debug', is_flag=True, hidden=True)])
+
+
+def _get_rule_condition_options() -> list[Parameter]:
+    return [_option('--domain', multiple=True), _option('--ip', multiple=True), _option('--ports'),
+            _option('--protocol', multiple=True),
+            _option('--client', autocompletion=complete_client_name, multiple=True)]
+
+
+_COMPLETION_COMMANDS: dict[str, dict[str, Command]] = {
+    'clients': dict([
+        _command('remove', _argument('client_names', complete_client_name, nargs=-1), _option('--from-file')),
+        _command('list', _argument('client_names', complete_client_name, nargs=-1),
+                 _option('--json/--no-json', is_flag=True), _option('--no-stats', is_flag=True)),
+        _command('disable', _argument('client_names', complete_client_name, nargs=-1)),
+        _command('enable', _argument('client_names', complete_client_name, nargs=-1)),
+    ]),
+    'routing': dict([
+        _command('add-rule', _argument('name'), _option('--outbound', autocompletion=complete_outbound_name),
+                 *_get_rule_condition_options(), _option('--priority', type=INT)),
+        _command('remove-rule', _argument('name', complete_route_name)),
+        _command('rename-rule', _argument('name', complete_route_name), _option('--new-name')),
+        _command('set-priority', _argument('name', complete_route_name), _option('--priority', type=INT)),
+        _command('change-rule', _argument('name', complete_route_name),
+                 _argument('action', choices=('put', 'del')), *_get_rule_condition_options()),
+        _command('change-outbound', _argument('name', complete_route_name),
+                 _option('--outbound', autocompletion=complete_outbound_name)),
+    ]),
+    'outbounds': dict([
+        _command('remove', _argument('name', complete_vless_outbound_name)),
+        _command('set-default', _argument('name', complete_outbound_name)),
+        _command('change', _argument('name', complete_vless_outbound_name),
+                 *(_option(name) for name in ('--address', '--uuid', '--sni', '--password', '--short-id',
+                                              '--spider-x')),
+                 _option('--port', type=INT), _option('--fingerprint', type=Choice(get_args(FingerprintType))),
+                 _option('--interface'), _option('--new-name')),
+    ]),
+    'stats': dict([
+        _command('history', _option('--client', autocompletion=complete_client_name),
+                 _option('--outbound', autocompletion=complete_outbound_name),
+                 _option('--since'), _option('--resolution'), _option('--json/--no-json', is_flag=True)),
+    ]),
+}
@@ -1,16 +1,19 @@
-from typing import Self
+from typing import Iterable, Self
 from enum import StrEnum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from re import compile as re_compile
 from uuid import UUID, uuid4, uuid5
 
 from xxhash import xxh64
 
 from app.defaults import VLESS_LISTEN_INTERFACE
 from app.model.routing import Rule
-from app.model.vless_inbound import Client
+from app.model.vless_inbound import Client, VlessInbound
 from app.model.types import RuleProtocolType
-from app.model.api import Stats
-from app.model.veepeenet import VeePeeNetStats, TrafficStats
+from app.model.veepeenet import VeePeeNetStats
+
+_STATS_NAME_SPLITTER = re_compile(
+    r'(inbound|outbound|user)>>>([^>]*(?:>(?!>>)[^>]*)*)>>>traffic>>>(uplink|downlink)')
 
 
 @dataclass
@@ -39,16 +42,19 @@ class ClientData:
         return '.'.join(email.split('@')[0].split('.')[:-1])
 
 
+    @staticmethod
+    def get_name_and_short_id(client: Client, index: int) -> tuple[str, str]:
+        if client.email:
+            name, _, short_id = client.email.split('@')[0].rpartition('.')
+            return name, short_id
+        name = f'client_{index}'
+        return name, xxh64(name).hexdigest()
+
+
     @classmethod
     def from_model(cls, client: Client, index: int) -> "ClientData":
-        if client.email:
-            name = cls.get_name_by_email(client.email)
-            short_id = client.email.split('@')[0].split('.')[-1]
-        else:
-            name = f'client_{index}'
-            short_id = xxh64(name).hexdigest()
-        uuid = UUID(client.id)
-        return ClientData(name=name, short_id=short_id, uuid=uuid)
+        name, short_id = cls.get_name_and_short_id(client, index)
+        return ClientData(name=name, short_id=short_id, uuid=UUID(client.id))
 
     def to_model(self) -> Client:
         return Client(
@@ -57,6 +63,59 @@ class ClientData:
         )
 
 
+@dataclass
+class ClientIndex:
+    clients: list[Client]
+    names: list[str]
+    short_ids: list[str]
+    by_name: dict[str, int]
+    by_email: dict[str, int]
+    by_uuid: dict[str, int]
+    by_short_id: dict[str, int]
+
+    @classmethod
+    def from_inbound(cls, inbound: VlessInbound | None) -> "ClientIndex":
+        clients = (inbound.settings.clients or []) if inbound else []
+        index = ClientIndex(clients=clients, names=[], short_ids=[],
+                            by_name={}, by_email={}, by_uuid={}, by_short_id={})
+        for position, client in enumerate(clients):
+            # Client ids are only parsed on demand, Xray also accepts ids which are not UUIDs
+            name, short_id = ClientData.get_name_and_short_id(client, position)
+            if client.email:
+                index.by_email.setdefault(client.email, position)
+            index.names.append(name)
+            index.short_ids.append(short_id)
+            index.by_name.setdefault(name, position)
+            index.by_uuid.setdefault(client.id, position)
+            index.by_short_id.setdefault(short_id, position)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.by_name
+
+    def get_position(self, name: str) -> int | None:
+        return self.by_name.get(name)
+
+    def get_email(self, name: str) -> str:
+        position = self.by_name[name]
+        return (self.clients[position].email
+                or f'{name}.{self.short_ids[position]}@{VLESS_LISTEN_INTERFACE}')
+
+    def get_name_by_email(self, email: str) -> str:
+        position = self.by_email.get(email)
+        # Rules may still refer to removed clients, their names are taken from the email
+        return self.names[position] if position is not None else ClientData.get_name_by_email(email)
+
+    def get_data(self, position: int) -> ClientData:
+        return ClientData.from_model(self.clients[position], position)
+
+    def to_data(self) -> list[ClientData]:
+        return [self.get_data(position) for position in range(len(self.clients))]
+
+
 @dataclass
 class RuleData:
     name: str
@@ -92,7 +151,6 @@ class RuleData:
             user=self.users)
 
 
-@dataclass
 class StatsData:
 
     class SubjectType(StrEnum):
@@ -100,67 +158,110 @@ class StatsData:
         OUTBOUND = 'outbound'
         CLIENT = 'user'
 
-        @classmethod
-        def from_name(cls, name: str) -> Self | None:
-            for item in iter(cls):
-                if item.value == name:
-                    return item
-            return None
-
     class DirectionType(StrEnum):
         UPLINK = 'uplink'
         DOWNLINK = 'downlink'
 
-        @classmethod
-        def from_name(cls, name: str) -> Self | None:
-            for item in iter(cls):
-                if item.value == name:
-                    return item
-            return None
+    @staticmethod
+    def get_pattern(subject: SubjectType | None = None, name: str | None = None) -> str:
+        if name is None:
+            return f'{subject}>>>' if subject else ''
+        return f'{subject or ""}>>>{name}>>>'
 
-    subject: SubjectType
-    name: str
-    direction: DirectionType
-    traffic: int = 0
 
-    @classmethod
-    def from_api(cls, stats: Stats) -> "StatsData | None":
-        parts = stats.name.split('>>>')
-        if len(parts) != 4 or parts[2] != 'traffic':
-            return None
+@dataclass
+class StatsAggregator:
+    client: dict[str, list[int]] = field(default_factory=dict)
+    inbound: dict[str, list[int]] = field(default_factory=dict)
+    outbound: dict[str, list[int]] = field(default_factory=dict)
+    subject_filter: StatsData.SubjectType | None = None
+    name_filter: str | None = None
+
+    def __post_init__(self) -> None:
+        self._traffic_by_subject = {
+            StatsData.SubjectType.CLIENT: self.client,
+            StatsData.SubjectType.INBOUND: self.inbound,
+            StatsData.SubjectType.OUTBOUND: self.outbound,
+        }
+        self._client_names: dict[str, str] = {}
+
+    def add(self, stats_name: str, value: int | None) -> bool:
+        match = _STATS_NAME_SPLITTER.fullmatch(stats_name)
+        if not match:
+            return False
 
-        subject = cls.SubjectType.from_name(parts[0])
-        if not subject:
-            return None
-        direction = cls.DirectionType.from_name(parts[3])
-        if not direction:
-            return None
+        subject, name, direction = match.groups()
+        if self.subject_filter and subject != self.subject_filter:
+            return False
+        if self.name_filter is not None and name != self.name_filter:
+            return False
+        if subject == StatsData.SubjectType.CLIENT:
+            email = name
+            name = self._client_names.get(email)
+            if name is None:
+                name = self._client_names[email] = ClientData.get_name_by_email(email)
 
-        name = parts[1]
-        if subject == cls.SubjectType.CLIENT:
-            name = ClientData.get_name_by_email(name)
+        traffic = self._traffic_by_subject[subject]
+        counters = traffic.get(name)
+        if counters is None:
+            counters = traffic[name] = [0, 0]
+        counters[direction == StatsData.DirectionType.DOWNLINK] += value or 0
+        return True
 
-        return StatsData(subject, name, direction, stats.value or 0)
+    def update(self, counters: Iterable[tuple[str, int]]) -> Self:
+        for stats_name, value in counters:
+            self.add(stats_name, value)
+        return self
 
+    def add_stats(self, stats: VeePeeNetStats) -> Self:
+        for traffic, stats_traffic in (
+                (self.client, stats.client), (self.inbound, stats.inbound), (self.outbound, stats.outbound)):
+            for name, traffic_stats in stats_traffic.items():
+                counters = traffic.get(name)
+                if counters is None:
+                    counters = traffic[name] = [0, 0]
+                counters[0] += traffic_stats.uplink
+                counters[1] += traffic_stats.downlink
+        return self
 
     def to_model(self) -> VeePeeNetStats:
-        inbound_traffic: dict[str, TrafficStats] = {}
-        client_traffic: dict[str, TrafficStats] = {}
-        outbound_traffic: dict[str, TrafficStats] = {}
-
-        if self.subject == self.SubjectType.INBOUND:
-            if self.direction == self.DirectionType.DOWNLINK:
-                inbound_traffic[self.name] = TrafficStats(downlink=self.traffic)
-            else:
-                inbound_traffic[self.name] = TrafficStats(uplink=self.traffic)
-        elif self.subject == self.SubjectType.CLIENT:
-            if self.direction == self.DirectionType.DOWNLINK:
-                client_traffic[self.name] = TrafficStats(downlink=self.traffic)
-            else:
-                client_traffic[self.name] = TrafficStats(uplink=self.traffic)
-        elif self.subject == self.SubjectType.OUTBOUND:
-            if self.direction == self.DirectionType.DOWNLINK:
-                outbound_traffic[self.name] = TrafficStats(downlink=self.traffic)
-            else:
-                outbound_traffic[self.name] = TrafficStats(uplink=self.traffic)
-        return VeePeeNetStats(client=client_traffic, inbound=inbound_traffic, outbound=outbound_traffic)
+        return VeePeeNetStats.model_validate({
+            'client': _to_traffic_stats(self.client),
+            'inbound': _to_traffic_stats(self.inbound),
+            'outbound': _to_traffic_stats(self.outbound),
+        })
+
+
+def _to_traffic_stats(traffic: dict[str, list[int]]) -> dict[str, dict[str, int]]:
+    return {name: {'uplink': uplink, 'downlink': downlink} for name, (uplink, downlink) in traffic.items()}
+
+
+@dataclass
+class StatsRateTracker:
+    client: dict[str, list[float]] = field(default_factory=dict)
+    inbound: dict[str, list[float]] = field(default_factory=dict)
+    outbound: dict[str, list[float]] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self._previous: StatsAggregator | None = None
+        self._timestamp: float | None = None
+
+    def update(self, totals: StatsAggregator, timestamp: float) -> bool:
+        elapsed = timestamp - self._timestamp if self._timestamp is not None else None
+        previous, self._previous, self._timestamp = self._previous, totals, timestamp
+        for rates in (self.client, self.inbound, self.outbound):
+            rates.clear()
+        if previous is None or not elapsed or elapsed <= 0:
+            return False
+
+        for rates, traffic, previous_traffic in (
+                (self.client, totals.client, previous.client),
+                (self.inbound, totals.inbound, previous.inbound),
+                (self.outbound, totals.outbound, previous.outbound)):
+            for name, (uplink, downlink) in traffic.items():
+                last = previous_traffic.get(name)
+                # Totals only go down when the stats were cleared, such a sample just starts over
+                if last is None or uplink < last[0] or downlink < last[1]:
+                    continue
+                rates[name] = [(uplink - last[0]) / elapsed, (downlink - last[1]) / elapsed]
+        return True
@@ -15,12 +15,31 @@ VLESS_OUTBOUND_FINGERPRINT: FingerprintType = 'chrome'
 
 XRAY_API_HOST = '127.0.0.1'
 XRAY_API_PORT = 10085
+XRAY_API_TIMEOUT = 5
+
+STATS_JOURNAL_SYNC_INTERVAL = 5
+STATS_JOURNAL_COMPACT_SIZE = 1024 * 1024  # 1 MB
+STATS_HISTORY_BUCKET_SIZE = 300  # 5 minutes
+STATS_HISTORY_RETENTION_5M = 2 * 86400  # 2 days
+STATS_HISTORY_RETENTION_1H = 60 * 86400  # 60 days
+STATS_HISTORY_RETENTION_1D = 730 * 86400  # 2 years
+STATS_TOP_LIMIT = 10
+STATS_TOP_INTERVAL = 2
+STATS_COLLECTOR_INTERVAL = 10
+STATS_COLLECTOR_FLUSH_INTERVAL = 60
+EXPORTER_LISTEN = '127.0.0.1:9550'
+EXPORTER_REFRESH_INTERVAL = 15
+CONTROL_SOCKET_PATH = '/run/veepeenet.sock'
+CONTROL_STATS_TTL = 1.0
 
 XRAY_CONFIG_PATH = Path('/usr/local/etc/xray/config.json')
 XRAY_CONFIG_BACKUP_PATH = Path('/usr/local/etc/xray/config.json.bak')
 VEEPEENET_STATS_PATH = Path('/usr/local/etc/veepeenet/stats.json')
+VEEPEENET_STATS_JOURNAL_PATH = Path('/usr/local/etc/veepeenet/stats.journal')
+VEEPEENET_STATS_HISTORY_PATH = Path('/usr/local/etc/veepeenet/history')
 XRAY_BINARY_PATH = Path('/usr/local/bin/xray')
 XRAY_SERVICE_UNIT_PATH = Path('/etc/systemd/system/xray.service')
+STATS_COLLECTOR_UNIT_NAME = 'veepeenet-stats.service'
 XRAY_LOGS_PATH = Path('/var/log/xray')
 XRAY_ERROR_LOG_PATH = XRAY_LOGS_PATH / 'error.log'
 
@@ -85,6 +104,22 @@ EXIT_ROUTING_STRATEGY_SAME = 59
 EXIT_ROUTING_INVALID_PRIORITY = 60
 EXIT_ROUTING_CLIENT_NOT_FOUND = 61
 
+EXIT_STATS_ERROR = 70
+EXIT_STATS_INVALID_DURATION = 71
+EXIT_STATS_INVALID_FILTER = 72
+EXIT_STATS_API_UNAVAILABLE = 73
+
+EXIT_EXPORTER_ERROR = 80
+EXIT_EXPORTER_INVALID_LISTEN = 81
+
+EXIT_BATCH_ERROR = 90
+EXIT_BATCH_INVALID_OPERATION = 91
+
+EXIT_APPLY_ERROR = 100
+EXIT_APPLY_INVALID_STATE = 101
+
+EXIT_SERVE_ERROR = 110
+
 USER_RULE_PRIORITY_MIN = 0
 USER_RULE_PRIORITY_MAX = 1_000_000
 
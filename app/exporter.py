@@ -0,0 +1,181 @@
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socket import AF_INET6
+from threading import Event, Lock, Thread
+from time import monotonic, time
+
+from app.controller.data import StatsAggregator
+from app.defaults import EXPORTER_REFRESH_INTERVAL
+from app.model.veepeenet import VeePeeNetStats
+from app.stats_journal import STATS_SUBJECTS, StatsJournal
+from app.utils import get_xray_service_properties
+from app.xray_api import XrayStatsClient
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_TRAFFIC_METRICS = {
+    'client': ('veepeenet_client_traffic_bytes_total', 'Traffic of VeePeeNET clients in bytes'),
+    'inbound': ('veepeenet_inbound_traffic_bytes_total', 'Traffic of Xray inbounds in bytes'),
+    'outbound': ('veepeenet_outbound_traffic_bytes_total', 'Traffic of Xray outbounds in bytes'),
+}
+_LABEL_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n'})
+
+
+@dataclass
+class ServiceState:
+    running: bool = False
+    enabled: bool = False
+    uptime: float | None = None
+    api_available: bool = False
+
+
+class MetricsCache:
+
+    def __init__(self,
+                 client: XrayStatsClient,
+                 journal: StatsJournal,
+                 interval: float = EXPORTER_REFRESH_INTERVAL):
+        self.client = client
+        self.journal = journal
+        self.interval = interval
+        self._metrics = b''
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread: Thread | None = None
+
+    @property
+    def metrics(self) -> bytes:
+        with self._lock:
+            return self._metrics
+
+    def start(self) -> None:
+        self.refresh()
+        self._thread = Thread(target=self._run, name='metrics-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.client.close()
+
+    def refresh(self) -> None:
+        state = _get_service_state()
+        stored = self.journal.read_cached()
+        runtime = StatsAggregator()
+        if state.running:
+            try:
+                runtime, stored = self._query_runtime(stored)
+                state.api_available = True
+            except (RuntimeError, ValueError):
+                state.api_available = False
+
+        metrics = render_metrics(_merge_totals(stored, runtime), state, time()).encode('utf-8')
+        with self._lock:
+            self._metrics = metrics
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.refresh()
+
+    def _query_runtime(self, stored: VeePeeNetStats) -> tuple[StatsAggregator, VeePeeNetStats]:
+        # The stats collector moves the counters into the journal, so they are queried again if it did so
+        # in between: otherwise the moved traffic would be counted twice or not at all
+        while True:
+            runtime = StatsAggregator()
+            for name, value in self.client.query_counters():
+                runtime.add(name, value)
+            current = self.journal.read_cached()
+            if current is stored:
+                return runtime, stored
+            stored = current
+
+
+def render_metrics(totals: dict[tuple[str, str], list[int]], state: ServiceState, timestamp: float) -> str:
+    lines = [
+        '# HELP veepeenet_xray_up Whether the Xray service is running',
+        '# TYPE veepeenet_xray_up gauge',
+        f'veepeenet_xray_up {int(state.running)}',
+        '# HELP veepeenet_xray_enabled Whether the Xray service is enabled',
+        '# TYPE veepeenet_xray_enabled gauge',
+        f'veepeenet_xray_enabled {int(state.enabled)}',
+        '# HELP veepeenet_xray_api_up Whether the Xray StatsService answered the last query',
+        '# TYPE veepeenet_xray_api_up gauge',
+        f'veepeenet_xray_api_up {int(state.api_available)}',
+    ]
+    if state.uptime is not None:
+        lines += [
+            '# HELP veepeenet_xray_uptime_seconds Time since the Xray service was started',
+            '# TYPE veepeenet_xray_uptime_seconds gauge',
+            f'veepeenet_xray_uptime_seconds {state.uptime:.3f}',
+        ]
+
+    sorted_totals = sorted(totals.items())
+    for subject in STATS_SUBJECTS:
+        metric, description = _TRAFFIC_METRICS[subject]
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} counter']
+        for (key_subject, name), (uplink, downlink) in sorted_totals:
+            if key_subject != subject:
+                continue
+            label = f'{subject}="{name.translate(_LABEL_ESCAPES)}"'
+            lines.append(f'{metric}{{{label},direction="uplink"}} {uplink}')
+            lines.append(f'{metric}{{{label},direction="downlink"}} {downlink}')
+
+    lines += [
+        '# HELP veepeenet_exporter_last_refresh_timestamp_seconds Time of the last metrics refresh',
+        '# TYPE veepeenet_exporter_last_refresh_timestamp_seconds gauge',
+        f'veepeenet_exporter_last_refresh_timestamp_seconds {timestamp:.3f}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def create_metrics_server(host: str, port: int, cache: MetricsCache) -> ThreadingHTTPServer:
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = cache.metrics
+            self.send_response(200)
+            self.send_header('Content-Type', METRICS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: object) -> None:  # pylint: disable=redefined-builtin
+            pass
+
+    server_class = _IPv6HTTPServer if ':' in host else ThreadingHTTPServer
+    server = server_class((host, port), MetricsHandler)
+    server.daemon_threads = True
+    return server
+
+
+class _IPv6HTTPServer(ThreadingHTTPServer):
+    address_family = AF_INET6
+
+
+def _get_service_state() -> ServiceState:
+    properties = get_xray_service_properties(
+        'ActiveState', 'UnitFileState', 'ActiveEnterTimestampMonotonic')
+    running = properties.get('ActiveState') == 'active'
+    started = int(properties.get('ActiveEnterTimestampMonotonic') or 0)
+    return ServiceState(
+        running=running,
+        enabled=properties.get('UnitFileState') == 'enabled',
+        uptime=max(monotonic() - started / 1_000_000, 0) if running and started else None)
+
+
+
+def _merge_totals(stored: VeePeeNetStats, runtime: StatsAggregator) -> dict[tuple[str, str], list[int]]:
+    totals: dict[tuple[str, str], list[int]] = {}
+    for subject in STATS_SUBJECTS:
+        for name, traffic in getattr(stored, subject).items():
+            totals[subject, name] = [traffic.uplink, traffic.downlink]
+        for name, (uplink, downlink) in getattr(runtime, subject).items():
+            counters = totals.setdefault((subject, name), [0, 0])
+            counters[0] += uplink
+            counters[1] += downlink
+    return totals
@@ -1,10 +1,79 @@
-from pydantic import BaseModel, ConfigDict
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Callable, SupportsIndex
+from weakref import finalize
+
+from pydantic import AfterValidator, BaseModel, ConfigDict
 from pydantic.alias_generators import to_camel
 
 
+@dataclass
+class _MutationCounter:
+    serial: int = 0
+
+
+# Every attribute assignment on a model and every change of a tracked list bumps the serial,
+# so a model is unchanged since mark_clean() while the serial stays the same.
+# Dicts (extra fields, untyped inbounds and outbounds) are not tracked: they must be replaced
+# (assigned or set into a tracked list) rather than changed in place, or the change is not saved.
+_mutations = _MutationCounter()
+_clean_serials: dict[int, tuple[int, object]] = {}
+
+
+def _mark_mutated() -> None:
+    _mutations.serial += 1
+
+
+def _tracked(method: Callable[..., Any]) -> Callable[..., Any]:
+    @wraps(method)
+    def wrapper(self: list[Any], *args: Any, **kwargs: Any) -> Any:
+        _mark_mutated()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+class TrackedList(list[Any]):
+    append = _tracked(list.append)
+    extend = _tracked(list.extend)
+    insert = _tracked(list.insert)
+    remove = _tracked(list.remove)
+    pop = _tracked(list.pop)
+    clear = _tracked(list.clear)
+    sort = _tracked(list.sort)
+    reverse = _tracked(list.reverse)
+    __setitem__ = _tracked(list.__setitem__)
+    __delitem__ = _tracked(list.__delitem__)
+
+    def __iadd__(self, other: Any) -> 'TrackedList':
+        _mark_mutated()
+        return super().__iadd__(other)
+
+    def __imul__(self, other: SupportsIndex) -> 'TrackedList':
+        _mark_mutated()
+        return super().__imul__(other)
+
+
+TRACKED = AfterValidator(TrackedList)
+
+
 class XrayModel(BaseModel):
     model_config = ConfigDict(
         alias_generator=to_camel,
         populate_by_name=True,
         extra='allow'
     )
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        _mark_mutated()
+        if type(value) is list:  # pylint: disable=unidiomatic-typecheck
+            value = TrackedList(value)
+        super().__setattr__(name, value)
+
+    def is_dirty(self, source: object = None) -> bool:
+        return _clean_serials.get(id(self)) != (_mutations.serial, source)
+
+    def mark_clean(self, source: object = None) -> None:
+        key = id(self)
+        if key not in _clean_serials:
+            finalize(self, _clean_serials.pop, key, None)
+        _clean_serials[key] = (_mutations.serial, source)
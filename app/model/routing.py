@@ -1,6 +1,8 @@
+from typing import Annotated
+
 from pydantic import Field
 
-from app.model.base import XrayModel
+from app.model.base import TRACKED, TrackedList, XrayModel
 from app.model.types import RoutingDomainStrategyType
 from app.model.types import RuleProtocolType
 
@@ -8,13 +10,13 @@ from app.model.types import RuleProtocolType
 class Rule(XrayModel):
     tag: str | None = Field(default=None)
     outbound_tag: str
-    protocol: list[RuleProtocolType] | None = Field(default=None)
+    protocol: Annotated[list[RuleProtocolType], TRACKED] | None = Field(default=None)
     port: str | None = Field(default=None)
-    domain: list[str] | None = Field(default=None)
-    ip: list[str] | None = Field(default=None)
-    user: list[str] | None = Field(default=None)
+    domain: Annotated[list[str], TRACKED] | None = Field(default=None)
+    ip: Annotated[list[str], TRACKED] | None = Field(default=None)
+    user: Annotated[list[str], TRACKED] | None = Field(default=None)
 
 
 class Routing(XrayModel):
     domain_strategy: RoutingDomainStrategyType | None = Field(default=None)
-    rules: list[Rule] | None = Field(default_factory=lambda: [])
+    rules: Annotated[list[Rule], TRACKED] | None = Field(default_factory=TrackedList)
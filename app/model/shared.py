@@ -1,9 +1,9 @@
-from typing import Literal
+from typing import Annotated, Literal
 
 from pydantic import Field, field_validator
 
 from app.defaults import XRAY_ERROR_LOG_PATH, XRAY_API_HOST, XRAY_API_PORT
-from app.model.base import XrayModel
+from app.model.base import TRACKED, TrackedList, XrayModel
 from app.model.types import XrayApiServices, XrayLogLevel
 
 
@@ -22,14 +22,14 @@ class Log(XrayModel):
 class DnsServer(XrayModel):
     address: str
     port: int | None = Field(default=None)
-    domains: list[str] | None = Field(default=None)
-    expect_ips: list[str] | None = Field(default=None)
+    domains: Annotated[list[str], TRACKED] | None = Field(default=None)
+    expect_ips: Annotated[list[str], TRACKED] | None = Field(default=None)
     skip_fallback: bool | None = Field(default=None)
 
 
 class Dns(XrayModel):
-    servers: list[str | DnsServer] | None = Field(
-        default_factory=lambda: ['1.1.1.1', '1.0.0.1', '8.8.8.8', '8.8.4.4'])
+    servers: Annotated[list[str | DnsServer], TRACKED] | None = Field(
+        default_factory=lambda: TrackedList(['1.1.1.1', '1.0.0.1', '8.8.8.8', '8.8.4.4']))
 
 
 class DnsOutbound(XrayModel):
@@ -37,7 +37,7 @@ class DnsOutbound(XrayModel):
         network: Literal['tcp', 'udp'] | None = Field(default=None)
         address: str | None = Field(default=None)
         port: int | None = Field(default=None)
-        block_types: list[int] | None = Field(default=None)
+        block_types: Annotated[list[int], TRACKED] | None = Field(default=None)
         non_ip_query: Literal['skip', 'drop', 'reject'] | None = Field(
             default='skip', alias='nonIPQuery')
 
@@ -73,10 +73,19 @@ class Policy(XrayModel):
     system: SystemPolicy = Field(default_factory=SystemPolicy)
 
 
+_REQUIRED_API_SERVICES: list[XrayApiServices] = ['HandlerService', 'RoutingService', 'StatsService']
+
+
 class ApiConfig(XrayModel):
     tag: str = 'api'
     listen: str = Field(default_factory=lambda: f'{XRAY_API_HOST}:{XRAY_API_PORT}')
-    services: list[XrayApiServices] = Field(default_factory=lambda: ['StatsService'])
+    services: Annotated[list[XrayApiServices], TRACKED] = Field(
+        default_factory=lambda: TrackedList(_REQUIRED_API_SERVICES))
+
+    @field_validator('services', mode='after')
+    @classmethod
+    def _add_required_services(cls, v: list[XrayApiServices]) -> list[XrayApiServices]:
+        return TrackedList(v + [service for service in _REQUIRED_API_SERVICES if service not in v])
 
 
 
@@ -0,0 +1,54 @@
+from pydantic import BaseModel, ConfigDict, Field
+
+from app.defaults import (
+    VLESS_OUTBOUND_FINGERPRINT,
+    VLESS_OUTBOUND_PORT,
+    VLESS_OUTBOUND_SPIDER_X,
+    VLESS_SEND_INTERFACE,
+)
+from app.model.types import FingerprintType, RuleProtocolType
+
+
+class StateModel(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
+
+class ClientState(StateModel):
+    name: str
+    disabled: bool = False
+
+
+class RuleState(StateModel):
+    name: str
+    outbound: str
+    domain: list[str] | None = None
+    ip: list[str] | None = None
+    ports: str | None = None
+    protocol: list[RuleProtocolType] | None = None
+    client: list[str] | None = None
+    priority: int | None = None
+
+
+class OutboundState(StateModel):
+    name: str
+    address: str
+    uuid: str
+    sni: str
+    short_id: str
+    password: str
+    spider_x: str = VLESS_OUTBOUND_SPIDER_X
+    port: int = VLESS_OUTBOUND_PORT
+    fingerprint: FingerprintType = VLESS_OUTBOUND_FINGERPRINT
+    interface: str = VLESS_SEND_INTERFACE
+
+
+class State(StateModel):
+    clients: list[str | ClientState] | None = Field(default=None)
+    rules: list[RuleState] | None = Field(default=None)
+    outbounds: list[OutboundState] | None = Field(default=None)
+
+    def get_clients(self) -> list[ClientState] | None:
+        if self.clients is None:
+            return None
+        # pylint: disable=not-an-iterable
+        return [ClientState(name=client) if isinstance(client, str) else client for client in self.clients]
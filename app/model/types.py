@@ -9,3 +9,5 @@ RuleProtocolType = Literal['http', 'tls', 'quic', 'bittorrent']
 RoutingDomainStrategyType = Literal['AsIs', 'IPIfNonMatch', 'IPOnDemand']
 XrayLogLevel = Literal['none', 'off', 'error', 'info', 'warning', 'debug']
 XrayApiServices = Literal['HandlerService', 'LoggerService', 'StatsService', 'RoutingService']
+ClientsExportFormatType = Literal['tsv', 'ndjson', 'csv']
+StatsResolutionType = Literal['5m', '1h', '1d']
@@ -37,10 +37,17 @@ class VeePeeNetStats(XrayModel):
         return self
 
 
+class StatsSnapshot(VeePeeNetStats):
+    journal_generation: str | None = None
+    journal_offset: int = 0
+
+
 class VeePeeNet(XrayModel):
     host: str
     namespace: str
     name: str | None = None
+    reality_password: str | None = None
+    reality_key_hash: str | None = None
 
     @model_validator(mode='before')
     @classmethod
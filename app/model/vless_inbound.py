@@ -1,8 +1,8 @@
-from typing import Literal
+from typing import Annotated, Literal
 
 from pydantic import Field, AliasChoices
 
-from app.model.base import XrayModel
+from app.model.base import TRACKED, TrackedList, XrayModel
 
 
 class Client(XrayModel):
@@ -13,14 +13,14 @@ class Client(XrayModel):
 
 class RealitySettings(XrayModel):
     dest: str
-    server_names: list[str]
+    server_names: Annotated[list[str], TRACKED]
     private_key: str
-    short_ids: list[str]
+    short_ids: Annotated[list[str], TRACKED]
 
 
 class Settings(XrayModel):
-    clients: list[Client] | None = Field(
-        default_factory=lambda: [],
+    clients: Annotated[list[Client], TRACKED] | None = Field(
+        default_factory=TrackedList,
         validation_alias=AliasChoices('users', 'clients'),
         alias='clients')
     decryption: Literal['none'] = 'none'
@@ -34,8 +34,8 @@ class StreamSettings(XrayModel):
 class Sniffing(XrayModel):
     enabled: bool = Field(default=False)
     route_only: bool = Field(default=False)
-    dest_override: list[str] | None = Field(
-        default_factory=lambda: ['http', 'tls', 'quic'])
+    dest_override: Annotated[list[str], TRACKED] | None = Field(
+        default_factory=lambda: TrackedList(['http', 'tls', 'quic']))
 
 
 class VlessInbound(XrayModel):
@@ -4,7 +4,7 @@ from uuid import uuid4
 from pydantic import Field, model_serializer, model_validator
 
 from app.defaults import VLESS_LISTEN_INTERFACE
-from app.model.base import XrayModel
+from app.model.base import TRACKED, TrackedList, XrayModel
 from app.model.routing import Routing
 from app.model.shared import (
     Log,
@@ -34,10 +34,10 @@ class Xray(XrayModel):
     api: ApiConfig = Field(default_factory=ApiConfig)
     policy: Policy = Field(default_factory=Policy)
     stats: StatsConfig = Field(default_factory=StatsConfig)
-    inbounds: list[VlessInbound | dict[str, Any]] = Field(default_factory=lambda: [])
+    inbounds: Annotated[list[VlessInbound | dict[str, Any]], TRACKED] = Field(default_factory=TrackedList)
     routing: Routing | None = Field(default=None)
-    outbounds: list[Outbound | dict[str, Any]] = Field(
-        default_factory=lambda: [FreedomOutbound(), BlackholeOutbound(), DnsOutbound()])
+    outbounds: Annotated[list[Outbound | dict[str, Any]], TRACKED] = Field(
+        default_factory=lambda: TrackedList([FreedomOutbound(), BlackholeOutbound(), DnsOutbound()]))
 
     def get_vless_inbound(self) -> VlessInbound | None:
         for inbound in self.inbounds or []:
@@ -0,0 +1,158 @@
+from collections import Counter
+from pathlib import Path
+from typing import Any, BinaryIO, Iterable
+
+from app.defaults import XRAY_GEO_IP_DATA_PATH, XRAY_GEO_SITE_DATA_PATH
+from app.model.routing import Rule
+from app.model.xray import Xray
+
+_GEO_IP_PREFIX = 'geoip:'
+_GEO_SITE_PREFIX = 'geosite:'
+_ANY_ADDRESSES = {'', '0.0.0.0', '::'}
+_MAX_PORT = 65535
+# geoip.dat and geosite.dat are protobuf lists: repeated entry = 1 { string country_code = 1; ... }
+_GEO_ENTRY_KEY = 0x0a
+_GEO_CODE_KEY = 0x0a
+
+_InboundAddress = tuple[str | None, str | None, int | str | None]
+
+
+def get_config_problems(
+        xray_config: Xray,
+        geo_ip_path: Path = XRAY_GEO_IP_DATA_PATH,
+        geo_site_path: Path = XRAY_GEO_SITE_DATA_PATH) -> list[str]:
+    rules = xray_config.routing.rules if xray_config.routing and xray_config.routing.rules else []
+    inbounds: list[_InboundAddress] = [
+        (_get_value(inbound, 'tag'), _get_value(inbound, 'listen'), _get_value(inbound, 'port'))
+        for inbound in xray_config.inbounds or []]
+    outbound_tags = [_get_value(outbound, 'tag') for outbound in xray_config.outbounds or []]
+
+    problems: list[str] = []
+    problems.extend(_get_duplicates('inbound tag', [tag for tag, _, _ in inbounds] + [xray_config.api.tag]))
+    problems.extend(_get_duplicates('outbound tag', outbound_tags))
+    problems.extend(_get_duplicates('routing rule tag', [rule.tag for rule in rules]))
+    problems.extend(_get_rule_problems(rules, set(outbound_tags) | {xray_config.api.tag}))
+    problems.extend(_get_inbound_problems(xray_config))
+    problems.extend(_get_port_problems(inbounds, xray_config.api.listen))
+    problems.extend(_get_rule_geo_problems(rules, geo_ip_path, geo_site_path))
+    return problems
+
+
+def read_geo_tags(geo_data_path: Path) -> set[str]:
+    tags: set[str] = set()
+    with geo_data_path.open('rb') as geo_file:
+        while key := geo_file.read(1):
+            if key[0] != _GEO_ENTRY_KEY:
+                raise ValueError(f'unexpected field key {key[0]:#x}')
+            entry_end = _read_varint(geo_file)
+            entry_end += geo_file.tell()
+            if geo_file.read(1) == bytes([_GEO_CODE_KEY]):
+                code_length = _read_varint(geo_file)
+                tags.add(geo_file.read(code_length).decode('utf-8').upper())
+            geo_file.seek(entry_end)
+    return tags
+
+
+def _read_varint(file: BinaryIO) -> int:
+    value = 0
+    for shift in range(0, 64, 7):
+        byte = file.read(1)
+        if not byte:
+            raise ValueError('unexpected end of file')
+        value |= (byte[0] & 0x7f) << shift
+        if not byte[0] & 0x80:
+            return value
+    raise ValueError('malformed varint')
+
+
+def _get_rule_problems(rules: list[Rule], known_outbound_tags: set[str | None]) -> list[str]:
+    problems: list[str] = []
+    for number, rule in enumerate(rules, start=1):
+        rule_name = f'"{rule.tag}"' if rule.tag else f'#{number}'
+        if rule.outbound_tag not in known_outbound_tags:
+            problems.append(f'Routing rule {rule_name} uses unknown outbound "{rule.outbound_tag}"')
+        if rule.port is not None and _parse_port_ranges(rule.port) is None:
+            problems.append(f'Routing rule {rule_name} has malformed port "{rule.port}"')
+    return problems
+
+
+def _get_inbound_problems(xray_config: Xray) -> list[str]:
+    inbound = xray_config.get_vless_inbound()
+    if inbound is None:
+        return []
+    clients_count = len(inbound.settings.clients or [])
+    short_ids_count = len(inbound.stream_settings.reality_settings.short_ids)
+    if clients_count != short_ids_count:
+        return [f'Vless inbound has {clients_count} clients but {short_ids_count} short ids']
+    return []
+
+
+def _get_rule_geo_problems(rules: list[Rule], geo_ip_path: Path, geo_site_path: Path) -> list[str]:
+    geo_ip_tags = [ip.removeprefix(_GEO_IP_PREFIX).removeprefix('!')
+                   for rule in rules for ip in rule.ip or [] if ip.startswith(_GEO_IP_PREFIX)]
+    geo_site_tags = [domain.removeprefix(_GEO_SITE_PREFIX).split('@', 1)[0]
+                     for rule in rules for domain in rule.domain or [] if domain.startswith(_GEO_SITE_PREFIX)]
+    return (_get_geo_problems(_GEO_IP_PREFIX, geo_ip_path, geo_ip_tags)
+            + _get_geo_problems(_GEO_SITE_PREFIX, geo_site_path, geo_site_tags))
+
+
+def _get_geo_problems(prefix: str, geo_data_path: Path, tags: list[str]) -> list[str]:
+    if not tags:
+        return []
+    try:
+        known_tags = read_geo_tags(geo_data_path)
+    except FileNotFoundError:
+        return [f'Geodata file {geo_data_path} is not installed']
+    except (OSError, ValueError) as e:
+        return [f'Geodata file {geo_data_path} cannot be read: {e}']
+    return [f'Tag "{prefix}{tag}" not found in {geo_data_path}'
+            for tag in dict.fromkeys(tags) if tag.upper() not in known_tags]
+
+
+def _get_port_problems(inbounds: list[_InboundAddress], api_listen: str) -> list[str]:
+    problems: list[str] = []
+    api_host, _, api_port = api_listen.rpartition(':')
+    api_host = api_host.strip('[]')
+    api_ports = _parse_port_ranges(api_port)
+    if api_ports is None:
+        problems.append(f'API listener has malformed address "{api_listen}"')
+
+    for tag, listen, port in inbounds:
+        if port is None or isinstance(port, str) and port.startswith('env:'):
+            continue
+        ports = _parse_port_ranges(str(port))
+        if ports is None:
+            problems.append(f'Inbound "{tag}" has malformed port "{port}"')
+        elif api_ports and _is_ports_overlap(ports, api_ports) and (
+                listen in _ANY_ADDRESSES or api_host in _ANY_ADDRESSES or listen == api_host):
+            problems.append(f'Inbound "{tag}" port {port} conflicts with API listener {api_listen}')
+    return problems
+
+
+def _parse_port_ranges(ports: str) -> list[tuple[int, int]] | None:
+    port_ranges: list[tuple[int, int]] = []
+    for port_range in ports.split(','):
+        start, _, end = port_range.strip().partition('-')
+        if not start.isdigit() or not (end or start).isdigit():
+            return None
+        first, last = int(start), int(end or start)
+        if first > last or last > _MAX_PORT:
+            return None
+        port_ranges.append((first, last))
+    return port_ranges
+
+
+def _is_ports_overlap(ports: list[tuple[int, int]], other_ports: list[tuple[int, int]]) -> bool:
+    return any(first <= other_last and other_first <= last
+               for first, last in ports for other_first, other_last in other_ports)
+
+
+def _get_duplicates(kind: str, tags: Iterable[str | None]) -> list[str]:
+    return [f'Duplicate {kind} "{tag}"'
+            for tag, count in Counter(tag for tag in tags if tag).items() if count > 1]
+
+
+def _get_value(item: object, name: str) -> Any:
+    if isinstance(item, dict):
+        return item.get(name)
+    return getattr(item, name, None)
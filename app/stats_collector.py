@@ -0,0 +1,82 @@
+from threading import Event
+from time import monotonic, time
+
+from rich.console import Console
+from rich.text import Text
+
+from app.controller.data import StatsAggregator
+from app.defaults import (
+    STATS_COLLECTOR_INTERVAL,
+    STATS_COLLECTOR_FLUSH_INTERVAL,
+    STATS_HISTORY_BUCKET_SIZE,
+    STYLE_REGULAR,
+    STYLE_WARN,
+)
+from app.stats_history import StatsHistory
+from app.stats_journal import StatsJournal
+from app.xray_api import XrayStatsClient
+
+
+class StatsCollector:
+
+    def __init__(self,
+                 client: XrayStatsClient,
+                 journal: StatsJournal,
+                 history: StatsHistory,
+                 interval: float = STATS_COLLECTOR_INTERVAL,
+                 flush_interval: float = STATS_COLLECTOR_FLUSH_INTERVAL,
+                 console: Console | None = None):
+        self.client = client
+        self.journal = journal
+        self.history = history
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.console = console or Console(stderr=True)
+        self._pending: dict[int, StatsAggregator] = {}
+        self._stopped = Event()
+        self._api_available = True
+
+    def run(self) -> None:
+        last_flush = monotonic()
+        try:
+            while not self._stopped.wait(self.interval):
+                self.poll()
+                if monotonic() - last_flush >= self.flush_interval:
+                    self.flush()
+                    last_flush = monotonic()
+            self.poll()
+        finally:
+            self.flush()
+            self.journal.close()
+            self.client.close()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def poll(self) -> bool:
+        # The counters are reset and journaled under the journal lock, so a concurrent store of the same
+        # counters (e.g. on service stop) can not count them twice
+        with self.journal.lock():
+            try:
+                counters = self.client.query_counters(reset=True)
+            except (RuntimeError, ValueError) as e:
+                if self._api_available:
+                    self.console.print(Text(f'Xray API is not available: {e}', STYLE_WARN))
+                self._api_available = False
+                return False
+            if counters:
+                self.journal.append(StatsAggregator().update(counters).to_model())
+
+        if not self._api_available:
+            self.console.print(Text('Xray API is available again', STYLE_REGULAR))
+        self._api_available = True
+        if counters:
+            # The history is derived data and is written in batches
+            bucket = int(time()) // STATS_HISTORY_BUCKET_SIZE * STATS_HISTORY_BUCKET_SIZE
+            self._pending.setdefault(bucket, StatsAggregator()).update(counters)
+        return True
+
+    def flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        for bucket, aggregator in sorted(pending.items()):
+            self.history.record(aggregator.to_model(), at=bucket)
@@ -0,0 +1,291 @@
+from dataclasses import dataclass
+from datetime import UTC, date, datetime, timedelta
+from json import dumps as json_dumps, loads as json_loads
+from os import fsync
+from pathlib import Path
+from time import time
+from typing import Iterator
+
+from app.defaults import (
+    STATS_HISTORY_BUCKET_SIZE,
+    STATS_HISTORY_RETENTION_5M,
+    STATS_HISTORY_RETENTION_1H,
+    STATS_HISTORY_RETENTION_1D,
+)
+from app.model.types import StatsResolutionType
+from app.model.veepeenet import VeePeeNetStats
+from app.stats_journal import STATS_SUBJECTS, StatsRecord, add_stats_record, to_stats_record
+from app.utils import file_lock, write_text_file_atomic
+
+_DAY = 86400
+_ROLLUP_STATE_FILE = 'rollup.json'
+_LOCK_FILE = '.lock'
+_MAX_BUCKETS = 200
+
+
+@dataclass(frozen=True)
+class _Level:
+    resolution: StatsResolutionType
+    seconds: int
+    partition_format: str
+    retention: int
+
+    def get_partition(self, timestamp: int) -> str:
+        return datetime.fromtimestamp(timestamp, UTC).strftime(self.partition_format)
+
+    def floor(self, timestamp: float) -> int:
+        return int(timestamp) // self.seconds * self.seconds
+
+
+_LEVEL_5M = _Level('5m', STATS_HISTORY_BUCKET_SIZE, '%Y-%m-%d', STATS_HISTORY_RETENTION_5M)
+_LEVEL_1H = _Level('1h', 3600, '%Y-%m', STATS_HISTORY_RETENTION_1H)
+_LEVEL_1D = _Level('1d', _DAY, '%Y', STATS_HISTORY_RETENTION_1D)
+_LEVELS = (_LEVEL_5M, _LEVEL_1H, _LEVEL_1D)
+
+
+@dataclass
+class HistoryBucket:
+    start: int
+    stats: VeePeeNetStats
+
+
+class StatsHistory:
+
+    def __init__(self, history_dir: Path):
+        self.history_dir = history_dir
+
+    def record(self, delta: VeePeeNetStats, at: float | None = None) -> bool:
+        record = to_stats_record(delta)
+        if not record:
+            return False
+
+        timestamp = _LEVEL_5M.floor(time() if at is None else at)
+        line = json_dumps({'t': timestamp, **record}, separators=(',', ':')) + '\n'
+        with file_lock(self.history_dir / _LOCK_FILE):
+            _append_line(self._partition_path(_LEVEL_5M, timestamp), line)
+            self._rollup(_to_day(timestamp))
+            self._prune(timestamp)
+        return True
+
+    def query(self,
+              since: float,
+              until: float | None = None,
+              resolution: StatsResolutionType | None = None,
+              subject: str | None = None,
+              name: str | None = None) -> list[HistoryBucket]:
+        until = time() if until is None else until
+        level = self._get_level(since, until, resolution)
+        buckets = self._read_buckets(level, since, until, subject, name)
+        return [HistoryBucket(start, _to_stats(record))
+                for start, record in sorted(buckets.items()) if record]
+
+    def total(self, since: float, until: float | None = None, subject: str | None = None) -> VeePeeNetStats:
+        until = time() if until is None else until
+        level = self._get_level(since, until, None)
+        total: StatsRecord = {}
+        for record in self._read_buckets(level, since, until, subject, None).values():
+            _merge_record(total, record)
+        return _to_stats(total)
+
+    def get_resolution(self,
+                       since: float,
+                       until: float | None = None,
+                       resolution: StatsResolutionType | None = None) -> StatsResolutionType:
+        return self._get_level(since, time() if until is None else until, resolution).resolution
+
+    @staticmethod
+    def _get_level(since: float, until: float, resolution: StatsResolutionType | None) -> _Level:
+        if resolution:
+            return next(level for level in _LEVELS if level.resolution == resolution)
+        age = until - since
+        for level in _LEVELS:
+            if age <= level.retention and age / level.seconds <= _MAX_BUCKETS:
+                return level
+        return _LEVEL_1D
+
+    def _read_buckets(self,
+                      level: _Level,
+                      since: float,
+                      until: float,
+                      subject: str | None,
+                      name: str | None) -> dict[int, StatsRecord]:
+        start = level.floor(since)
+        rolled_until = self._read_rolled_until()
+        buckets: dict[int, StatsRecord] = {}
+
+        if level is not _LEVEL_5M:
+            rolled_end = _day_start(rolled_until + timedelta(days=1)) if rolled_until else 0
+            for partition in _iter_partitions(level, start, min(int(until), rolled_end - 1)):
+                for timestamp, record in self._read_partition(level, partition, subject, name):
+                    if start <= timestamp < min(until, rolled_end):
+                        buckets[timestamp] = record
+
+        first_day = _to_day(start)
+        if level is not _LEVEL_5M and rolled_until and rolled_until >= first_day:
+            first_day = rolled_until + timedelta(days=1)
+        for partition in _iter_partitions(_LEVEL_5M, _day_start(first_day), int(until)):
+            for timestamp, record in self._read_partition(_LEVEL_5M, partition, subject, name):
+                if start <= timestamp < until:
+                    _merge_record(buckets.setdefault(level.floor(timestamp), {}), record)
+        return buckets
+
+    def _read_partition(self,
+                        level: _Level,
+                        partition: str,
+                        subject: str | None,
+                        name: str | None) -> Iterator[tuple[int, StatsRecord]]:
+        try:
+            content = (self.history_dir / level.resolution / f'{partition}.ndjson').read_bytes()
+        except FileNotFoundError:
+            return
+        for line in content.splitlines():
+            try:
+                entry = json_loads(line)
+                timestamp = int(entry.pop('t'))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+            yield timestamp, _filter_record(entry, subject, name)
+
+    def _rollup(self, today: date) -> None:
+        rolled_until = self._read_rolled_until()
+        days = sorted(
+            day for day in (_parse_day(path.stem) for path in (self.history_dir / '5m').glob('*.ndjson'))
+            if day and day < today and (rolled_until is None or day > rolled_until))
+        for day in days:
+            hourly: dict[int, StatsRecord] = {}
+            daily: StatsRecord = {}
+            for timestamp, record in self._read_partition(_LEVEL_5M, day.isoformat(), None, None):
+                _merge_record(hourly.setdefault(_LEVEL_1H.floor(timestamp), {}), record)
+                _merge_record(daily, record)
+            day_start = _day_start(day)
+            # A rollup interrupted before the state file was written is repeated,
+            # so buckets which are already in a partition are not appended again
+            hourly_path = self._partition_path(_LEVEL_1H, day_start)
+            last_hour = _read_last_timestamp(hourly_path)
+            _append_line(hourly_path, ''.join(
+                json_dumps({'t': timestamp, **record}, separators=(',', ':')) + '\n'
+                for timestamp, record in sorted(hourly.items()) if last_hour is None or timestamp > last_hour))
+            daily_path = self._partition_path(_LEVEL_1D, day_start)
+            last_day = _read_last_timestamp(daily_path)
+            if daily and (last_day is None or day_start > last_day):
+                _append_line(daily_path, json_dumps({'t': day_start, **daily}, separators=(',', ':')) + '\n')
+            write_text_file_atomic(
+                self.history_dir / _ROLLUP_STATE_FILE, json_dumps({'rolledUntil': day.isoformat()}))
+
+    def _prune(self, now: int) -> None:
+        rolled_until = self._read_rolled_until()
+        for level in _LEVELS:
+            for path in (self.history_dir / level.resolution).glob('*.ndjson'):
+                partition_end = _get_partition_end(level, path.stem)
+                if partition_end is None or partition_end > now - level.retention:
+                    continue
+                if level is _LEVEL_5M and (rolled_until is None or _to_day(partition_end - 1) > rolled_until):
+                    continue
+                path.unlink(missing_ok=True)
+
+    def _read_rolled_until(self) -> date | None:
+        try:
+            content = json_loads((self.history_dir / _ROLLUP_STATE_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+        return _parse_day(content.get('rolledUntil', '')) if isinstance(content, dict) else None
+
+    def _partition_path(self, level: _Level, timestamp: int) -> Path:
+        return self.history_dir / level.resolution / f'{level.get_partition(timestamp)}.ndjson'
+
+
+def _append_line(path: Path, content: str) -> None:
+    if not content:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open('ab') as partition_file:
+        if partition_file.tell():
+            with path.open('rb') as reader:
+                reader.seek(-1, 2)
+                if reader.read(1) != b'\n':
+                    content = '\n' + content
+        partition_file.write(content.encode('utf-8'))
+        partition_file.flush()
+        fsync(partition_file.fileno())
+
+
+def _read_last_timestamp(path: Path) -> int | None:
+    try:
+        content = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    for line in reversed(content.splitlines()):
+        try:
+            return int(json_loads(line)['t'])
+        except (ValueError, KeyError, TypeError):
+            continue
+    return None
+
+
+def _merge_record(target: StatsRecord, record: StatsRecord) -> None:
+    for subject in STATS_SUBJECTS:
+        source = record.get(subject)
+        if not source:
+            continue
+        subject_target = target.setdefault(subject, {})
+        for name, (uplink, downlink) in source.items():
+            counters = subject_target.get(name)
+            if counters is None:
+                subject_target[name] = [uplink, downlink]
+            else:
+                counters[0] += uplink
+                counters[1] += downlink
+
+
+def _to_stats(record: StatsRecord) -> VeePeeNetStats:
+    stats = VeePeeNetStats()
+    add_stats_record(stats, record)
+    return stats
+
+
+def _filter_record(record: StatsRecord, subject: str | None, name: str | None) -> StatsRecord:
+    if subject is None:
+        return record
+    subject_record = record.get(subject, {})
+    if name is None:
+        return {subject: subject_record} if subject_record else {}
+    return {subject: {name: subject_record[name]}} if name in subject_record else {}
+
+
+def _iter_partitions(level: _Level, start: int, end: int) -> Iterator[str]:
+    partition = None
+    for timestamp in range(start, end + 1, _DAY):
+        current = level.get_partition(timestamp)
+        if current != partition:
+            partition = current
+            yield current
+    last = level.get_partition(end) if end >= start else None
+    if last and last != partition:
+        yield last
+
+
+def _get_partition_end(level: _Level, partition: str) -> int | None:
+    try:
+        if level is _LEVEL_5M:
+            return _day_start(date.fromisoformat(partition) + timedelta(days=1))
+        if level is _LEVEL_1H:
+            year, month = (int(part) for part in partition.split('-'))
+            return _day_start(date(year + month // 12, month % 12 + 1, 1))
+        return _day_start(date(int(partition) + 1, 1, 1))
+    except ValueError:
+        return None
+
+
+def _parse_day(value: str) -> date | None:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _to_day(timestamp: int) -> date:
+    return datetime.fromtimestamp(timestamp, UTC).date()
+
+
+def _day_start(day: date) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=UTC).timestamp())
@@ -0,0 +1,227 @@
+from contextlib import ExitStack, contextmanager
+from json import dumps as json_dumps, loads as json_loads
+from os import fstat, fsync, stat
+from pathlib import Path
+from time import monotonic
+from types import TracebackType
+from typing import BinaryIO, Iterator, Self
+from uuid import uuid4
+
+from app.defaults import STATS_JOURNAL_COMPACT_SIZE, STATS_JOURNAL_SYNC_INTERVAL
+from app.model.veepeenet import StatsSnapshot, TrafficStats, VeePeeNetStats
+from app.utils import (
+    file_lock,
+    get_file_key,
+    load_stats,
+    save_stats,
+    write_bytes_file_atomic,
+    write_text_file_atomic,
+)
+
+STATS_SUBJECTS = ('client', 'inbound', 'outbound')
+
+StatsRecord = dict[str, dict[str, list[int]]]
+
+
+class StatsJournal:
+
+    def __init__(self,
+                 snapshot_path: Path,
+                 journal_path: Path,
+                 sync_interval: float = STATS_JOURNAL_SYNC_INTERVAL,
+                 compact_size: int = STATS_JOURNAL_COMPACT_SIZE):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.lock_path = journal_path.with_name(f'{journal_path.name}.lock')
+        self.sync_interval = sync_interval
+        self.compact_size = compact_size
+        self._journal_file: BinaryIO | None = None
+        self._unsynced = False
+        self._last_sync = monotonic()
+        self._lock_depth = 0
+        self._cached = VeePeeNetStats()
+        self._cached_key: tuple[tuple[int, int, int] | None, ...] | None = None
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self,
+                 exc_type: type[BaseException] | None,
+                 exc_value: BaseException | None,
+                 traceback: TracebackType | None) -> None:
+        self.close()
+
+    def read(self) -> VeePeeNetStats:
+        generation, records = self._read_journal()
+        snapshot = load_stats(self.snapshot_path, StatsSnapshot)
+        folded_offset = 0
+        if generation is not None and snapshot.journal_generation == generation:
+            folded_offset = snapshot.journal_offset
+
+        stats = VeePeeNetStats(client=snapshot.client, inbound=snapshot.inbound, outbound=snapshot.outbound)
+        for offset, record in records:
+            if offset >= folded_offset:
+                add_stats_record(stats, record)
+        return stats
+
+    def read_cached(self) -> VeePeeNetStats:
+        # The same object is returned while neither file changed, so polling readers only stat() the files
+        # and can tell by identity that the collector moved counters into the journal in between
+        key = (get_file_key(self.snapshot_path), get_file_key(self.journal_path))
+        if key != self._cached_key:
+            self._cached, self._cached_key = self.read(), key
+        return self._cached
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        # Reentrant, so Xray counters can be queried with reset and appended under the same lock
+        with ExitStack() as stack:
+            if not self._lock_depth:
+                stack.enter_context(file_lock(self.lock_path))
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+
+    def append(self, delta: VeePeeNetStats) -> bool:
+        record = to_stats_record(delta)
+        if not record:
+            return False
+
+        line = (json_dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+        with self.lock():
+            journal_file = self._open_journal()
+            journal_file.seek(0, 2)
+            size = journal_file.tell()
+            if size:
+                journal_file.seek(size - 1)
+                if journal_file.read(1) != b'\n':
+                    line = b'\n' + line
+            journal_file.write(line)
+            journal_file.flush()
+            self._unsynced = True
+            if monotonic() - self._last_sync >= self.sync_interval:
+                self.sync()
+            needs_compaction = size + len(line) > self.compact_size
+        if needs_compaction:
+            self.compact()
+        return True
+
+    def sync(self) -> None:
+        if self._journal_file is not None and self._unsynced:
+            fsync(self._journal_file.fileno())
+        self._unsynced = False
+        self._last_sync = monotonic()
+
+    def compact(self) -> None:
+        with self.lock():
+            self._rewrite(self.read())
+
+    def reset(self) -> None:
+        with self.lock():
+            self._rewrite(VeePeeNetStats())
+
+    def close(self) -> None:
+        if self._journal_file is not None:
+            self.sync()
+            self._journal_file.close()
+            self._journal_file = None
+
+    def _rewrite(self, stats: VeePeeNetStats) -> None:
+        self.sync()
+        generation = self._read_generation()
+        journal_size = self.journal_path.stat().st_size if self.journal_path.exists() else 0
+        save_stats(StatsSnapshot(
+            client=stats.client,
+            inbound=stats.inbound,
+            outbound=stats.outbound,
+            journal_generation=generation,
+            journal_offset=journal_size,
+        ), self.snapshot_path)
+        write_text_file_atomic(self.journal_path, _header(uuid4().hex))
+
+    def _read_journal(self) -> tuple[str | None, list[tuple[int, StatsRecord]]]:
+        try:
+            content = self.journal_path.read_bytes()
+        except FileNotFoundError:
+            return None, []
+
+        header_end = content.find(b'\n') + 1
+        generation = _parse_generation(content[:header_end])
+        # A journal without a valid header is corrupt: none of its lines can be skipped as a header and the
+        # snapshot offset does not belong to it, so every complete line is read as a record
+        offset = header_end if generation is not None else 0
+        records: list[tuple[int, StatsRecord]] = []
+        while True:
+            line_end = content.find(b'\n', offset) + 1
+            if not line_end:
+                break
+            try:
+                record = json_loads(content[offset:line_end])
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                records.append((offset, record))
+            offset = line_end
+        return generation, records
+
+    def _read_generation(self) -> str | None:
+        try:
+            with self.journal_path.open('rb') as journal_file:
+                return _parse_generation(journal_file.readline())
+        except FileNotFoundError:
+            return None
+
+    def _open_journal(self) -> BinaryIO:
+        if self._journal_file is not None:
+            try:
+                if fstat(self._journal_file.fileno()).st_ino == stat(self.journal_path).st_ino:
+                    return self._journal_file
+            except FileNotFoundError:
+                pass
+            self.close()
+
+        if not self.journal_path.exists():
+            write_text_file_atomic(self.journal_path, _header(uuid4().hex))
+        elif self._read_generation() is None:
+            # Give a corrupt journal a new header, its records are kept and stay unfolded
+            write_bytes_file_atomic(
+                self.journal_path, _header(uuid4().hex).encode('utf-8') + self.journal_path.read_bytes())
+        self._journal_file = self.journal_path.open('a+b')
+        return self._journal_file
+
+
+def _header(generation: str) -> str:
+    return json_dumps({'generation': generation}) + '\n'
+
+
+def _parse_generation(header: bytes) -> str | None:
+    try:
+        content = json_loads(header)
+    except ValueError:
+        return None
+    generation = content.get('generation') if isinstance(content, dict) else None
+    return generation if isinstance(generation, str) else None
+
+
+def to_stats_record(stats: VeePeeNetStats) -> StatsRecord:
+    record: StatsRecord = {}
+    for subject in STATS_SUBJECTS:
+        traffic = {name: [ts.uplink, ts.downlink]
+                   for name, ts in getattr(stats, subject).items()
+                   if ts.uplink or ts.downlink}
+        if traffic:
+            record[subject] = traffic
+    return record
+
+
+def add_stats_record(stats: VeePeeNetStats, record: StatsRecord) -> None:
+    for subject in STATS_SUBJECTS:
+        subject_stats: dict[str, TrafficStats] = getattr(stats, subject)
+        for name, (uplink, downlink) in record.get(subject, {}).items():
+            traffic = subject_stats.get(name)
+            if traffic is None:
+                traffic = subject_stats[name] = TrafficStats()
+            traffic.uplink += uplink
+            traffic.downlink += downlink
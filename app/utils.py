@@ -1,27 +1,50 @@
-from json import loads as json_loads
+from json import dumps as json_dumps, loads as json_loads
 from importlib.resources import files
-from contextlib import suppress
+from gc import disable as gc_disable, enable as gc_enable, isenabled as gc_isenabled
+from marshal import dumps as marshal_dumps, loads as marshal_loads
+from os import O_RDONLY, close as os_close, fstat, fsync, geteuid, open as os_open, stat
+from contextlib import contextmanager, suppress
+from functools import cache
+from fcntl import LOCK_EX, LOCK_UN, flock
 from pathlib import Path
-from re import findall, MULTILINE, search, fullmatch
+from re import MULTILINE, search, fullmatch
 from shutil import copy2
 from subprocess import run
+from sys import stdin as sys_stdin
 from tempfile import NamedTemporaryFile
-from typing import Any, Literal, TypeVar, cast
-from urllib.parse import quote_plus as safe_url_encode
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Literal, TextIO, TypeVar, cast
 from zipfile import ZipFile
 
-from requests import get as get_request
+from xxhash import xxh64
 
-from app.defaults import XRAY_BINARY_PATH
-from app.model.api import Api, Stats
+from app.defaults import (
+    STATS_COLLECTOR_UNIT_NAME,
+    XRAY_BINARY_PATH,
+    XRAY_GEO_IP_DATA_PATH,
+    XRAY_GEO_SITE_DATA_PATH,
+)
+from app.model.routing import Rule
 from app.model.veepeenet import VeePeeNetStats
+from app.model.vless_inbound import Client, VlessInbound
 from app.model.xray import Xray
 from app.view import VersionsView
+from app.x25519 import gen_private_key, derive_public_key
+from app.xray_api import get_handler_client, get_routing_client, get_stats_client
+
+if TYPE_CHECKING:
+    from requests import Response
 
 _T = TypeVar('_T')
+_S = TypeVar('_S', bound=VeePeeNetStats)
 
 _XRAY_GITHUB_RELEASES_URL = 'https://api.github.com/repos/XTLS/Xray-core/releases'
 _CHUNK_SIZE = 1024 * 1024  # 1 MB
+_JSON_CACHE_FORMAT = 'veepeenet-json-cache.1'
+# The veepeenet section is not read by Xray, changes there do not require a restart
+_CONFIG_DIGEST_EXCLUDED_KEYS = {'veepeenet'}
+_DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+_FILE_HASH_CHUNK_SIZE = 1024 * 1024
+_CONFIG_TESTED_KEYS_LIMIT = 16
 
 app_resources = files('app.resources')
 
@@ -70,42 +93,52 @@ def install_geo_data(geo_data_url: str, geo_data_path: Path) -> None:
 
 def is_xray_service_installed(unit_path: Path) -> bool:
     try:
-        actual_unit_content = unit_path.read_text(encoding='utf-8')
-        expected_unit_content = app_resources.joinpath('xray.service').read_text()
-        return expected_unit_content == actual_unit_content
+        return all(
+            path.read_text(encoding='utf-8') == app_resources.joinpath(resource).read_text()
+            for resource, path in _get_service_units(unit_path))
     except FileNotFoundError:
         return False
 
 
 def install_xray_service(unit_path: Path) -> None:
-    unit_content = app_resources.joinpath('xray.service').read_text()
-    write_text_file(unit_path, unit_content, mode=0o644)
+    for resource, path in _get_service_units(unit_path):
+        write_text_file(path, app_resources.joinpath(resource).read_text(), mode=0o644)
     run_command('systemctl daemon-reload', check=True)
 
 
+def _get_service_units(unit_path: Path) -> list[tuple[str, Path]]:
+    return [
+        ('xray.service', unit_path),
+        (STATS_COLLECTOR_UNIT_NAME, unit_path.with_name(STATS_COLLECTOR_UNIT_NAME)),
+    ]
+
+
 def gen_xray_private_key() -> str:
-    gen_result = run_command(f'{XRAY_BINARY_PATH} x25519')
-    if gen_result[0] != 0:
-        raise RuntimeError(
-            f'Error generating private key.'
-            f' code:{gen_result[0]}, stdout:{gen_result[1]}, stderr:{gen_result[2]}')
-    private_key = findall(r'(?<=PrivateKey: ).+$', gen_result[1], MULTILINE)
-    if not private_key:
-        raise RuntimeError('Error generating private key. Unexpected stdout')
-    return private_key[0]
+    return gen_private_key()
 
 
 def gen_xray_password(private_key: str) -> str:
-    gen_result = run_command(f'{XRAY_BINARY_PATH} x25519 -i {private_key}')
-    if gen_result[0] != 0:
-        raise RuntimeError(
-            f'Error generating password.'
-            f' code:{gen_result[0]}, stdout:{gen_result[1]}, stderr:{gen_result[2]}')
-    password = (findall(r'(?<=Password:\s).+$', gen_result[1], MULTILINE)
-                or findall(r'(?<=Password\s\(PublicKey\):\s).+$', gen_result[1], MULTILINE))
-    if not password:
-        raise RuntimeError('Error generating password. Unexpected stdout')
-    return password[0]
+    try:
+        return derive_public_key(private_key)
+    except ValueError as e:
+        raise RuntimeError(f'Error generating password. {e}') from e
+
+
+def get_reality_password(xray_config: Xray) -> str:
+    inbound = xray_config.get_vless_inbound()
+    if not inbound:
+        raise ValueError('Vless inbound not found in Xray config')
+    private_key = inbound.stream_settings.reality_settings.private_key
+    key_hash = xxh64(private_key).hexdigest()
+    veepeenet = xray_config.veepeenet
+    if veepeenet and veepeenet.reality_password and veepeenet.reality_key_hash == key_hash:
+        return veepeenet.reality_password
+
+    password = gen_xray_password(private_key)
+    if veepeenet:
+        veepeenet.reality_password = password
+        veepeenet.reality_key_hash = key_hash
+    return password
 
 
 def is_xray_service_running() -> bool:
@@ -118,6 +151,11 @@ def get_xray_service_uptime() -> str | None:
     return (matched.group(1).strip()) if matched else None
 
 
+def get_xray_service_properties(*names: str) -> dict[str, str]:
+    result = run_command(f'systemctl show xray --property={",".join(names)}')
+    return dict(line.split('=', 1) for line in result[1].splitlines() if '=' in line)
+
+
 def stop_xray_service() -> None:
     run_command('systemctl stop xray -q')
 
@@ -146,31 +184,6 @@ def disable_xray_service() -> None:
     run_command('systemctl disable xray -q', check=True)
 
 
-def get_vless_client_url(client_name: str, xray_config: Xray) -> str | None:
-    inbound = xray_config.get_vless_inbound()
-    if not inbound:
-        raise ValueError('Vless inbound not found in Xray config')
-    for i, client in enumerate(inbound.settings.clients or []):
-        if client.email and client_name == '.'.join(client.email.split('@')[0].split('.')[:-1]):
-            sni = inbound.stream_settings.reality_settings.server_names[0]
-            password = gen_xray_password(
-                inbound.stream_settings.reality_settings.private_key)
-            spx = safe_url_encode(f'/{client_name}')
-            server_name = xray_config.veepeenet and (xray_config.veepeenet.name or xray_config.veepeenet.host)
-            return (f'vless://{client.id}@{xray_config.veepeenet and xray_config.veepeenet.host}:'
-                    f'{inbound.port}'
-                    '?flow=xtls-rprx-vision'
-                    '&type=raw'
-                    '&security=reality'
-                    '&fp=chrome'
-                    f'&sni={sni}'
-                    f'&pbk={password}'
-                    f'&sid={inbound.stream_settings.reality_settings.short_ids[i]}'
-                    f'&spx={spx}'
-                    f'#{client_name}@{server_name}')
-    return None
-
-
 def is_valid_vless_client_url(url: str) -> bool:
     return fullmatch(
         r'vless://[a-f0-9-]{36}@[\w.-]+:\d{1,5}'
@@ -215,15 +228,101 @@ def write_text_file(file_path: Path, text: str, mode: int = 0) -> None:
         file_path.chmod(mode)
 
 
-def load_stats(file_path: Path) -> VeePeeNetStats:
+def write_text_file_atomic(file_path: Path, text: str, mode: int = 0o644) -> None:
+    write_bytes_file_atomic(file_path, text.encode('utf-8'), mode)
+
+
+def write_bytes_file_atomic(file_path: Path, content: bytes, mode: int = 0o644) -> None:
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile(
+            'wb', dir=file_path.parent, prefix=f'.{file_path.name}.', delete=False) as tmp_file:
+        tmp_path = Path(tmp_file.name)
+        try:
+            tmp_file.write(content)
+            tmp_file.flush()
+            fsync(tmp_file.fileno())
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+    try:
+        tmp_path.chmod(mode)
+        tmp_path.replace(file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    fsync_dir(file_path.parent)
+
+
+def get_json_cache_key(content: bytes) -> bytes:
+    return f'{_JSON_CACHE_FORMAT}:{_get_cache_version()}:{xxh64(content).hexdigest()}\n'.encode('ascii')
+
+
+@cache
+def _get_cache_version() -> str:
+    # Models may parse the same content differently after an upgrade
+    return detect_veepeenet_versions().veepeenet_version
+
+
+def load_json_cache(cache_path: Path, content: bytes) -> Any | None:
     try:
-        return VeePeeNetStats.model_validate_json(file_path.read_text(encoding='utf-8'), by_alias=True)
+        with cache_path.open('rb') as cache_file:
+            cache_stat = fstat(cache_file.fileno())
+            if cache_stat.st_uid not in (0, geteuid()) or cache_stat.st_mode & 0o022:
+                return None
+            if cache_file.readline() != get_json_cache_key(content):
+                return None
+            return marshal_loads(cache_file.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def save_json_cache(cache_path: Path, content: bytes, data: Any) -> bool:
+    try:
+        write_bytes_file_atomic(cache_path, get_json_cache_key(content) + marshal_dumps(data), mode=0o644)
+        return True
     except (OSError, ValueError):
-        return VeePeeNetStats()
+        return False
+
+
+@contextmanager
+def gc_paused() -> Iterator[None]:
+    was_enabled = gc_isenabled()
+    gc_disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc_enable()
+
+
+@contextmanager
+def file_lock(lock_path: Path) -> Iterator[None]:
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with lock_path.open('a') as lock_file:
+        flock(lock_file.fileno(), LOCK_EX)
+        try:
+            yield
+        finally:
+            flock(lock_file.fileno(), LOCK_UN)
+
+
+def fsync_dir(dir_path: Path) -> None:
+    dir_fd = os_open(dir_path, O_RDONLY)
+    try:
+        fsync(dir_fd)
+    finally:
+        os_close(dir_fd)
+
+
+def load_stats(file_path: Path, model: type[_S] = VeePeeNetStats) -> _S:
+    try:
+        return model.model_validate_json(file_path.read_text(encoding='utf-8'), by_alias=True)
+    except (OSError, ValueError):
+        return model()
 
 
 def save_stats(stats: VeePeeNetStats, file_path: Path) -> None:
-    write_text_file(
+    write_text_file_atomic(
         file_path,
         stats.model_dump_json(by_alias=True, exclude_none=True, indent=2),
         mode=0o644)
@@ -256,6 +355,39 @@ def is_json_content_same(
     return content1 == content2
 
 
+def read_client_names(source: str) -> Iterator[str]:
+    if source == '-':
+        yield from parse_client_names(sys_stdin)
+        return
+    with open(source, 'rt', encoding='utf-8') as names_file:
+        yield from parse_client_names(names_file)
+
+
+def parse_client_names(lines: TextIO | list[str]) -> Iterator[str]:
+    for line_number, line in enumerate(lines, start=1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        if not stripped.startswith(('{', '"')):
+            yield stripped
+            continue
+        try:
+            record = json_loads(stripped)
+        except ValueError as e:
+            raise ValueError(f'Invalid JSON at line {line_number}') from e
+        name = cast(dict[str, Any], record).get('name') if isinstance(record, dict) else record
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError(f'Missing client name at line {line_number}')
+        yield name.strip()
+
+
+def parse_duration(value: str) -> int:
+    matcher = fullmatch(r'\s*(\d+)\s*([smhdw]?)\s*', value.lower())
+    if not matcher or not int(matcher.group(1)):
+        raise ValueError(f'Invalid duration: {value}')
+    return int(matcher.group(1)) * _DURATION_UNITS[matcher.group(2) or 's']
+
+
 def remove_duplicates(source: list[_T]) -> list[_T]:
     return list(dict.fromkeys(source))
 
@@ -306,12 +438,114 @@ def validate_xray_config(config_path: Path) -> tuple[bool, str]:
 
 def backup_config(config_path: Path, backup_path: Path) -> Path:
     copy2(config_path, backup_path)
+    with suppress(OSError):
+        copy2(_get_config_digest_path(config_path), _get_config_digest_path(backup_path))
     return backup_path
 
 
 def restore_config(config_path: Path, backup_path: Path) -> None:
     copy2(backup_path, config_path)
+    with suppress(OSError):
+        copy2(_get_config_digest_path(backup_path), _get_config_digest_path(config_path))
     backup_path.unlink(missing_ok=True)
+    _get_config_digest_path(backup_path).unlink(missing_ok=True)
+
+
+def get_json_digest(content: Any, exclude_top_level_keys: set[str] | None = None) -> str:
+    if exclude_top_level_keys and isinstance(content, dict):
+        content = {key: value for key, value in cast(dict[str, Any], content).items()
+                   if key not in exclude_top_level_keys}
+    return xxh64(json_dumps(content, sort_keys=True, separators=(',', ':'), ensure_ascii=False)).hexdigest()
+
+
+def get_config_digest(config_path: Path) -> str | None:
+    try:
+        config_content = config_path.read_bytes()
+    except OSError:
+        return None
+    with suppress(OSError, ValueError):
+        content_hash, digest = _get_config_digest_path(config_path).read_text(encoding='utf-8').split()
+        if content_hash == xxh64(config_content).hexdigest():
+            return digest
+    try:
+        return save_config_digest(config_path, config_content, json_loads(config_content))
+    except ValueError:
+        return None
+
+
+def save_config_digest(config_path: Path, config_content: bytes, config_data: Any) -> str:
+    digest = get_json_digest(config_data, _CONFIG_DIGEST_EXCLUDED_KEYS)
+    with suppress(OSError):
+        write_text_file_atomic(
+            _get_config_digest_path(config_path), f'{xxh64(config_content).hexdigest()} {digest}\n')
+    return digest
+
+
+def is_config_digest_same(config_path: Path, other_config_path: Path) -> bool:
+    digest = get_config_digest(config_path)
+    return digest is not None and digest == get_config_digest(other_config_path)
+
+
+def _get_config_digest_path(config_path: Path) -> Path:
+    return config_path.with_name(f'.{config_path.name}.digest')
+
+
+def get_file_hash(file_path: Path) -> str:
+    file_hash = xxh64()
+    with file_path.open('rb') as file:
+        while chunk := file.read(_FILE_HASH_CHUNK_SIZE):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_file_key(path: Path) -> tuple[int, int, int] | None:
+    try:
+        file_stat = stat(path)
+    except FileNotFoundError:
+        return None
+    return file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns
+
+
+def get_config_test_key(config_path: Path, dependency_paths: Iterable[Path]) -> str | None:
+    try:
+        hashes = [get_file_hash(config_path)]
+    except OSError:
+        return None
+    for dependency_path in dependency_paths:
+        try:
+            hashes.append(get_file_hash(dependency_path))
+        except OSError:
+            hashes.append('-')
+    return xxh64(' '.join(hashes)).hexdigest()
+
+
+def is_config_tested(config_path: Path, test_key: str) -> bool:
+    return test_key in _read_config_tested_keys(config_path)
+
+
+def save_config_tested(config_path: Path, test_key: str) -> None:
+    test_keys = [key for key in _read_config_tested_keys(config_path) if key != test_key]
+    test_keys.append(test_key)
+    with suppress(OSError):
+        write_text_file_atomic(
+            _get_config_tested_path(config_path),
+            ''.join(f'{key}\n' for key in test_keys[-_CONFIG_TESTED_KEYS_LIMIT:]))
+
+
+def _read_config_tested_keys(config_path: Path) -> list[str]:
+    try:
+        with _get_config_tested_path(config_path).open('rt', encoding='utf-8') as tested_file:
+            tested_stat = fstat(tested_file.fileno())
+            # A forged entry would let an invalid config skip the test
+            if tested_stat.st_uid not in (0, geteuid()) or tested_stat.st_mode & 0o022:
+                return []
+            return tested_file.read().split()
+    except (OSError, ValueError):
+        return []
+
+
+def _get_config_tested_path(config_path: Path) -> Path:
+    return config_path.with_name(f'.{config_path.name}.tested')
 
 
 def get_xray_service_journal(lines: int = 20) -> str | None:
@@ -319,20 +553,57 @@ def get_xray_service_journal(lines: int = 20) -> str | None:
     return result[1] if result[0] == 0 and result[1] else None
 
 
-def query_xray_stats(host: str, port: int, reset: bool = False) -> list[Stats]:
-    result = run_command(
-        f'{XRAY_BINARY_PATH} api statsquery --server={host}:{port} -reset={str(reset).lower()}')
-    if result[0] != 0:
-        return []
+def query_xray_stats(host: str, port: int, reset: bool = False, pattern: str = '') -> list[tuple[str, int]]:
     try:
-        return Api.model_validate_json(result[1]).stat
-    except (KeyError, ValueError):
+        return get_stats_client(host, port).query_counters(pattern=pattern, reset=reset)
+    except (RuntimeError, ValueError):
         return []
 
 
 def reset_xray_stats(host: str, port: int) -> bool:
-    result = run_command(f'{XRAY_BINARY_PATH} api statsquery --server={host}:{port} -reset=true')
-    return result[0] == 0
+    try:
+        get_stats_client(host, port).query_counters(reset=True)
+    except (RuntimeError, ValueError):
+        return False
+    return True
+
+
+def add_xray_inbound_users(host: str, port: int, inbound: VlessInbound, clients: list[Client]) -> bool:
+    try:
+        handler_client = get_handler_client(host, port)
+        for client in clients:
+            handler_client.add_user(inbound.tag or '', client.email or '', client.id, client.flow)
+    except (RuntimeError, ValueError):
+        return False
+    return True
+
+
+def remove_xray_inbound_users(host: str, port: int, inbound_tag: str, emails: list[str]) -> bool:
+    try:
+        handler_client = get_handler_client(host, port)
+        for email in emails:
+            handler_client.remove_user(inbound_tag, email)
+    except (RuntimeError, ValueError):
+        return False
+    return True
+
+
+def replace_xray_routing_rules(host: str, port: int, rules: list[Rule]) -> bool:
+    try:
+        get_routing_client(host, port).replace_rules(
+            [rule.model_dump(by_alias=True, exclude_none=True) for rule in rules],
+            XRAY_GEO_IP_DATA_PATH,
+            XRAY_GEO_SITE_DATA_PATH,
+        )
+    except (OSError, RuntimeError, ValueError):
+        return False
+    return True
+
+
+def get_request(url: str, timeout: float, **kwargs: Any) -> 'Response':
+    # requests is heavy to import and is needed only for downloads
+    from requests import get  # pylint: disable=import-outside-toplevel
+    return get(url, timeout=timeout, **kwargs)
 
 
 def get_xray_github_releases(limit: int = 10, include_prerelease: bool = False) -> list[str]:
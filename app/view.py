@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Literal
 
 from pydantic import BaseModel, Field
@@ -18,7 +19,7 @@ from app.defaults import (
     STYLE_STATS_UP,
     STYLE_STATS_DOWN,
 )
-from app.model.types import FingerprintType
+from app.model.types import FingerprintType, StatsResolutionType
 
 
 def joined_bold(items: list[str], fallback: str | None = None) -> Text:
@@ -58,7 +59,7 @@ class ClientView(BaseModel):
     name: str
     url: str
     disabled: bool = Field(default=False)
-    stats: TrafficStatsView = Field(default_factory=TrafficStatsView)
+    stats: TrafficStatsView | None = Field(default_factory=TrafficStatsView)
 
     def rich_repr_short(self) -> Text:
         return Text.assemble(
@@ -71,9 +72,9 @@ class ClientView(BaseModel):
             Text.assemble(
                 Text('● ', STYLE_ACCENT_DOWN if self.disabled else STYLE_OK),
                 Text(self.name, STYLE_VALUE),
-                Text(' [', STYLE_REGULAR),
-                self.stats.rich_repr_short(),
-                Text(']', STYLE_REGULAR)),
+                Text.assemble(
+                    Text(' [', STYLE_REGULAR), self.stats.rich_repr_short(), Text(']', STYLE_REGULAR))
+                if self.stats else Text('')),
             Text(self.url, STYLE_URL, no_wrap=True),
         ]
         return Group(*parts)
@@ -190,7 +191,7 @@ class OutboundView(BaseModel):
     port: int | None = Field(default=None)
     fingerprint: FingerprintType | None = Field(default=None)
     interface: str | None = Field(default=None)
-    stats: TrafficStatsView = Field(default_factory=TrafficStatsView)
+    stats: TrafficStatsView | None = Field(default_factory=TrafficStatsView)
 
     def rich_text_short(self) -> Text:
         if self.address:
@@ -224,7 +225,8 @@ class OutboundView(BaseModel):
         content = Text('\n').join(content_lines) if content_lines else Text('No details', STYLE_DIM)
         return Panel(
             content,
-            title=Text.assemble(Text(self.name, STYLE_ACCENT_UP), ' [', self.stats.rich_repr_short(), ']'),
+            title=Text.assemble(Text(self.name, STYLE_ACCENT_UP), ' [', self.stats.rich_repr_short(), ']')
+            if self.stats else Text(self.name, STYLE_ACCENT_UP),
             title_align='left',
         )
 
@@ -334,3 +336,114 @@ class XrayReleasesView(BaseModel):
             title_align='left',
             border_style=STYLE_DIM,
         )
+
+
+class TrafficBucketView(BaseModel):
+    start: datetime
+    stats: TrafficStatsView
+
+    def rich_repr(self, resolution: StatsResolutionType) -> Text:
+        time_format = '%Y-%m-%d' if resolution == '1d' else '%Y-%m-%d %H:%M'
+        return row(
+            Text(f'{self.start.astimezone().strftime(time_format)}  ', STYLE_REGULAR),
+            self.stats.rich_repr_short())
+
+
+class TrafficHistoryView(BaseModel):
+    subject: Literal['client', 'inbound', 'outbound']
+    name: str | None = Field(default=None)
+    since: datetime
+    resolution: StatsResolutionType
+    total: TrafficStatsView
+    buckets: list[TrafficBucketView]
+
+    def rich_repr(self) -> Panel:
+        content = Text('\n').join(bucket.rich_repr(self.resolution) for bucket in self.buckets) \
+            if self.buckets else Text('No traffic recorded', STYLE_DIM)
+        title = Text.assemble(
+            (f'{self.subject.capitalize()} ', STYLE_REGULAR),
+            (self.name, STYLE_ACCENT_UP),
+            ' ',
+        ) if self.name else Text('Server ', STYLE_REGULAR)
+        title.append_text(Text.assemble(
+            (f'traffic since {self.since.astimezone().strftime("%Y-%m-%d %H:%M")} ', STYLE_REGULAR),
+            ('[', STYLE_REGULAR), self.total.rich_repr_short(), (']', STYLE_REGULAR),
+        ))
+        return Panel(
+            content,
+            title=title,
+            subtitle=f'{self.resolution} buckets',
+            title_align='left',
+            subtitle_align='right',
+            border_style=STYLE_DIM,
+        )
+
+
+class TrafficTopItemView(BaseModel):
+    name: str
+    stats: TrafficStatsView
+
+
+class TrafficTopView(BaseModel):
+    subject: Literal['client', 'outbound']
+    window: str
+    items: list[TrafficTopItemView]
+
+    def rich_repr(self) -> Panel:
+        content = Text('\n').join(
+            Text.assemble(
+                (f'{i}. ', STYLE_REGULAR),
+                (item.name, STYLE_VALUE),
+                ' ',
+                item.stats.rich_repr_short(),
+            ) for i, item in enumerate(self.items, start=1)
+        ) if self.items else Text('No traffic recorded', STYLE_DIM)
+        return Panel(
+            content,
+            title=Text(f'Top {self.subject}s by traffic for the last {self.window}', STYLE_REGULAR),
+            title_align='left',
+            border_style=STYLE_DIM,
+        )
+
+
+class TrafficRateView(BaseModel):
+    name: str
+    uplink: float = Field(default=0)
+    downlink: float = Field(default=0)
+
+    def rich_repr(self) -> Text:
+        return Text.assemble(
+            (self.name, STYLE_VALUE),
+            ' ',
+            ('⬇ ', STYLE_STATS_UP),
+            (f'{format_traffic_bytes(round(self.downlink))}/s', STYLE_STATS_UP),
+            ' | ',
+            ('⬆ ', STYLE_STATS_DOWN),
+            (f'{format_traffic_bytes(round(self.uplink))}/s', STYLE_STATS_DOWN),
+        )
+
+
+class TrafficRatesView(BaseModel):
+    interval: float
+    clients: list[TrafficRateView]
+    outbounds: list[TrafficRateView]
+
+    def rich_repr(self) -> Group:
+        return Group(
+            self._rich_panel('Clients', self.clients),
+            self._rich_panel('Outbounds', self.outbounds),
+        )
+
+    def _rich_panel(self, title: str, rates: list[TrafficRateView]) -> Panel:
+        content = Text('\n').join(
+            Text.assemble((f'{i}. ', STYLE_REGULAR), rate.rich_repr())
+            for i, rate in enumerate(rates, start=1)
+        ) if rates else Text('No traffic', STYLE_DIM)
+        return Panel(
+            content,
+            title=Text(f'{title} by traffic rate', STYLE_REGULAR),
+            subtitle=f'every {self.interval:g}s',
+            title_align='left',
+            subtitle_align='right',
+            border_style=STYLE_DIM,
+        )
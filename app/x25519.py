@@ -0,0 +1,80 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from secrets import token_bytes
+
+KEY_SIZE = 32
+
+_P = 2 ** 255 - 19
+_A24 = 121665
+_BASE_POINT = (9).to_bytes(KEY_SIZE, 'little')
+
+
+def x25519(scalar: bytes, u_point: bytes) -> bytes:
+    if len(scalar) != KEY_SIZE or len(u_point) != KEY_SIZE:
+        raise ValueError(f'X25519 inputs must be {KEY_SIZE} bytes long')
+
+    k = _decode_scalar(scalar)
+    x_1 = int.from_bytes(u_point, 'little') & ((1 << 255) - 1)
+    x_2, z_2, x_3, z_3 = 1, 0, x_1, 1
+    swap = 0
+
+    for t in reversed(range(255)):
+        k_t = (k >> t) & 1
+        swap ^= k_t
+        if swap:
+            x_2, x_3, z_2, z_3 = x_3, x_2, z_3, z_2
+        swap = k_t
+        x_2, z_2, x_3, z_3 = _ladder_step(x_1, x_2, z_2, x_3, z_3)
+
+    if swap:
+        x_2, z_2 = x_3, z_3
+
+    return (x_2 * pow(z_2, _P - 2, _P) % _P).to_bytes(KEY_SIZE, 'little')
+
+
+def gen_private_key() -> str:
+    return encode_key(clamp(token_bytes(KEY_SIZE)))
+
+
+def derive_public_key(private_key: str) -> str:
+    return encode_key(x25519(clamp(decode_key(private_key)), _BASE_POINT))
+
+
+def clamp(scalar: bytes) -> bytes:
+    clamped = bytearray(scalar)
+    clamped[0] &= 248
+    clamped[31] &= 127
+    clamped[31] |= 64
+    return bytes(clamped)
+
+
+def encode_key(key: bytes) -> str:
+    return urlsafe_b64encode(key).decode('ascii').rstrip('=')
+
+
+def decode_key(key: str) -> bytes:
+    stripped = key.strip().rstrip('=')
+    try:
+        decoded = urlsafe_b64decode(stripped + '=' * (-len(stripped) % 4))
+    except ValueError as e:
+        raise ValueError('Invalid X25519 key encoding') from e
+    if len(decoded) != KEY_SIZE:
+        raise ValueError(f'Invalid X25519 key length: {len(decoded)} bytes')
+    return decoded
+
+
+def _decode_scalar(scalar: bytes) -> int:
+    return int.from_bytes(clamp(scalar), 'little')
+
+
+def _ladder_step(x_1: int, x_2: int, z_2: int, x_3: int, z_3: int) -> tuple[int, int, int, int]:
+    # One Montgomery ladder step from RFC 7748: doubles (x_2, z_2) and adds it to (x_3, z_3)
+    a = (x_2 + z_2) % _P
+    aa = a * a % _P
+    b = (x_2 - z_2) % _P
+    bb = b * b % _P
+    e = (aa - bb) % _P
+    c = (x_3 + z_3) % _P
+    d = (x_3 - z_3) % _P
+    da = d * a % _P
+    cb = c * b % _P
+    return aa * bb % _P, e * (aa + _A24 * e) % _P, (da + cb) ** 2 % _P, x_1 * (da - cb) ** 2 % _P
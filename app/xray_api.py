@@ -0,0 +1,457 @@
+from functools import cache
+from ipaddress import ip_address
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Iterable, Iterator
+
+import grpc
+
+from app.defaults import XRAY_API_TIMEOUT
+from app.model.api import Stats
+
+STATS_SERVICE_NAME = 'xray.app.stats.command.StatsService'
+HANDLER_SERVICE_NAME = 'xray.app.proxyman.command.HandlerService'
+ROUTING_SERVICE_NAME = 'xray.app.router.command.RoutingService'
+
+_QUERY_STATS_METHOD = f'/{STATS_SERVICE_NAME}/QueryStats'
+_ALTER_INBOUND_METHOD = f'/{HANDLER_SERVICE_NAME}/AlterInbound'
+_ADD_RULE_METHOD = f'/{ROUTING_SERVICE_NAME}/AddRule'
+_ADD_USER_OPERATION_TYPE = 'xray.app.proxyman.command.AddUserOperation'
+_REMOVE_USER_OPERATION_TYPE = 'xray.app.proxyman.command.RemoveUserOperation'
+_VLESS_ACCOUNT_TYPE = 'xray.proxy.vless.Account'
+_ROUTER_CONFIG_TYPE = 'xray.app.router.Config'
+_CHANNEL_OPTIONS = [
+    ('grpc.max_receive_message_length', -1),
+    ('grpc.enable_http_proxy', 0),
+]
+
+_WIRE_VARINT = 0
+_WIRE_FIXED64 = 1
+_WIRE_LENGTH_DELIMITED = 2
+_WIRE_FIXED32 = 5
+
+_INT64_SIGN = 1 << 63
+_UINT64_RANGE = 1 << 64
+
+# Xray router.Domain types by the prefix of a routing rule domain, a domain without a prefix is a keyword
+_DOMAIN_TYPES = {'regexp:': 1, 'domain:': 2, 'full:': 3, 'keyword:': 0}
+
+
+class XrayApiClient:
+
+    service_name = ''
+
+    def __init__(self, host: str, port: int, timeout: float = XRAY_API_TIMEOUT):
+        self.target = f'{host}:{port}'
+        self.timeout = timeout
+        self._channel: grpc.Channel | None = None
+        self._methods: dict[str, Callable[..., bytes]] = {}
+        self._lock = Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._channel is not None:
+                self._channel.close()
+            self._channel = None
+            self._methods.clear()
+
+    def _call(self, method: str, request: bytes) -> bytes:
+        try:
+            return self._get_method(method)(request, timeout=self.timeout)
+        except grpc.RpcError as e:
+            service = self.service_name.rpartition('.')[2]
+            raise RuntimeError(f'Xray {service} request to {self.target} failed') from e
+
+    def _get_method(self, method: str) -> Callable[..., bytes]:
+        with self._lock:
+            if self._channel is None:
+                self._channel = grpc.insecure_channel(self.target, options=_CHANNEL_OPTIONS)
+            rpc = self._methods.get(method)
+            if rpc is None:
+                rpc = self._methods[method] = self._channel.unary_unary(method)
+            return rpc
+
+
+class XrayStatsClient(XrayApiClient):
+
+    service_name = STATS_SERVICE_NAME
+
+    def query_stats(self, pattern: str = '', reset: bool = False) -> list[Stats]:
+        return decode_query_stats_response(
+            self._call(_QUERY_STATS_METHOD, encode_query_stats_request(pattern, reset)))
+
+    def query_counters(self, pattern: str = '', reset: bool = False) -> list[tuple[str, int]]:
+        return list(iter_query_stats_response(
+            self._call(_QUERY_STATS_METHOD, encode_query_stats_request(pattern, reset))))
+
+
+class XrayHandlerClient(XrayApiClient):
+
+    service_name = HANDLER_SERVICE_NAME
+
+    def add_user(self, inbound_tag: str, email: str, account_id: str, flow: str = '') -> None:
+        self._call(_ALTER_INBOUND_METHOD, encode_add_user_request(inbound_tag, email, account_id, flow))
+
+    def remove_user(self, inbound_tag: str, email: str) -> None:
+        self._call(_ALTER_INBOUND_METHOD, encode_remove_user_request(inbound_tag, email))
+
+
+class XrayRoutingClient(XrayApiClient):
+
+    service_name = ROUTING_SERVICE_NAME
+
+    def replace_rules(self, rules: Iterable[dict[str, Any]], geo_ip_path: Path, geo_site_path: Path) -> None:
+        config = encode_router_config(rules, geo_ip_path, geo_site_path)
+        self._call(_ADD_RULE_METHOD, encode_add_rule_request(config, append=False))
+
+
+@cache
+def get_stats_client(host: str, port: int) -> XrayStatsClient:
+    return XrayStatsClient(host, port)
+
+
+@cache
+def get_handler_client(host: str, port: int) -> XrayHandlerClient:
+    return XrayHandlerClient(host, port)
+
+
+@cache
+def get_routing_client(host: str, port: int) -> XrayRoutingClient:
+    return XrayRoutingClient(host, port)
+
+
+def encode_query_stats_request(pattern: str = '', reset: bool = False) -> bytes:
+    message = bytearray()
+    if pattern:
+        _write_bytes_field(message, 1, pattern.encode('utf-8'))
+    if reset:
+        _write_varint(message, 2 << 3 | _WIRE_VARINT)
+        _write_varint(message, 1)
+    return bytes(message)
+
+
+def decode_query_stats_request(data: bytes) -> tuple[str, bool]:
+    data = bytes(data)
+    pattern = ''
+    reset = False
+    for field, wire_type, value in _iter_fields(data):
+        if field == 1 and isinstance(value, tuple):
+            pattern = data[value[0]:value[1]].decode('utf-8')
+        elif field == 2 and wire_type == _WIRE_VARINT:
+            reset = bool(value)
+    return pattern, reset
+
+
+def encode_query_stats_response(stats: Iterable[Stats]) -> bytes:
+    message = bytearray()
+    for stat in stats:
+        stat_message = bytearray()
+        _write_bytes_field(stat_message, 1, stat.name.encode('utf-8'))
+        if stat.value:
+            _write_varint(stat_message, 2 << 3 | _WIRE_VARINT)
+            _write_varint(stat_message, stat.value % _UINT64_RANGE)
+        _write_bytes_field(message, 1, bytes(stat_message))
+    return bytes(message)
+
+
+def decode_query_stats_response(data: bytes) -> list[Stats]:
+    return [Stats(name=name, value=value) for name, value in iter_query_stats_response(data)]
+
+
+def iter_query_stats_response(data: bytes) -> Iterator[tuple[str, int]]:
+    data = bytes(data)
+    for field, _, value in _iter_fields(data):
+        if field == 1 and isinstance(value, tuple):
+            yield _decode_stat(data, *value)
+
+
+def encode_add_user_request(inbound_tag: str, email: str, account_id: str, flow: str = '') -> bytes:
+    # Xray parses the account id on its side, so ids which are not UUIDs are passed as they are
+    account = bytearray()
+    _write_string_field(account, 1, account_id)
+    _write_string_field(account, 2, flow)
+    user = bytearray()
+    _write_string_field(user, 2, email)
+    _write_bytes_field(user, 3, _encode_typed_message(_VLESS_ACCOUNT_TYPE, account))
+    operation = bytearray()
+    _write_bytes_field(operation, 1, bytes(user))
+    return _encode_alter_inbound_request(
+        inbound_tag, _encode_typed_message(_ADD_USER_OPERATION_TYPE, operation))
+
+
+def encode_remove_user_request(inbound_tag: str, email: str) -> bytes:
+    operation = bytearray()
+    _write_string_field(operation, 1, email)
+    return _encode_alter_inbound_request(
+        inbound_tag, _encode_typed_message(_REMOVE_USER_OPERATION_TYPE, operation))
+
+
+def encode_add_rule_request(config: bytes, append: bool = False) -> bytes:
+    message = bytearray()
+    _write_bytes_field(message, 1, _encode_typed_message(_ROUTER_CONFIG_TYPE, config))
+    if append:
+        _write_varint(message, 2 << 3 | _WIRE_VARINT)
+        _write_varint(message, 1)
+    return bytes(message)
+
+
+def encode_router_config(rules: Iterable[dict[str, Any]], geo_ip_path: Path, geo_site_path: Path) -> bytes:
+    # Rules are given in the JSON config format and are built like `xray api adrules` does,
+    # geoip: and geosite: entries are resolved from the local geodata files
+    geo_files: dict[Path, bytes] = {}
+
+    def load_geo_file(path: Path) -> bytes:
+        if path not in geo_files:
+            geo_files[path] = path.read_bytes()
+        return geo_files[path]
+
+    config = bytearray()
+    for rule in rules:
+        _write_bytes_field(config, 2, _encode_routing_rule(rule, geo_ip_path, geo_site_path, load_geo_file))
+    return bytes(config)
+
+
+def _encode_routing_rule(
+        rule: dict[str, Any],
+        geo_ip_path: Path,
+        geo_site_path: Path,
+        load_geo_file: Callable[[Path], bytes]) -> bytes:
+    message = bytearray()
+    _write_string_field(message, 1, rule.get('outboundTag', ''))
+    for domain in rule.get('domain') or []:
+        if domain.startswith('geosite:'):
+            for domain_message in _iter_geo_site_domains(load_geo_file(geo_site_path), domain[8:]):
+                _write_bytes_field(message, 2, domain_message)
+        else:
+            _write_bytes_field(message, 2, _encode_domain(domain))
+    for geo_ip in _encode_geo_ips(rule.get('ip') or [], geo_ip_path, load_geo_file):
+        _write_bytes_field(message, 10, geo_ip)
+    for email in rule.get('user') or []:
+        _write_string_field(message, 7, email)
+    for protocol in rule.get('protocol') or []:
+        _write_string_field(message, 9, protocol)
+    if rule.get('port'):
+        _write_bytes_field(message, 14, _encode_port_list(str(rule['port'])))
+    return bytes(message)
+
+
+def _encode_domain(domain: str) -> bytes:
+    if domain.startswith('ext:'):
+        raise ValueError(f'Unsupported routing domain: {domain}')
+    domain_type, value = 0, domain
+    for prefix, prefix_type in _DOMAIN_TYPES.items():
+        if domain.startswith(prefix):
+            domain_type, value = prefix_type, domain[len(prefix):]
+            break
+    message = bytearray()
+    if domain_type:
+        _write_varint(message, 1 << 3 | _WIRE_VARINT)
+        _write_varint(message, domain_type)
+    _write_string_field(message, 2, value)
+    return bytes(message)
+
+
+def _encode_geo_ips(ips: list[str], geo_ip_path: Path, load_geo_file: Callable[[Path], bytes]) -> list[bytes]:
+    geo_ips: list[bytes] = []
+    custom = bytearray()
+    for ip in ips:
+        if ip.startswith('geoip:'):
+            code, reverse_match = ip[6:], ip.startswith('geoip:!')
+            geo_ips.append(_encode_geo_ip(load_geo_file(geo_ip_path), code.lstrip('!'), reverse_match))
+        else:
+            _write_bytes_field(custom, 2, _encode_cidr(ip))
+    if custom:
+        geo_ips.append(bytes(custom))
+    return geo_ips
+
+
+def _encode_geo_ip(geo_ip_data: bytes, code: str, reverse_match: bool) -> bytes:
+    start, end = _find_geo_entry(geo_ip_data, code)
+    message = bytearray()
+    _write_string_field(message, 1, code.upper())
+    for field, _, value in _iter_fields(geo_ip_data, start, end):
+        if field == 2 and isinstance(value, tuple):
+            _write_bytes_field(message, 2, geo_ip_data[value[0]:value[1]])
+    if reverse_match:
+        _write_varint(message, 3 << 3 | _WIRE_VARINT)
+        _write_varint(message, 1)
+    return bytes(message)
+
+
+def _encode_cidr(ip: str) -> bytes:
+    address, _, prefix = ip.partition('/')
+    try:
+        packed = ip_address(address).packed
+    except ValueError as e:
+        raise ValueError(f'Unsupported routing IP: {ip}') from e
+    bits = int(prefix) if prefix else len(packed) * 8
+    if not 0 <= bits <= len(packed) * 8:
+        raise ValueError(f'Invalid routing IP prefix: {ip}')
+    message = bytearray()
+    _write_bytes_field(message, 1, packed)
+    if bits:
+        _write_varint(message, 2 << 3 | _WIRE_VARINT)
+        _write_varint(message, bits)
+    return bytes(message)
+
+
+def _encode_port_list(ports: str) -> bytes:
+    message = bytearray()
+    for port_range in ports.split(','):
+        first, _, last = port_range.strip().partition('-')
+        port_from = int(first)
+        port_to = int(last) if last else port_from
+        range_message = bytearray()
+        for field, port in ((1, port_from), (2, port_to)):
+            if port:
+                _write_varint(range_message, field << 3 | _WIRE_VARINT)
+                _write_varint(range_message, port)
+        _write_bytes_field(message, 1, bytes(range_message))
+    return bytes(message)
+
+
+def _iter_geo_site_domains(geo_site_data: bytes, site: str) -> Iterator[bytes]:
+    code, *attributes = site.split('@')
+    required = {attribute.lower() for attribute in attributes if not attribute.startswith('!')}
+    excluded = {attribute[1:].lower() for attribute in attributes if attribute.startswith('!')}
+    start, end = _find_geo_entry(geo_site_data, code)
+    for field, _, value in _iter_fields(geo_site_data, start, end):
+        if field != 2 or not isinstance(value, tuple):
+            continue
+        if required or excluded:
+            domain_attributes = {
+                _get_string_field(geo_site_data, *attribute, field=1).lower()
+                for attribute_field, _, attribute in _iter_fields(geo_site_data, *value)
+                if attribute_field == 3 and isinstance(attribute, tuple)}
+            if not required <= domain_attributes or excluded & domain_attributes:
+                continue
+        yield geo_site_data[value[0]:value[1]]
+
+
+def _find_geo_entry(data: bytes, code: str) -> tuple[int, int]:
+    code = code.upper()
+    for field, _, value in _iter_fields(data):
+        if field != 1 or not isinstance(value, tuple):
+            continue
+        if _get_string_field(data, *value, field=1).upper() == code:
+            return value
+    raise ValueError(f'Geodata entry {code} not found')
+
+
+def _get_string_field(data: bytes, start: int, end: int, field: int) -> str:
+    for entry_field, _, value in _iter_fields(data, start, end):
+        if entry_field == field and isinstance(value, tuple):
+            return data[value[0]:value[1]].decode('utf-8')
+    return ''
+
+
+def _encode_alter_inbound_request(inbound_tag: str, operation: bytes) -> bytes:
+    message = bytearray()
+    _write_string_field(message, 1, inbound_tag)
+    _write_bytes_field(message, 2, operation)
+    return bytes(message)
+
+
+def _encode_typed_message(message_type: str, value: bytes | bytearray) -> bytes:
+    message = bytearray()
+    _write_string_field(message, 1, message_type)
+    if value:
+        _write_bytes_field(message, 2, bytes(value))
+    return bytes(message)
+
+
+def _decode_stat(data: bytes, start: int, end: int) -> tuple[str, int]:
+    name = ''
+    counter = 0
+    position = start
+    while position < end:
+        key, position = _read_varint(data, position)
+        wire_type = key & 7
+        if key == 1 << 3 | _WIRE_LENGTH_DELIMITED:
+            length, position = _read_varint(data, position)
+            if position + length > end:
+                raise ValueError('Truncated protobuf message')
+            name = data[position:position + length].decode('utf-8')
+            position += length
+        elif key == 2 << 3 | _WIRE_VARINT:
+            counter, position = _read_varint(data, position)
+            if counter >= _INT64_SIGN:
+                counter -= _UINT64_RANGE
+        else:
+            position = _skip_field(data, position, wire_type)
+    if position > end:
+        raise ValueError('Truncated protobuf message')
+    return name, counter
+
+
+def _iter_fields(
+        data: bytes,
+        start: int = 0,
+        end: int | None = None) -> Iterator[tuple[int, int, int | tuple[int, int]]]:
+    size = len(data) if end is None else end
+    position = start
+    while position < size:
+        key, position = _read_varint(data, position)
+        wire_type = key & 7
+        if wire_type == _WIRE_VARINT:
+            value, position = _read_varint(data, position)
+            yield key >> 3, wire_type, value
+        elif wire_type == _WIRE_LENGTH_DELIMITED:
+            length, position = _read_varint(data, position)
+            if position + length > size:
+                raise ValueError('Truncated protobuf message')
+            yield key >> 3, wire_type, (position, position + length)
+            position += length
+        else:
+            position = _skip_field(data, position, wire_type)
+
+
+def _skip_field(data: bytes, position: int, wire_type: int) -> int:
+    if wire_type == _WIRE_VARINT:
+        return _read_varint(data, position)[1]
+    if wire_type == _WIRE_LENGTH_DELIMITED:
+        length, position = _read_varint(data, position)
+        return position + length
+    if wire_type == _WIRE_FIXED64:
+        return position + 8
+    if wire_type == _WIRE_FIXED32:
+        return position + 4
+    raise ValueError(f'Unsupported protobuf wire type: {wire_type}')
+
+
+def _read_varint(data: bytes, position: int) -> tuple[int, int]:
+    try:
+        byte = data[position]
+        if byte < 0x80:
+            return byte, position + 1
+        result = byte & 0x7F
+        shift = 7
+        while True:
+            position += 1
+            byte = data[position]
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result, position + 1
+            shift += 7
+            if shift > 63:
+                raise ValueError('Malformed protobuf varint')
+    except IndexError as e:
+        raise ValueError('Truncated protobuf varint') from e
+
+
+def _write_varint(message: bytearray, value: int) -> None:
+    while value > 0x7F:
+        message.append(value & 0x7F | 0x80)
+        value >>= 7
+    message.append(value)
+
+
+def _write_bytes_field(message: bytearray, field: int, value: bytes) -> None:
+    _write_varint(message, field << 3 | _WIRE_LENGTH_DELIMITED)
+    _write_varint(message, len(value))
+    message.extend(value)
+
+
+def _write_string_field(message: bytearray, field: int, value: str) -> None:
+    if value:
+        _write_bytes_field(message, field, value.encode('utf-8'))
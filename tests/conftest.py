@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from pytest import fixture
+from pytest_mock import MockFixture
+
+from app.controller.common import load_config
+from app.model.xray import Xray
+
+
+@fixture(name='managed_config_path')
+def fixture_managed_config_path(tmp_path: Path, mocker: MockFixture) -> Path:
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(
+        Path('tests/resources/valid_xray_config_with_clients.json').read_text(encoding='utf-8'),
+        encoding='utf-8')
+    mocker.patch('app.controller.common.XRAY_CONFIG_PATH', config_path)
+    mocker.patch('app.controller.common.XRAY_CONFIG_BACKUP_PATH', tmp_path / 'config.json.bak')
+    mocker.patch('app.controller.common.get_config_problems', return_value=[])
+    mocker.patch('app.controller.common.stdout_console.print')
+    mocker.patch('app.controller.common.stderr_console.print')
+    return config_path
+
+
+@fixture(name='clients_config')
+def fixture_clients_config() -> Xray:
+    config = load_config(Path('tests/resources/valid_xray_config_with_clients.json'))
+    inbound = config.get_vless_inbound()
+    if inbound and inbound.settings.clients:
+        inbound.settings.clients[0].id = '12345678-1234-5678-1234-567812345678'
+    return config
+
+
+@fixture(name='loaded_config')
+def fixture_loaded_config(clients_config: Xray, mocker: MockFixture) -> Xray:
+    mocker.patch('app.controller.common.load_config', return_value=clients_config)
+    mocker.patch('app.controller.common.stdout_console.print')
+    return clients_config
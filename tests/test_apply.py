@@ -0,0 +1,103 @@
+from pathlib import Path
+from typing import Any
+
+from pytest import fixture, mark, raises
+from pytest_mock import MockFixture
+from typer import Exit
+
+from app.controller import common
+from app.controller.common import load_config
+from app.controller.commands.apply import apply_state, get_state_operations
+from app.controller.commands.batch import run_batch_operations, to_batch_operations
+from app.controller.commands.routing import get_routing_view
+from app.defaults import EXIT_APPLY_INVALID_STATE
+from app.model.state import State
+from app.model.xray import Xray
+
+
+class TestApplyState:
+
+    @fixture(name='state_config')
+    def fixture_state_config(self, loaded_config: Xray, mocker: MockFixture) -> Xray:
+        for module in ('apply', 'clients', 'routing', 'outbound'):
+            mocker.patch(f'app.controller.commands.{module}.check_root')
+            mocker.patch(f'app.controller.commands.{module}.check_xray_config')
+        mocker.patch('app.controller.commands.apply.load_config', return_value=loaded_config)
+        mocker.patch('app.controller.commands.routing.install_geo_data')
+        return loaded_config
+
+    @staticmethod
+    def _get_state(**sections: Any) -> State:
+        return State.model_validate({
+            'clients': ['c1.client', {'name': 'dave', 'disabled': True}],
+            'rules': [{'name': 'dave-direct', 'outbound': 'nl', 'client': ['dave']},
+                      {'name': 'ads', 'outbound': 'blackhole', 'domain': ['domain:example.com'],
+                       'priority': 5}],
+            'outbounds': [{'name': 'nl', 'address': '1.2.3.4', 'uuid': '12345678-1234-5678-1234-567812345678',
+                           'sni': 'example.com', 'short_id': 'ab', 'password': 'key'}],
+            **sections})
+
+    def test_applies_state_and_converges(self, state_config: Xray, mocker: MockFixture):
+        commit_mock = mocker.patch('app.controller.commands.batch.commit_batch', return_value=True)
+        state = self._get_state()
+        records = get_state_operations(state_config, state)
+
+        run_batch_operations(to_batch_operations(enumerate(records, start=1)), True, state_config)
+
+        commit_mock.assert_called_once_with(state_config)
+        assert get_state_operations(state_config, state) == []
+        routing_view = get_routing_view(state_config)
+        assert [(rule.name, rule.outbound_name) for rule in routing_view.rules or []
+                if rule.priority >= 0] == [('ads', 'blackhole'), ('dave-direct', 'nl')]
+
+    @mark.usefixtures('state_config')
+    def test_unchanged_state_is_noop(self, mocker: MockFixture):
+        run_mock = mocker.patch('app.controller.commands.apply.run_batch_operations')
+        mocker.patch('app.controller.commands.apply._read_state', return_value=State())
+
+        apply_state(file='state.json', _debug=True)
+
+        run_mock.assert_not_called()
+
+    def test_changed_outbound_and_rule_make_minimal_diff(self, state_config: Xray, mocker: MockFixture):
+        mocker.patch('app.controller.commands.batch.commit_batch', return_value=True)
+        state = self._get_state()
+        records = get_state_operations(state_config, state)
+        run_batch_operations(to_batch_operations(enumerate(records, start=1)), True, state_config)
+        assert state.rules is not None and state.outbounds is not None
+        state.outbounds[0].port = 8443
+        state.rules[1].domain = ['domain:example.org']
+
+        records = get_state_operations(state_config, state)
+
+        assert [(record['command'], record['name']) for record in records] == [
+            ('routing remove-rule', 'ads'), ('outbounds change', 'nl'), ('routing add-rule', 'ads')]
+
+    def test_new_client_is_not_applied_live(self, state_config: Xray, mocker: MockFixture):
+        mocker.patch('app.controller.commands.batch.commit_batch', return_value=True)
+        applied_config = load_config(Path('tests/resources/valid_xray_config_with_clients.json'))
+        mocker.patch('app.controller.common._load_applied_config', return_value=applied_config)
+        add_mock = mocker.patch('app.controller.common.add_xray_inbound_users')
+        backup_mock = mocker.patch('app.controller.common.backup_config')
+        records = get_state_operations(state_config, State(clients=['c1.client', 'erin']))
+
+        run_batch_operations(to_batch_operations(enumerate(records, start=1)), True, state_config)
+
+        assert common._apply_live_changes(state_config) is False  # pylint: disable=protected-access
+        add_mock.assert_not_called()
+        backup_mock.assert_not_called()
+
+    def test_sections_absent_from_state_are_not_managed(self, state_config: Xray):
+        assert get_state_operations(state_config, State(clients=['c1.client'])) == []
+
+    def test_invalid_state_file(self, tmp_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.commands.apply.check_root')
+        mocker.patch('app.controller.commands.apply.check_xray_config')
+        mocker.patch('app.controller.commands.apply.print_error')
+        state_path = tmp_path / 'state.json'
+        state_path.write_text('{"clients": ["a"], "rules": [{"name": "r"}]}', encoding='utf-8')
+
+        with raises(Exit) as exc_info:
+            apply_state(file=str(state_path), _debug=True)
+
+        assert exc_info.value.exit_code == EXIT_APPLY_INVALID_STATE
@@ -0,0 +1,138 @@
+import json
+from pathlib import Path
+
+from pytest import fixture, mark, raises
+from pytest_mock import MockFixture
+from typer import Exit
+
+from app.controller import common
+from app.controller.common import commit_batch, load_config, open_batch
+from app.controller.commands.batch import batch
+from app.defaults import (
+    DISABLED_CLIENTS_RULE_NAME,
+    DISABLED_CLIENTS_RULE_PRIORITY,
+    EXIT_BATCH_INVALID_OPERATION,
+    EXIT_CLIENTS_ERROR,
+)
+from app.model.xray import Xray
+
+
+class TestBatch:
+
+    @fixture(name='batch_config')
+    def fixture_batch_config(self, loaded_config: Xray, mocker: MockFixture) -> Xray:
+        for module in ('batch', 'clients', 'routing'):
+            mocker.patch(f'app.controller.commands.{module}.check_root')
+            mocker.patch(f'app.controller.commands.{module}.check_xray_config')
+        mocker.patch('app.controller.commands.routing.install_geo_data')
+        mocker.patch('app.controller.commands.batch.print_error')
+        return loaded_config
+
+    @staticmethod
+    def _write_operations(tmp_path: Path, *operations: dict) -> str:
+        operations_path = tmp_path / 'ops.ndjson'
+        operations_path.write_text(
+            '# operations\n' + '\n'.join(json.dumps(operation) for operation in operations), encoding='utf-8')
+        return str(operations_path)
+
+    def test_applies_operations_to_one_model_and_commits_once(
+            self, batch_config: Xray, tmp_path: Path, mocker: MockFixture):
+        write_mock = mocker.patch('app.controller.common.write_text_file')
+        apply_mock = mocker.patch('app.controller.common.add_xray_inbound_users')
+        commit_mock = mocker.patch('app.controller.commands.batch.commit_batch', return_value=True)
+        operations_file = self._write_operations(
+            tmp_path,
+            {'command': 'clients add', 'client_names': ['new1', 'new2']},
+            {'command': 'clients disable', 'client-names': 'new2'},
+            {'command': 'routing add-rule', 'name': 'blocked', 'outbound': 'blackhole',
+             'domain': ['domain:example.com']})
+
+        batch(file=operations_file, _debug=True)
+
+        write_mock.assert_not_called()
+        apply_mock.assert_not_called()
+        commit_mock.assert_called_once_with(batch_config)
+        inbound = batch_config.get_vless_inbound()
+        assert inbound is not None and inbound.settings.clients is not None
+        assert [client.email.split('.')[0] for client in inbound.settings.clients][-2:] == ['new1', 'new2']
+        assert batch_config.routing is not None and batch_config.routing.rules is not None
+        rule_tags = [rule.tag for rule in batch_config.routing.rules]
+        assert f'{DISABLED_CLIENTS_RULE_NAME}.{DISABLED_CLIENTS_RULE_PRIORITY}' in rule_tags
+        assert 'blocked.50' in rule_tags
+
+    @mark.usefixtures('batch_config')
+    def test_failed_operation_discards_all_changes(self, tmp_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.commands.clients.print_error')
+        commit_mock = mocker.patch('app.controller.commands.batch.commit_batch')
+        operations_file = self._write_operations(
+            tmp_path,
+            {'command': 'clients add', 'client_names': ['new1']},
+            {'command': 'clients disable', 'client_names': ['missing']})
+
+        with raises(Exit) as exc_info:
+            batch(file=operations_file, _debug=True)
+
+        assert exc_info.value.exit_code == EXIT_CLIENTS_ERROR
+        commit_mock.assert_not_called()
+
+    @mark.usefixtures('batch_config')
+    def test_invalid_operation_fails_before_changes(self, tmp_path: Path, mocker: MockFixture):
+        open_mock = mocker.patch('app.controller.commands.batch.open_batch')
+        for operation in ({'command': 'clients list'},
+                          {'command': 'clients add', 'unknown': 1},
+                          {'command': 'routing change-rule', 'name': 'x', 'action': 'move'},
+                          {'command': 'routing remove-rule'}):
+            with raises(Exit) as exc_info:
+                batch(file=self._write_operations(tmp_path, operation), _debug=True)
+            assert exc_info.value.exit_code == EXIT_BATCH_INVALID_OPERATION, operation
+        open_mock.assert_not_called()
+
+    def test_batch_is_closed_after_failure(self, batch_config: Xray, managed_config_path: Path):
+        with raises(ValueError):
+            with open_batch():
+                assert load_config(managed_config_path) is batch_config
+                raise ValueError('failed')
+
+        assert load_config(managed_config_path) is not batch_config
+
+
+class TestCommitBatch:
+
+    @mark.usefixtures('managed_config_path')
+    def test_unchanged_config_is_not_saved_or_tested(self, mocker: MockFixture):
+        test_mock = mocker.patch('app.controller.common.validate_xray_config')
+
+        with open_batch() as xray_config:
+            pass
+
+        assert commit_batch(xray_config) is False
+        test_mock.assert_not_called()
+
+    def test_saves_tests_and_restarts_once(self, managed_config_path: Path, mocker: MockFixture):
+        save_mock = mocker.spy(common, 'save_config')
+        test_mock = mocker.patch('app.controller.common.validate_xray_config', return_value=(True, ''))
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
+        restart_mock = mocker.patch('app.controller.common.restart_service')
+
+        with open_batch() as xray_config:
+            xray_config.outbounds.reverse()
+
+        assert commit_batch(xray_config) is True
+        save_mock.assert_called_once()
+        test_mock.assert_called_once()
+        restart_mock.assert_called_once_with(test_config=False)
+        assert load_config(managed_config_path).outbounds == xray_config.outbounds
+
+    def test_restores_config_when_test_failed(self, managed_config_path: Path, mocker: MockFixture):
+        original_content = managed_config_path.read_bytes()
+        mocker.patch('app.controller.common.validate_xray_config', return_value=(False, 'bad config'))
+        mocker.patch('app.controller.common.print_error')
+        restart_mock = mocker.patch('app.controller.common.restart_service')
+
+        with open_batch() as xray_config:
+            xray_config.outbounds.reverse()
+
+        with raises(RuntimeError):
+            commit_batch(xray_config)
+        assert managed_config_path.read_bytes() == original_content
+        restart_mock.assert_not_called()
@@ -0,0 +1,167 @@
+import os
+import subprocess
+import sys
+from importlib import import_module
+from pathlib import Path
+
+from click import Command, Context, Group
+from click.shell_completion import BashComplete
+from pytest import fixture, mark
+from pytest_mock import MockFixture
+from typer.main import get_command, get_group
+from typer.testing import CliRunner
+
+from app.cli import _COMMAND_MODULES, app
+from app.completion_index import CompletionIndex, write_completion_index
+from app.controller.completions import get_completion_commands
+
+# Startup budget in milliseconds of cumulative import time, about 5x of the measured values
+_IMPORT_BUDGETS = {
+    'app.main': 250,
+    'app.controller.completions': 250,
+    'app.controller.commands.state': 2000,
+}
+_HEAVY_MODULES = ('pydantic', 'rich', 'requests', 'grpc', 'app.model.xray', 'app.controller.common',
+                  'app.controller.commands.clients')
+
+
+def _run(code: str, env: dict[str, str] | None = None) -> str:
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            env=env and {**os.environ, **env})
+    return result.stdout.strip()
+
+
+def _get_loaded_modules(
+        args: list[str], setup: str = '', env: dict[str, str] | None = None) -> tuple[str, set[str]]:
+    output = _run(
+        'import sys\n'
+        f'{setup}\n'
+        'from app.main import typer_app\n'
+        'try:\n'
+        f'    typer_app({args!r}, prog_name="xrayctl")\n'
+        'except SystemExit:\n'
+        '    pass\n'
+        f'print("modules:" + ",".join(m for m in {_HEAVY_MODULES!r} if m in sys.modules))\n', env)
+    output, _, modules = output.rpartition('modules:')
+    return output.strip(), set(filter(None, modules.split(',')))
+
+
+def _describe(command: Command) -> list[tuple]:
+    return [(param.param_type_name, param.name, param.opts, param.secondary_opts, param.nargs, param.multiple,
+             getattr(param, 'is_flag', False), getattr(param, 'hidden', False), param.type.to_info_dict(),
+             [item.value for item in param.shell_complete(Context(command), '')])
+            for param in command.params]
+
+
+def _get_import_time(module: str) -> float:
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        if line.rstrip().endswith(f'| {module}'):
+            return int(line.split('|')[1]) / 1000
+    raise AssertionError(f'No import time for {module}')
+
+
+class TestLazyCommands:
+
+    def test_version_imports_no_commands(self):
+        assert not _get_loaded_modules(['--version'])[1]
+
+    def test_status_does_not_import_requests(self):
+        _, loaded = _get_loaded_modules(['status', '--help'])
+
+        assert 'app.controller.common' in loaded
+        assert 'requests' not in loaded
+
+    def test_help_lists_all_commands(self):
+        result = CliRunner().invoke(app, ['--help'])
+
+        assert result.exit_code == 0
+        for name in ('config', 'status', 'exporter', 'top', 'clients', 'routing', 'outbounds', 'stats',
+                     'batch', 'apply', 'serve'):
+            assert name in result.output
+
+    def test_subgroup_commands_loaded(self):
+        result = CliRunner().invoke(app, ['routing', '--help'])
+
+        assert result.exit_code == 0
+        assert 'change-rule' in result.output
+
+    def test_command_modules_match_registered_commands(self):
+        for module_name in set(_COMMAND_MODULES.values()):
+            import_module(module_name)
+
+        commands = get_group(app).commands
+
+        assert set(commands) == set(_COMMAND_MODULES)
+        for name, command in commands.items():
+            subcommands = command.commands.values() if isinstance(command, Group) else [command]
+            assert {subcommand.callback.__module__ for subcommand in subcommands
+                    if subcommand.callback} == {_COMMAND_MODULES[name]}, name
+
+    def test_unknown_command(self):
+        result = CliRunner().invoke(app, ['unknown'])
+
+        assert result.exit_code != 0
+
+
+class TestStartupBudget:
+
+    @mark.parametrize('module', _IMPORT_BUDGETS)
+    def test_import_time_within_budget(self, module: str):
+        assert _get_import_time(module) < _IMPORT_BUDGETS[module]
+
+    def test_completion_imports_no_heavy_modules(self, tmp_path: Path):
+        config_path = tmp_path / 'config.json'
+        config_path.write_text('{}', encoding='utf-8')
+        write_completion_index(config_path, b'{}', CompletionIndex(clients=['alice', 'bob']))
+
+        output, loaded = _get_loaded_modules(
+            [],
+            'from pathlib import Path\n'
+            'from app.controller import completions\n'
+            f'completions.XRAY_CONFIG_PATH = Path({str(config_path)!r})',
+            {'_XRAYCTL_COMPLETE': 'complete_bash', 'COMP_WORDS': 'xrayctl clients remove a',
+             'COMP_CWORD': '3'})
+
+        assert output.splitlines() == ['alice']
+        assert not loaded
+
+
+class TestCompletionCommands:
+
+    @fixture(name='completion_index')
+    def fixture_completion_index(self, mocker: MockFixture) -> CompletionIndex:
+        index = CompletionIndex(
+            clients=['alice'], rules=['ads'], outbounds=[('nl', 'vless'), ('direct', 'freedom')])
+        mocker.patch('app.controller.completions.read_completion_index', return_value=index)
+        return index
+
+    @mark.usefixtures('completion_index')
+    @mark.parametrize('group_name', ['clients', 'routing', 'outbounds', 'stats'])
+    def test_match_real_commands(self, group_name: str):
+        root = get_command(app)
+        group = root.get_command(Context(root), group_name)
+        assert isinstance(group, Group)
+
+        completion_commands = get_completion_commands(group_name)
+
+        assert completion_commands
+        for name, command in completion_commands.items():
+            real_command = group.get_command(Context(group), name)
+            assert real_command is not None and _describe(command) == _describe(real_command), name
+
+    @mark.usefixtures('completion_index')
+    @mark.parametrize('args, incomplete, expected', [
+        (['clients', 'remove'], '', ['alice']),
+        (['routing', 'add-rule', 'rule', '--domain', 'example.com', '--outbound'], '', ['nl', 'direct']),
+        (['routing', 'change-rule', 'ads'], '', ['put', 'del']),
+        (['outbounds', 'change', '--debug'], '', ['nl']),
+    ])
+    def test_completes_without_command_modules(
+            self, args: list[str], incomplete: str, expected: list[str], mocker: MockFixture):
+        import_mock = mocker.patch('app.cli.import_module')
+        complete = BashComplete(get_command(app), {}, 'xrayctl', '_XRAYCTL_COMPLETE')
+
+        assert [item.value for item in complete.get_completions(args, incomplete)] == expected
+        import_mock.assert_not_called()
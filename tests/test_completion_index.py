@@ -0,0 +1,66 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from pytest_mock import MockFixture
+
+from app.completion_index import (
+    CompletionIndex,
+    get_completion_index_path,
+    read_completion_index,
+    write_completion_index,
+)
+from app.controller.common import load_config, save_config
+
+CONFIG_PATH = Path('tests/resources/completions_xray_config.json')
+
+
+class TestCompletionIndex:
+
+    def test_write_and_read(self, tmp_path: Path):
+        config_path = tmp_path / 'config.json'
+        config_path.write_bytes(b'{}')
+        index = CompletionIndex(
+            clients=['c1'], rules=['rule'], outbounds=[('vless', 'vless'), ('direct', None)])
+
+        assert write_completion_index(config_path, b'{}', index)
+
+        assert get_completion_index_path(config_path).name == '.config.json.completion'
+        assert read_completion_index(config_path) == index
+
+    def test_read_outdated(self, tmp_path: Path):
+        config_path = tmp_path / 'config.json'
+        write_completion_index(config_path, b'{}', CompletionIndex(clients=['c1']))
+        config_path.write_bytes(b'{"log": {}}')
+
+        assert read_completion_index(config_path) is None
+
+    def test_read_missing(self, tmp_path: Path):
+        config_path = tmp_path / 'config.json'
+        config_path.write_bytes(b'{}')
+
+        assert read_completion_index(config_path) is None
+
+    def test_write_failed(self, tmp_path: Path):
+        assert not write_completion_index(tmp_path / 'missing' / 'config.json', b'{}', CompletionIndex())
+
+    def test_save_config_writes_index(self, tmp_path: Path, mocker: MockFixture):
+        config_path = tmp_path / 'config.json'
+        mocker.patch('app.controller.common.XRAY_CONFIG_PATH', config_path)
+
+        save_config(load_config(CONFIG_PATH), config_path)
+
+        index = read_completion_index(config_path)
+        assert index is not None
+        assert index.clients == ['c1.client']
+        assert 'protocol' in index.rules
+        assert ('vless', 'vless') in index.outbounds
+
+    def test_minimal_imports(self):
+        code = ('import sys; import app.controller.completions; '
+                'print(",".join(m for m in ("pydantic", "rich", "requests", "app.model.xray")'
+                ' if m in sys.modules))')
+
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+
+        assert result.stdout.strip() == ''
@@ -1,3 +1,4 @@
+import inspect
 from pathlib import Path
 from unittest.mock import MagicMock
 
@@ -10,7 +11,8 @@ from app.controller.completions import (
     complete_outbound_name,
     complete_vless_outbound_name,
 )
-from app.controller.common import load_config
+from app.controller.common import get_completion_index, load_config
+from app.model.xray import Xray
 
 CONFIG_PATH = Path('tests/resources/completions_xray_config.json')
 CONFIG_EMPTY_PATH = Path('tests/resources/valid_xray_config.json')
@@ -20,55 +22,78 @@ def _ctx() -> Context:
     return MagicMock(spec=Context)
 
 
+def _patch_index(mocker: MockFixture, config: Xray) -> None:
+    mocker.patch('app.controller.completions.read_completion_index', return_value=get_completion_index(config))
+
+
 class TestCompleteClientName:
 
     def test_returns_matching_client(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_client_name(_ctx(), [], 'c1'))
         assert results == ['c1.client']
 
     def test_empty_incomplete_returns_all_clients(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_client_name(_ctx(), [], ''))
         assert results == ['c1.client']
 
     def test_no_match_returns_empty(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_client_name(_ctx(), [], 'zzz'))
         assert not results
 
     def test_no_clients_returns_empty(self, mocker: MockFixture):
         config = load_config(CONFIG_EMPTY_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_client_name(_ctx(), [], ''))
         assert not results
 
     def test_load_error_returns_empty(self, mocker: MockFixture):
-        mocker.patch('app.controller.completions.load_config', side_effect=FileNotFoundError)
+        mocker.patch('app.controller.completions.read_completion_index', return_value=None)
+        mocker.patch('app.controller.common.load_config', side_effect=FileNotFoundError)
 
         results = list(complete_client_name(_ctx(), [], ''))
         assert not results
 
 
+    def test_index_missing_loads_config(self, mocker: MockFixture):
+        mocker.patch('app.controller.completions.read_completion_index', return_value=None)
+        load_config_mock = mocker.patch(
+            'app.controller.common.load_config', return_value=load_config(CONFIG_PATH))
+
+        results = list(complete_client_name(_ctx(), [], ''))
+        assert results == ['c1.client']
+        load_config_mock.assert_called_once()
+
+    def test_index_does_not_load_config(self, mocker: MockFixture):
+        _patch_index(mocker, load_config(CONFIG_PATH))
+        load_config_mock = mocker.patch('app.controller.common.load_config')
+
+        results = list(complete_client_name(_ctx(), [], ''))
+        assert results == ['c1.client']
+        load_config_mock.assert_not_called()
+
+
 class TestCompleteRouteName:
 
     def test_returns_matching_route(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_route_name(_ctx(), [], 'protocol'))
         assert 'protocol' in results
 
     def test_empty_incomplete_returns_all_routes(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_route_name(_ctx(), [], ''))
         assert config.routing is not None
@@ -77,13 +102,14 @@ class TestCompleteRouteName:
 
     def test_no_match_returns_empty(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_route_name(_ctx(), [], 'nonexistent_xyz'))
         assert not results
 
     def test_load_error_returns_empty(self, mocker: MockFixture):
-        mocker.patch('app.controller.completions.load_config', side_effect=RuntimeError('fail'))
+        mocker.patch('app.controller.completions.read_completion_index', return_value=None)
+        mocker.patch('app.controller.common.load_config', side_effect=RuntimeError('fail'))
 
         results = list(complete_route_name(_ctx(), [], ''))
         assert not results
@@ -93,7 +119,7 @@ class TestCompleteOutboundName:
 
     def test_returns_all_outbound_tags_for_empty_incomplete(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = set(complete_outbound_name(_ctx(), [], ''))
         expected_tags = {
@@ -105,7 +131,7 @@ class TestCompleteOutboundName:
 
     def test_filters_by_prefix(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_outbound_name(_ctx(), [], 'vl'))
         assert results
@@ -113,13 +139,14 @@ class TestCompleteOutboundName:
 
     def test_no_match_returns_empty(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_outbound_name(_ctx(), [], 'zzz_not_existing'))
         assert not results
 
     def test_load_error_returns_empty(self, mocker: MockFixture):
-        mocker.patch('app.controller.completions.load_config', side_effect=FileNotFoundError)
+        mocker.patch('app.controller.completions.read_completion_index', return_value=None)
+        mocker.patch('app.controller.common.load_config', side_effect=FileNotFoundError)
 
         results = list(complete_outbound_name(_ctx(), [], ''))
         assert not results
@@ -129,7 +156,7 @@ class TestCompleteVlessOutboundName:
 
     def test_returns_only_vless_outbounds(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_vless_outbound_name(_ctx(), [], ''))
         assert 'vless' in results
@@ -138,7 +165,7 @@ class TestCompleteVlessOutboundName:
 
     def test_filters_vless_by_prefix(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_vless_outbound_name(_ctx(), [], 'vl'))
         assert results
@@ -146,20 +173,29 @@ class TestCompleteVlessOutboundName:
 
     def test_non_vless_prefix_returns_empty(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_vless_outbound_name(_ctx(), [], 'direct'))
         assert not results
 
     def test_no_outbounds_match_prefix(self, mocker: MockFixture):
         config = load_config(CONFIG_PATH)
-        mocker.patch('app.controller.completions.load_config', return_value=config)
+        _patch_index(mocker, config)
 
         results = list(complete_vless_outbound_name(_ctx(), [], 'zzz'))
         assert not results
 
     def test_load_error_returns_empty(self, mocker: MockFixture):
-        mocker.patch('app.controller.completions.load_config', side_effect=Exception('boom'))
+        mocker.patch('app.controller.completions.read_completion_index', return_value=None)
+        mocker.patch('app.controller.common.load_config', side_effect=Exception('boom'))
 
         results = list(complete_vless_outbound_name(_ctx(), [], ''))
         assert not results
+
+
+class TestCompletionCallbacks:
+
+    def test_signatures_resolvable(self):
+        for callback in (complete_client_name, complete_route_name,
+                         complete_outbound_name, complete_vless_outbound_name):
+            assert 'incomplete' in inspect.signature(callback, eval_str=True).parameters
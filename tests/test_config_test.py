@@ -0,0 +1,65 @@
+from pathlib import Path
+
+from pytest import fixture, mark, raises
+from pytest_mock import MockFixture
+
+from app.controller.common import _test_config_or_fail
+
+
+class TestTestConfigOrFail:
+
+    @fixture(name='geo_data_path')
+    def fixture_geo_data_path(self, managed_config_path: Path, mocker: MockFixture) -> Path:
+        geo_data_path = managed_config_path.with_name('geosite.dat')
+        geo_data_path.write_bytes(b'geosite')
+        xray_path = managed_config_path.with_name('xray')
+        xray_path.write_bytes(b'xray')
+        mocker.patch('app.controller.common.XRAY_BINARY_PATH', xray_path)
+        mocker.patch('app.controller.common.XRAY_GEO_IP_DATA_PATH', managed_config_path.with_name('geoip.dat'))
+        mocker.patch('app.controller.common.XRAY_GEO_SITE_DATA_PATH', geo_data_path)
+        return geo_data_path
+
+    @mark.usefixtures('geo_data_path')
+    def test_tested_config_is_not_tested_again(self, mocker: MockFixture):
+        test_mock = mocker.patch('app.controller.common.validate_xray_config', return_value=(True, ''))
+
+        _test_config_or_fail()
+        _test_config_or_fail()
+
+        test_mock.assert_called_once()
+
+    def test_changed_inputs_are_tested_again(
+            self, managed_config_path: Path, geo_data_path: Path, mocker: MockFixture):
+        test_mock = mocker.patch('app.controller.common.validate_xray_config', return_value=(True, ''))
+
+        _test_config_or_fail()
+        geo_data_path.write_bytes(b'new geosite')
+        _test_config_or_fail()
+        managed_config_path.write_text(managed_config_path.read_text(encoding='utf-8') + ' ', encoding='utf-8')
+        _test_config_or_fail()
+
+        assert test_mock.call_count == 3
+
+    @mark.usefixtures('geo_data_path')
+    def test_failed_test_is_not_cached(self, mocker: MockFixture):
+        test_mock = mocker.patch(
+            'app.controller.common.validate_xray_config', return_value=(False, 'bad config'))
+        mocker.patch('app.controller.common.print_error')
+
+        for _ in range(2):
+            with raises(RuntimeError):
+                _test_config_or_fail()
+
+        assert test_mock.call_count == 2
+
+    @mark.usefixtures('geo_data_path')
+    def test_preflight_problems_fail_without_xray_test(self, mocker: MockFixture):
+        mocker.patch('app.controller.common.get_config_problems', return_value=['first', 'second'])
+        test_mock = mocker.patch('app.controller.common.validate_xray_config')
+        print_mock = mocker.patch('app.controller.common.print_error')
+
+        with raises(RuntimeError, match='first; second'):
+            _test_config_or_fail()
+
+        test_mock.assert_not_called()
+        assert '- second' in str(print_mock.call_args.args[0])
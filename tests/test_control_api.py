@@ -0,0 +1,156 @@
+import json
+from http.client import HTTPConnection
+from pathlib import Path
+from socket import AF_UNIX, SOCK_STREAM, socket
+from threading import Thread
+from typing import Any, Iterator
+
+from pytest import fixture, mark
+from pytest_mock import MockFixture
+
+from app.control_api import ControlState, create_control_server
+from app.model.veepeenet import TrafficStats, VeePeeNetStats
+
+
+class _UnixConnection(HTTPConnection):
+
+    def __init__(self, socket_path: Path):
+        super().__init__('localhost')
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket(AF_UNIX, SOCK_STREAM)
+        self.sock.connect(str(self.socket_path))
+
+
+@fixture(name='config_path')
+def fixture_config_path(tmp_path: Path, mocker: MockFixture) -> Path:
+    config_path = tmp_path / 'config.json'
+    config_data = json.loads(
+        Path('tests/resources/valid_xray_config_with_clients.json').read_text(encoding='utf-8'))
+    config_data['inbounds'][0]['settings']['clients'][0]['id'] = '12345678-1234-5678-1234-567812345678'
+    config_path.write_text(json.dumps(config_data), encoding='utf-8')
+    for module in ('app.controller.common', 'app.controller.commands.routing'):
+        mocker.patch(f'{module}.XRAY_CONFIG_PATH', config_path)
+    mocker.patch('app.controller.common.XRAY_CONFIG_BACKUP_PATH', tmp_path / 'config.json.bak')
+    mocker.patch('app.utils.gen_xray_password', return_value='random-password-1')
+    mocker.patch('app.controller.common.get_config_problems', return_value=[])
+    return config_path
+
+
+@fixture(name='socket_path')
+def fixture_socket_path(tmp_path: Path, config_path: Path) -> Iterator[Path]:
+    socket_path = tmp_path / 'control.sock'
+    server = create_control_server(socket_path, ControlState(config_path))
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield socket_path
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _request(socket_path: Path, method: str, path: str, body: str | None = None) -> tuple[int, Any]:
+    connection = _UnixConnection(socket_path)
+    try:
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+class TestControlApi:
+
+    def test_serves_clients_from_memory(self, socket_path: Path, mocker: MockFixture):
+        load_spy = mocker.spy(ControlState, '_get_snapshot')
+
+        status, clients = _request(socket_path, 'GET', '/clients')
+        _, same_clients = _request(socket_path, 'GET', '/clients/')
+
+        assert status == 200
+        assert clients == same_clients
+        assert [client['name'] for client in clients['clients']] == ['c1.client']
+        assert clients['clients'][0]['url'].startswith('vless://')
+        assert load_spy.call_count == 2
+
+    def test_serves_single_client(self, socket_path: Path):
+        status, client = _request(socket_path, 'GET', '/clients/c1.client')
+        assert status == 200 and client['name'] == 'c1.client'
+
+        status, error = _request(socket_path, 'GET', '/clients/unknown')
+        assert status == 404 and 'unknown' in error['error']
+
+    def test_reloads_config_changed_outside(self, socket_path: Path, config_path: Path):
+        _request(socket_path, 'GET', '/routing')
+        config_data = json.loads(config_path.read_text(encoding='utf-8'))
+        config_data['routing']['rules'] = []
+        config_path.write_text(json.dumps(config_data, indent=2), encoding='utf-8')
+
+        status, routing = _request(socket_path, 'GET', '/routing')
+
+        assert status == 200
+        assert not routing.get('rules')
+
+    def test_batch_writes_config_once(self, socket_path: Path, config_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.commands.routing.check_root')
+        mocker.patch('app.controller.commands.routing.check_xray_config')
+        mocker.patch('app.controller.commands.routing.install_geo_data')
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=False)
+        test_mock = mocker.patch('app.controller.common.validate_xray_config', return_value=(True, ''))
+        operations = '\n'.join(json.dumps(operation) for operation in (
+            {'command': 'routing add-rule', 'name': 'blocked', 'outbound': 'blackhole',
+             'domain': ['example.com']},
+            {'command': 'routing change-outbound', 'name': 'blocked', 'outbound': 'direct'}))
+
+        status, result = _request(socket_path, 'POST', '/batch', operations)
+
+        assert status == 200
+        assert result['applied'] is True and result['operations'] == 2
+        test_mock.assert_called_once()
+        _, routing = _request(socket_path, 'GET', '/routing')
+        assert {'name': 'blocked', 'outbound_name': 'direct'}.items() <= next(
+            rule for rule in routing['rules'] if rule['name'] == 'blocked').items()
+        assert 'blocked.' in config_path.read_text(encoding='utf-8')
+
+    def test_failed_batch_keeps_config(self, socket_path: Path, config_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.commands.routing.check_root')
+        mocker.patch('app.controller.commands.routing.check_xray_config')
+        original_content = config_path.read_bytes()
+
+        status, result = _request(
+            socket_path, 'POST', '/batch', json.dumps({'command': 'routing remove-rule', 'name': 'missing'}))
+
+        assert status == 400
+        assert 'missing' in result['error'] and result['code'] > 0
+        assert config_path.read_bytes() == original_content
+
+    def test_stats_are_reused_within_ttl(self, socket_path: Path, mocker: MockFixture):
+        mocker.patch('app.control_api.get_stored_stats', return_value=VeePeeNetStats())
+        runtime_mock = mocker.patch('app.control_api.get_runtime_stats', return_value=VeePeeNetStats(
+            inbound={'vless-inbound': TrafficStats(uplink=1, downlink=2)}))
+
+        for _ in range(3):
+            status, stats = _request(socket_path, 'GET', '/stats')
+            assert status == 200
+            assert stats['inbound']['vless-inbound'] == {'uplink': 1, 'downlink': 2}
+
+        runtime_mock.assert_called_once()
+
+    def test_unknown_path(self, socket_path: Path):
+        assert _request(socket_path, 'GET', '/unknown')[0] == 404
+        assert _request(socket_path, 'POST', '/clients', '{}')[0] == 404
+
+    @mark.parametrize('length, status', [(None, 411), ('abc', 400), ('-1', 400), (str(65 * 1024 * 1024), 413)])
+    def test_validates_content_length(self, socket_path: Path, length: str | None, status: int):
+        connection = _UnixConnection(socket_path)
+        try:
+            connection.putrequest('POST', '/batch')
+            if length is not None:
+                connection.putheader('Content-Length', length)
+            connection.endheaders()
+            response = connection.getresponse()
+            assert response.status == status
+            assert json.loads(response.read())['error']
+        finally:
+            connection.close()
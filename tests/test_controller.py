@@ -1,3 +1,5 @@
+import json
+from io import StringIO
 from pathlib import Path
 from types import SimpleNamespace
 from unittest.mock import MagicMock
@@ -5,14 +7,24 @@ from unittest.mock import MagicMock
 from pydantic import ValidationError
 from pytest import fixture, raises
 from pytest_mock import MockFixture
+from rich.text import Text
 from typer import Exit
 
-from app.controller.common import load_config
-from app.controller.commands.clients import disable, enable, get_clients_view
+from app.controller.common import load_config, save_config, serve_until_stopped
+from app.controller.commands.clients import (
+    add as add_clients,
+    disable,
+    enable,
+    export,
+    get_clients_view,
+    get_vless_client_url,
+    iter_clients_urls,
+    write_clients_export,
+)
 from app.controller.commands.configure import config, _select_version
 from app.controller.commands.outbound import remove
 from app.controller.commands.routing import add_rule, change_rule, get_routing_view, set_rule_priority
-from app.controller.commands.state import status, reset_stats, store_stats
+from app.controller.commands.state import status
 from app.defaults import (
     DISABLED_CLIENTS_RULE_NAME,
     DISABLED_CLIENTS_RULE_PRIORITY,
@@ -20,10 +32,10 @@ from app.defaults import (
     EXIT_ROUTING_CLIENT_NOT_FOUND,
     EXIT_ROUTING_INVALID_PRIORITY,
 )
-from app.model.api import Stats
 from app.model.routing import Rule
-from app.model.veepeenet import VeePeeNetStats, TrafficStats
+from app.model.veepeenet import VeePeeNetStats
 from app.model.xray import Xray
+from app.utils import get_config_digest
 
 
 @fixture(name='valid_config_path')
@@ -46,6 +58,11 @@ def fixture_initial_config_path() -> Path:
     return Path('tests/resources/initial_xray_config.json')
 
 
+@fixture(name='valid_xray_config_with_clients_path')
+def fixture_valid_xray_config_with_clients_path() -> Path:
+    return Path('tests/resources/valid_xray_config_with_clients.json')
+
+
 class TestLoadConfig:
 
     def test_load_config_success(self, valid_config_path: Path):
@@ -59,6 +76,113 @@ class TestLoadConfig:
         with raises(FileNotFoundError):
             load_config(non_existent_config_path)
 
+    def test_load_config_not_cached_outside_xray_dir(self, tmp_path: Path, valid_config_path: Path):
+        config_path = tmp_path / 'config.json'
+        config_path.write_bytes(valid_config_path.read_bytes())
+
+        load_config(config_path)
+
+        assert not (tmp_path / '.config.json.cache').exists()
+
+    def test_load_config_not_cached_for_backup(
+            self, tmp_path: Path, valid_config_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.common.XRAY_CONFIG_PATH', tmp_path / 'config.json')
+        backup_path = tmp_path / 'config.json.bak'
+        backup_path.write_bytes(valid_config_path.read_bytes())
+
+        load_config(backup_path)
+
+        assert [path.name for path in tmp_path.iterdir()] == ['config.json.bak']
+
+    def test_load_config_cached(self, tmp_path: Path, valid_config_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.common.XRAY_CONFIG_PATH', tmp_path / 'config.json')
+        config_path = tmp_path / 'config.json'
+        config_path.write_bytes(valid_config_path.read_bytes())
+        expected = load_config(config_path)
+        assert (tmp_path / '.config.json.cache').exists()
+        json_loads = mocker.patch('app.controller.common.json_loads')
+
+        assert (load_config(config_path).model_dump(exclude={'veepeenet'})
+                == expected.model_dump(exclude={'veepeenet'}))
+        json_loads.assert_not_called()
+
+    def test_load_config_cache_invalidated(self, tmp_path: Path, valid_config_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.common.XRAY_CONFIG_PATH', tmp_path / 'config.json')
+        config_path = tmp_path / 'config.json'
+        config_path.write_bytes(valid_config_path.read_bytes())
+        load_config(config_path)
+        content = json.loads(config_path.read_bytes())
+        content['log'] = {'loglevel': 'debug'}
+        config_path.write_text(json.dumps(content), encoding='utf-8')
+
+        xray_config = load_config(config_path)
+
+        assert xray_config.log and xray_config.log.loglevel == 'debug'
+
+    def test_load_config_cached_invalid(self, tmp_path: Path, invalid_config_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.common.XRAY_CONFIG_PATH', tmp_path / 'config.json')
+        config_path = tmp_path / 'config.json'
+        config_path.write_bytes(invalid_config_path.read_bytes())
+
+        for _ in range(2):
+            with raises(ValidationError):
+                load_config(config_path)
+
+    def test_save_config_unchanged_skipped(self, tmp_path: Path, valid_config_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.common.XRAY_CONFIG_PATH', tmp_path / 'config.json')
+        config_path = tmp_path / 'config.json'
+        save_config(load_config(valid_config_path), config_path)
+        xray_config = load_config(config_path)
+        write_text_file_mock = mocker.patch('app.controller.common.write_text_file')
+        dump_mock = mocker.spy(Xray, 'model_dump_json')
+
+        save_config(xray_config, config_path)
+
+        write_text_file_mock.assert_not_called()
+        dump_mock.assert_not_called()
+
+    def test_save_config_changed_written(self, tmp_path: Path, valid_config_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.common.XRAY_CONFIG_PATH', tmp_path / 'config.json')
+        config_path = tmp_path / 'config.json'
+        save_config(load_config(valid_config_path), config_path)
+        xray_config = load_config(config_path)
+
+        xray_config.outbounds.pop()
+        save_config(xray_config, config_path)
+
+        assert len(load_config(config_path).outbounds) == len(xray_config.outbounds)
+
+    def test_save_config_edited_externally_written(self, tmp_path: Path, valid_config_path: Path,
+                                                   mocker: MockFixture):
+        mocker.patch('app.controller.common.XRAY_CONFIG_PATH', tmp_path / 'config.json')
+        config_path = tmp_path / 'config.json'
+        config_path.write_text(json.dumps(json.loads(valid_config_path.read_bytes())), encoding='utf-8')
+
+        save_config(load_config(config_path), config_path)
+
+        assert config_path.read_text(encoding='utf-8').startswith('{\n  ')
+
+    def test_save_config_records_digest(self, tmp_path: Path, valid_config_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.common.XRAY_CONFIG_PATH', tmp_path / 'config.json')
+        config_path = tmp_path / 'config.json'
+
+        save_config(load_config(valid_config_path), config_path)
+        digest = (tmp_path / '.config.json.digest').read_text(encoding='utf-8').split()[1]
+        (tmp_path / '.config.json.digest').unlink()
+
+        assert get_config_digest(config_path) == digest
+
+    def test_save_config_updates_cache(self, tmp_path: Path, valid_config_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.common.XRAY_CONFIG_PATH', tmp_path / 'config.json')
+        config_path = tmp_path / 'config.json'
+        xray_config = load_config(valid_config_path)
+
+        save_config(xray_config, config_path)
+        json_loads = mocker.patch('app.controller.common.json_loads')
+
+        assert load_config(config_path) == xray_config
+        json_loads.assert_not_called()
+
 
 class TestCreateConfig:
 
@@ -71,6 +195,7 @@ class TestCreateConfig:
         mocker.patch(
             'app.controller.commands.configure.gen_xray_private_key',
             return_value='very-secret-key')
+        mocker.patch('app.utils.gen_xray_password', return_value='very-public-key')
         mocker.patch('app.controller.commands.configure.uuid4', return_value='some-uuid')
         save_config_mock = mocker.patch('app.controller.commands.configure.save_config')
         mocker.patch('app.controller.commands.configure.check_root')
@@ -102,6 +227,7 @@ class TestCreateConfig:
         mocker.patch(
             'app.controller.commands.configure.gen_xray_private_key',
             return_value='very-secret-key')
+        mocker.patch('app.utils.gen_xray_password', return_value='very-public-key')
         mocker.patch('app.controller.commands.configure.uuid4', return_value='some-uuid')
         save_config_mock = mocker.patch('app.controller.commands.configure.save_config')
         mocker.patch('app.controller.commands.configure.check_root')
@@ -208,145 +334,6 @@ class TestOutboundRemove:
         save_config_mock.assert_not_called()
 
 
-class TestCollectAndSaveStats:
-
-    def test_does_nothing_if_service_not_running(self, mocker: MockFixture):
-        mocker.patch('app.controller.common.is_xray_service_running', return_value=False)
-        load_stats_mock = mocker.patch('app.controller.common.load_stats')
-
-        from app.controller.common import _store_runtime_stats # type: ignore # pylint: disable=import-outside-toplevel
-        _store_runtime_stats()
-
-        load_stats_mock.assert_not_called()
-
-    def test_saves_accumulated_stats_when_running(self, mocker: MockFixture):
-        from app.controller.common import _store_runtime_stats # type: ignore # pylint: disable=import-outside-toplevel
-
-        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
-        mocker.patch('app.controller.common.load_stats', return_value=VeePeeNetStats())
-        save_mock = mocker.patch('app.controller.common.save_stats')
-        runtime_stats = VeePeeNetStats(
-            client={'c1.client': TrafficStats(uplink=100, downlink=200)}
-        )
-        runtime_mock = mocker.patch(
-            'app.controller.common.get_runtime_stats', return_value=runtime_stats)
-
-        _store_runtime_stats()
-
-        runtime_mock.assert_called_once_with(reset=True)
-        save_mock.assert_called_once()
-        saved_stats = save_mock.call_args[0][0]
-        assert saved_stats.client.get('c1.client') is not None
-        assert saved_stats.client['c1.client'].uplink == 100
-        assert saved_stats.client['c1.client'].downlink == 200
-
-
-class TestStoreStatsCommand:
-
-    def test_saves_runtime_stats_from_api(self, mocker: MockFixture):
-        check_root_mock = mocker.patch('app.controller.commands.state.check_root')
-        mocker.patch(
-            'app.controller.commands.state.query_xray_stats',
-            return_value=[
-                Stats(name='user>>>alice.123@0.0.0.0>>>traffic>>>uplink', value=100),
-                Stats(name='inbound>>>vless-inbound>>>traffic>>>downlink', value=200),
-            ])
-        mocker.patch(
-            'app.controller.commands.state.get_stored_stats',
-            return_value=VeePeeNetStats(
-                client={'alice': TrafficStats(uplink=5, downlink=0)}))
-        save_mock = mocker.patch('app.controller.commands.state.save_stats')
-
-        store_stats()
-
-        check_root_mock.assert_called_once()
-        save_mock.assert_called_once()
-        saved_stats = save_mock.call_args[0][0]
-        assert saved_stats.client['alice'].uplink == 105
-        assert saved_stats.inbound['vless-inbound'].downlink == 200
-
-    def test_does_nothing_when_api_has_no_stats(self, mocker: MockFixture):
-        mocker.patch('app.controller.commands.state.check_root')
-        mocker.patch('app.controller.commands.state.query_xray_stats', return_value=[])
-        stored_mock = mocker.patch('app.controller.commands.state.get_stored_stats')
-        save_mock = mocker.patch('app.controller.commands.state.save_stats')
-
-        store_stats()
-
-        stored_mock.assert_not_called()
-        save_mock.assert_not_called()
-
-    def test_raises_when_not_root(self, mocker: MockFixture):
-        mocker.patch(
-            'app.controller.commands.state.check_root',
-            side_effect=Exit(code=1))
-        query_mock = mocker.patch('app.controller.commands.state.query_xray_stats')
-
-        with raises(Exit) as exc_info:
-            store_stats(_debug=True)
-
-        assert exc_info.value.exit_code == 1
-        query_mock.assert_not_called()
-
-
-class TestClearStats:
-
-    def test_resets_only_stats_file_if_service_not_running(self, mocker: MockFixture):
-        mocker.patch('app.controller.common.is_xray_service_running', return_value=False)
-        reset_mock = mocker.patch('app.controller.common.reset_xray_stats')
-        save_mock = mocker.patch('app.controller.common.save_stats')
-        print_mock = mocker.patch('app.controller.common.stdout_console.print')
-
-        from app.controller.common import clear_stats # pylint: disable=import-outside-toplevel
-        clear_stats()
-
-        reset_mock.assert_not_called()
-        save_mock.assert_called_once()
-        saved_stats = save_mock.call_args[0][0]
-        assert saved_stats == VeePeeNetStats()
-        print_mock.assert_called_once()
-
-    def test_resets_stats_file_and_api_if_service_running(self, mocker: MockFixture):
-        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
-        reset_mock = mocker.patch('app.controller.common.reset_xray_stats', return_value=True)
-        save_mock = mocker.patch('app.controller.common.save_stats')
-
-        from app.controller.common import clear_stats # pylint: disable=import-outside-toplevel
-        clear_stats()
-
-        reset_mock.assert_called_once()
-        save_mock.assert_called_once()
-        saved_stats = save_mock.call_args[0][0]
-        assert saved_stats == VeePeeNetStats()
-
-    def test_raises_if_api_reset_fails(self, mocker: MockFixture):
-        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
-        mocker.patch('app.controller.common.reset_xray_stats', return_value=False)
-        save_mock = mocker.patch('app.controller.common.save_stats')
-
-        from app.controller.common import clear_stats # pylint: disable=import-outside-toplevel
-        with raises(RuntimeError, match='Failed to reset Xray API stats'):
-            clear_stats()
-
-        save_mock.assert_not_called()
-
-
-class TestResetStatsCommand:
-
-    def test_runs_checks_and_clears_stats(self, mocker: MockFixture):
-        check_root_mock = mocker.patch('app.controller.commands.state.check_root')
-        check_xray_config_mock = mocker.patch('app.controller.commands.state.check_xray_config')
-        check_distrib_mock = mocker.patch('app.controller.commands.state.check_distrib')
-        clear_stats_mock = mocker.patch('app.controller.commands.state.clear_stats')
-
-        reset_stats()
-
-        check_root_mock.assert_called_once()
-        check_xray_config_mock.assert_called_once()
-        check_distrib_mock.assert_called_once()
-        clear_stats_mock.assert_called_once()
-
-
 class TestStatusRestartRequired:
 
     @fixture(name='valid_config_for_status')
@@ -384,7 +371,7 @@ class TestStatusRestartRequired:
             'app.controller.commands.state.get_outbounds_view',
             return_value=SimpleNamespace(outbounds=[]))
         compare_mock = mocker.patch(
-            'app.controller.commands.state.is_json_content_same',
+            'app.controller.commands.state.is_config_applied',
             return_value=True)
         server_view_ctor = mocker.patch(
             'app.controller.commands.state.ServerView',
@@ -395,7 +382,6 @@ class TestStatusRestartRequired:
 
         assert server_view_ctor.call_args.kwargs['restart_required'] is False
         compare_mock.assert_called_once()
-        assert compare_mock.call_args.kwargs == {'exclude_top_level_keys': {'veepeenet'}}
         print_mock.assert_called_once_with('server-view')
 
     def test_status_requires_restart_for_different_json_content(
@@ -428,7 +414,7 @@ class TestStatusRestartRequired:
             'app.controller.commands.state.get_outbounds_view',
             return_value=SimpleNamespace(outbounds=[]))
         compare_mock = mocker.patch(
-            'app.controller.commands.state.is_json_content_same',
+            'app.controller.commands.state.is_config_applied',
             return_value=False)
         server_view_ctor = mocker.patch(
             'app.controller.commands.state.ServerView',
@@ -439,7 +425,6 @@ class TestStatusRestartRequired:
 
         assert server_view_ctor.call_args.kwargs['restart_required'] is True
         compare_mock.assert_called_once()
-        assert compare_mock.call_args.kwargs == {'exclude_top_level_keys': {'veepeenet'}}
 
 
 class TestRoutingPriorityValidation:
@@ -644,11 +629,11 @@ class TestDisableEnableClients:
 
     @fixture(name='config_with_clients_for_clients_commands')
     def fixture_config_with_clients_for_clients_commands(self) -> Xray:
-        config = load_config(Path('tests/resources/valid_xray_config_with_clients.json'))
-        inbound = config.get_vless_inbound()
+        xray_config = load_config(Path('tests/resources/valid_xray_config_with_clients.json'))
+        inbound = xray_config.get_vless_inbound()
         if inbound and inbound.settings.clients:
             inbound.settings.clients[0].id = '12345678-1234-5678-1234-567812345678'
-        return config
+        return xray_config
 
     def test_disable_creates_system_rule(
             self, config_with_clients_for_clients_commands: Xray, mocker: MockFixture):
@@ -765,3 +750,220 @@ class TestDisableEnableClients:
             rule.tag != f'{DISABLED_CLIENTS_RULE_NAME}.{DISABLED_CLIENTS_RULE_PRIORITY}'
             for rule in saved_config.routing.rules or []
         )
+
+
+class TestClientsFromFile:
+
+    @fixture(name='config_with_clients_for_import')
+    def fixture_config_with_clients_for_import(self) -> Xray:
+        xray_config = load_config(Path('tests/resources/valid_xray_config_with_clients.json'))
+        inbound = xray_config.get_vless_inbound()
+        if inbound and inbound.settings.clients:
+            inbound.settings.clients[0].id = '12345678-1234-5678-1234-567812345678'
+        return xray_config
+
+    def test_add_from_file_loads_and_saves_once(
+            self, config_with_clients_for_import: Xray, tmp_path: Path, mocker: MockFixture):
+        names_file = tmp_path / 'users.txt'
+        names_file.write_text(
+            'new1\n{"name": "new2"}\nnew1\nc1.client\n\n', encoding='utf-8')
+        mocker.patch('app.controller.commands.clients.check_root')
+        mocker.patch('app.controller.commands.clients.check_xray_config')
+        load_mock = mocker.patch(
+            'app.controller.commands.clients.load_config',
+            return_value=config_with_clients_for_import)
+        save_mock = mocker.patch('app.controller.commands.clients.save_config')
+        mocker.patch('app.controller.commands.clients.stdout_console.print')
+
+        add_clients(None, from_file=str(names_file), _debug=True)
+
+        load_mock.assert_called_once()
+        save_mock.assert_called_once()
+        inbound = save_mock.call_args[0][0].get_vless_inbound()
+        emails = [client.email for client in inbound.settings.clients]
+        assert emails[0] == 'c1.client.0001@0.0.0.0'
+        assert [email.split('.')[0] for email in emails[1:]] == ['new1', 'new2']
+        assert len(inbound.stream_settings.reality_settings.short_ids) == 3
+
+    def test_add_combines_arguments_and_file(
+            self, config_with_clients_for_import: Xray, tmp_path: Path, mocker: MockFixture):
+        names_file = tmp_path / 'users.txt'
+        names_file.write_text('new2\n', encoding='utf-8')
+        mocker.patch('app.controller.commands.clients.check_root')
+        mocker.patch('app.controller.commands.clients.check_xray_config')
+        mocker.patch(
+            'app.controller.commands.clients.load_config',
+            return_value=config_with_clients_for_import)
+        save_mock = mocker.patch('app.controller.commands.clients.save_config')
+        mocker.patch('app.controller.commands.clients.stdout_console.print')
+
+        add_clients(['new1'], from_file=str(names_file), _debug=True)
+
+        inbound = save_mock.call_args[0][0].get_vless_inbound()
+        assert len(inbound.settings.clients) == 3
+
+    def test_add_without_names_fails(self, mocker: MockFixture):
+        mocker.patch('app.controller.commands.clients.check_root')
+        mocker.patch('app.controller.commands.clients.check_xray_config')
+        mocker.patch('app.controller.commands.clients.print_error')
+        load_mock = mocker.patch('app.controller.commands.clients.load_config')
+
+        with raises(Exit) as exc_info:
+            add_clients(None, _debug=True)
+
+        assert exc_info.value.exit_code == EXIT_CLIENTS_ERROR
+        load_mock.assert_not_called()
+
+    def test_remove_from_file(
+            self, config_with_clients_for_import: Xray, tmp_path: Path, mocker: MockFixture):
+        from app.controller.commands.clients import remove as remove_clients # pylint: disable=import-outside-toplevel
+
+        names_file = tmp_path / 'users.txt'
+        names_file.write_text('c1.client\nmissing\n', encoding='utf-8')
+        mocker.patch('app.controller.commands.clients.check_root')
+        mocker.patch('app.controller.commands.clients.check_xray_config')
+        mocker.patch(
+            'app.controller.commands.clients.load_config',
+            return_value=config_with_clients_for_import)
+        save_mock = mocker.patch('app.controller.commands.clients.save_config')
+        mocker.patch('app.controller.commands.clients.stdout_console.print')
+
+        remove_clients(None, from_file=str(names_file), _debug=True)
+
+        save_mock.assert_called_once()
+        inbound = save_mock.call_args[0][0].get_vless_inbound()
+        assert not inbound.settings.clients
+
+
+class TestClientsExport:
+
+    @fixture(name='config_for_export')
+    def fixture_config_for_export(self) -> Xray:
+        return load_config(Path('tests/resources/valid_xray_config_with_clients.json'))
+
+    def test_iter_clients_urls(self, config_for_export: Xray, mocker: MockFixture):
+        mocker.patch('app.utils.gen_xray_password', return_value='random-password-1')
+
+        rows = list(iter_clients_urls(config_for_export))
+
+        assert [name for name, _ in rows] == ['c1.client']
+        assert rows[0][1].startswith('vless://random-uuid-1@')
+
+    def test_write_tsv(self):
+        stream = StringIO()
+
+        write_clients_export(iter([('a', 'vless://a'), ('b', 'vless://b')]), 'tsv', stream)
+
+        assert stream.getvalue() == 'a\tvless://a\nb\tvless://b\n'
+
+    def test_write_ndjson(self):
+        stream = StringIO()
+
+        write_clients_export(iter([('a', 'vless://a#a@My Server')]), 'ndjson', stream)
+
+        assert [json.loads(line) for line in stream.getvalue().splitlines()] == [
+            {'name': 'a', 'url': 'vless://a#a@My Server'}]
+
+    def test_write_csv(self):
+        stream = StringIO()
+
+        write_clients_export(iter([('a,b', 'vless://a')]), 'csv', stream)
+
+        assert stream.getvalue() == 'name,url\n"a,b",vless://a\n'
+
+    def test_export_command_does_not_query_stats(
+            self, config_for_export: Xray, mocker: MockFixture, capsys):
+        mocker.patch('app.controller.commands.clients.check_xray_config')
+        mocker.patch('app.controller.commands.clients.load_config', return_value=config_for_export)
+        mocker.patch('app.utils.gen_xray_password', return_value='random-password-1')
+        runtime_stats_mock = mocker.patch('app.controller.commands.clients.get_runtime_stats')
+
+        export(export_format='ndjson', _debug=True)
+
+        output = capsys.readouterr().out
+        assert json.loads(output)['name'] == 'c1.client'
+        runtime_stats_mock.assert_not_called()
+
+
+class TestGetVlessClientUrl:
+
+    def test_get_vless_client_url_success(
+            self, mocker: MockFixture, valid_xray_config_with_clients_path: Path):
+        mocker.patch('app.utils.gen_xray_password', return_value='random-password-1')
+        expected_client_url = (
+            'vless://random-uuid-1@0.0.0.0:443?flow=xtls-rprx-vision'
+            '&type=raw'
+            '&security=reality'
+            '&fp=chrome'
+            '&sni=yahoo.com'
+            '&pbk=random-password-1'
+            '&sid=0001'
+            '&spx=%2Fc1.client'
+            '#c1.client@0.0.0.0'
+        )
+        xray_config_content = valid_xray_config_with_clients_path.read_text(
+            encoding='utf-8')
+
+        actual_url = get_vless_client_url(
+            'c1.client', Xray.model_validate_json(xray_config_content))
+
+        assert actual_url == expected_client_url
+
+    def test_get_vless_client_url_not_found(self, valid_xray_config_with_clients_path: Path):
+        xray_config_content = valid_xray_config_with_clients_path.read_text(
+            encoding='utf-8')
+
+        actual_url = get_vless_client_url(
+            'nonexistent_client', Xray.model_validate_json(xray_config_content))
+
+        assert actual_url is None
+
+    def test_get_vless_client_url_uses_server_name_in_fragment(
+            self, mocker: MockFixture, valid_xray_config_with_clients_path: Path):
+        mocker.patch('app.utils.gen_xray_password', return_value='random-password-1')
+        expected_client_url = (
+            'vless://random-uuid-1@0.0.0.0:443?flow=xtls-rprx-vision'
+            '&type=raw'
+            '&security=reality'
+            '&fp=chrome'
+            '&sni=yahoo.com'
+            '&pbk=random-password-1'
+            '&sid=0001'
+            '&spx=%2Fc1.client'
+            '#c1.client@My VPN Server'
+        )
+        xray_config = Xray.model_validate_json(
+            valid_xray_config_with_clients_path.read_text(encoding='utf-8'))
+        assert xray_config.veepeenet is not None
+        xray_config.veepeenet.name = 'My VPN Server'
+
+        actual_url = get_vless_client_url('c1.client', xray_config)
+
+        assert actual_url == expected_client_url
+
+
+    def test_get_vless_client_url_generates_password_once(
+            self, mocker: MockFixture, valid_xray_config_with_clients_path: Path):
+        gen_mock = mocker.patch('app.utils.gen_xray_password', return_value='random-password-1')
+        xray_config = Xray.model_validate_json(
+            valid_xray_config_with_clients_path.read_text(encoding='utf-8'))
+
+        get_vless_client_url('c1.client', xray_config)
+        get_vless_client_url('c1.client', xray_config)
+
+        gen_mock.assert_called_once()
+
+
+class TestServeUntilStopped:
+
+    def test_shuts_server_down_when_stopped(self, mocker: MockFixture):
+        mocker.patch('app.controller.common.signal')
+        mocker.patch('app.controller.common.stdout_console.print')
+        event_mock = mocker.patch('app.controller.common.Event').return_value
+        server = MagicMock()
+
+        serve_until_stopped(server, 'test-server', Text('Serving'))
+
+        event_mock.wait.assert_called_once_with()
+        server.shutdown.assert_called_once_with()
+        server.server_close.assert_called_once_with()
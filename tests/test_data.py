@@ -1,148 +1,108 @@
-from app.model.api import Stats
-from app.controller.data import RuleData, StatsData
+from uuid import UUID
+
+from app.controller.data import ClientData, ClientIndex, RuleData, StatsAggregator, StatsData, StatsRateTracker
 from app.model.routing import Rule
-from app.model.veepeenet import VeePeeNetStats
-
-
-def _stat(name: str, value: int | None = 0) -> Stats:
-    return Stats(name=name, value=value)
-
-
-class TestStatsDataFromApi:
-
-    def test_parses_inbound_uplink(self):
-        stat = _stat('inbound>>>vless-inbound>>>traffic>>>uplink', 1000)
-        result = StatsData.from_api(stat)
-        assert result is not None
-        assert result.subject == StatsData.SubjectType.INBOUND
-        assert result.name == 'vless-inbound'
-        assert result.direction == StatsData.DirectionType.UPLINK
-        assert result.traffic == 1000
-
-    def test_parses_inbound_downlink(self):
-        stat = _stat('inbound>>>vless-inbound>>>traffic>>>downlink', 500)
-        result = StatsData.from_api(stat)
-        assert result is not None
-        assert result.subject == StatsData.SubjectType.INBOUND
-        assert result.direction == StatsData.DirectionType.DOWNLINK
-        assert result.traffic == 500
-
-    def test_parses_user_downlink(self):
-        stat = _stat('user>>>alice.abc@0.0.0.0>>>traffic>>>downlink', 2000)
-        result = StatsData.from_api(stat)
-        assert result is not None
-        assert result.subject == StatsData.SubjectType.CLIENT
-        assert result.name == 'alice'
-        assert result.direction == StatsData.DirectionType.DOWNLINK
-        assert result.traffic == 2000
-
-    def test_parses_outbound_direct(self):
-        stat = _stat('outbound>>>direct>>>traffic>>>uplink', 300)
-        result = StatsData.from_api(stat)
-        assert result is not None
-        assert result.subject == StatsData.SubjectType.OUTBOUND
-        assert result.name == 'direct'
-        assert result.traffic == 300
-
-    def test_parses_outbound_blackhole(self):
-        stat = _stat('outbound>>>blackhole>>>traffic>>>uplink', 999)
-        result = StatsData.from_api(stat)
-        assert result is not None
-        assert result.name == 'blackhole'
-
-    def test_parses_outbound_dns(self):
-        stat = _stat('outbound>>>dns>>>traffic>>>downlink', 111)
-        result = StatsData.from_api(stat)
-        assert result is not None
-        assert result.name == 'dns'
-
-    def test_returns_none_for_malformed_name(self):
-        assert StatsData.from_api(_stat('not>>>valid')) is None
-        assert StatsData.from_api(_stat('only_one_part')) is None
-        assert StatsData.from_api(_stat('a>>>b>>>c>>>d>>>e')) is None
-
-    def test_returns_none_for_non_traffic_type(self):
-        stat = _stat('inbound>>>vless-inbound>>>stats>>>uplink', 100)
-        result = StatsData.from_api(stat)
-        assert result is None
-
-    def test_returns_none_for_unknown_subject(self):
-        stat = _stat('badtype>>>something>>>traffic>>>uplink', 100)
-        result = StatsData.from_api(stat)
-        assert result is None
-
-    def test_returns_none_for_unknown_direction(self):
-        stat = _stat('inbound>>>vless-inbound>>>traffic>>>sideways', 100)
-        result = StatsData.from_api(stat)
-        assert result is None
-
-    def test_handles_none_value(self):
-        stat = _stat('inbound>>>vless-inbound>>>traffic>>>uplink', None)
-        result = StatsData.from_api(stat)
-        assert result is not None
-        assert result.traffic == 0
-
-
-class TestStatsDataToModel:
-
-    def test_inbound_uplink_to_model(self):
-        data = StatsData(
-            subject=StatsData.SubjectType.INBOUND,
-            name='vless-inbound',
-            direction=StatsData.DirectionType.UPLINK,
-            traffic=1000,
-        )
-        model = data.to_model()
-        assert isinstance(model, VeePeeNetStats)
-        assert model.inbound['vless-inbound'].uplink == 1000
-        assert model.inbound['vless-inbound'].downlink == 0
-        assert model.client == {}
-        assert model.outbound == {}
-
-    def test_inbound_downlink_to_model(self):
-        data = StatsData(
-            subject=StatsData.SubjectType.INBOUND,
-            name='vless-inbound',
-            direction=StatsData.DirectionType.DOWNLINK,
-            traffic=500,
-        )
-        model = data.to_model()
-        assert model.inbound['vless-inbound'].downlink == 500
-        assert model.inbound['vless-inbound'].uplink == 0
-
-    def test_user_downlink_to_model(self):
-        data = StatsData(
-            subject=StatsData.SubjectType.CLIENT,
-            name='alice.abc@0.0.0.0',
-            direction=StatsData.DirectionType.DOWNLINK,
-            traffic=2000,
-        )
-        model = data.to_model()
-        assert model.client['alice.abc@0.0.0.0'].downlink == 2000
-        assert model.inbound == {}
-        assert model.outbound == {}
-
-    def test_outbound_uplink_to_model(self):
-        data = StatsData(
-            subject=StatsData.SubjectType.OUTBOUND,
-            name='direct',
-            direction=StatsData.DirectionType.UPLINK,
-            traffic=300,
-        )
-        model = data.to_model()
-        assert model.outbound['direct'].uplink == 300
-        assert model.client == {}
-        assert model.inbound == {}
-
-    def test_outbound_blackhole_to_model(self):
-        data = StatsData(
-            subject=StatsData.SubjectType.OUTBOUND,
-            name='blackhole',
-            direction=StatsData.DirectionType.UPLINK,
-            traffic=999,
-        )
-        model = data.to_model()
-        assert model.outbound['blackhole'].uplink == 999
+from app.model.vless_inbound import (
+    Client,
+    RealitySettings,
+    Settings,
+    StreamSettings,
+    VlessInbound,
+)
+from app.model.veepeenet import TrafficStats, VeePeeNetStats
+
+
+def _stat(name: str, value: int = 0) -> tuple[str, int]:
+    return name, value
+
+
+class TestStatsAggregator:
+
+    def test_folds_counters_into_single_model(self):
+        stats = [
+            _stat('inbound>>>vless-inbound>>>traffic>>>uplink', 1000),
+            _stat('inbound>>>vless-inbound>>>traffic>>>downlink', 2000),
+            _stat('user>>>alice.abc@0.0.0.0>>>traffic>>>uplink', 10),
+            _stat('user>>>alice.abc@0.0.0.0>>>traffic>>>downlink', 20),
+            _stat('user>>>bob.x.def@0.0.0.0>>>traffic>>>downlink'),
+            _stat('outbound>>>direct>>>traffic>>>downlink', 5),
+            _stat('outbound>>>direct>>>traffic>>>downlink', 7),
+        ]
+
+        result = StatsAggregator().update(stats).to_model()
+
+        assert result.model_dump() == {
+            'inbound': {'vless-inbound': {'uplink': 1000, 'downlink': 2000}},
+            'client': {'alice': {'uplink': 10, 'downlink': 20}, 'bob.x': {'uplink': 0, 'downlink': 0}},
+            'outbound': {'direct': {'uplink': 0, 'downlink': 12}},
+        }
+
+    def test_applies_subject_and_name_filters(self):
+        stats = [
+            _stat('user>>>alice.abc@0.0.0.0>>>traffic>>>uplink', 1),
+            _stat('user>>>bob.def@0.0.0.0>>>traffic>>>uplink', 2),
+            _stat('outbound>>>alice.abc@0.0.0.0>>>traffic>>>uplink', 3),
+        ]
+
+        result = StatsAggregator(
+            subject_filter=StatsData.SubjectType.CLIENT, name_filter='alice.abc@0.0.0.0').update(stats)
+
+        assert result.to_model() == VeePeeNetStats(client={'alice': TrafficStats(uplink=1)})
+
+    def test_adds_stored_stats(self):
+        aggregator = StatsAggregator().update([_stat('user>>>alice.abc@0.0.0.0>>>traffic>>>uplink', 10)])
+
+        aggregator.add_stats(VeePeeNetStats(
+            client={'alice': TrafficStats(uplink=5, downlink=7)}, outbound={'direct': TrafficStats(uplink=1)}))
+
+        assert aggregator.to_model() == VeePeeNetStats(
+            client={'alice': TrafficStats(uplink=15, downlink=7)}, outbound={'direct': TrafficStats(uplink=1)})
+
+    def test_skips_unknown_counters(self):
+        aggregator = StatsAggregator()
+
+        assert aggregator.add('inbound>>>api>>>traffic>>>uplink', 1) is True
+        assert aggregator.add('user>>>a>>>b>>>traffic>>>uplink', 1) is False
+        assert aggregator.add('user>>>a>>>online>>>uplink', 1) is False
+        assert aggregator.add('inbound>>>a>>>stats>>>uplink', 1) is False
+        assert aggregator.add('not>>>valid', 1) is False
+        assert aggregator.add('router>>>a>>>traffic>>>uplink', 1) is False
+        assert aggregator.add('inbound>>>a>>>traffic>>>sideways', 1) is False
+        assert aggregator.to_model() == VeePeeNetStats(inbound={'api': TrafficStats(uplink=1)})
+
+
+class TestStatsRateTracker:
+
+    def test_computes_rates_from_total_deltas(self):
+        tracker = StatsRateTracker()
+
+        assert tracker.update(StatsAggregator(
+            client={'alice': [100, 0]}, outbound={'direct': [0, 1000]}), 10.0) is False
+        assert tracker.update(StatsAggregator(
+            client={'alice': [300, 50], 'bob': [10, 10]}, outbound={'direct': [0, 5000]}), 12.0) is True
+
+        assert tracker.client == {'alice': [100.0, 25.0]}
+        assert tracker.outbound == {'direct': [0.0, 2000.0]}
+
+    def test_decreased_totals_start_over(self):
+        tracker = StatsRateTracker()
+        tracker.update(StatsAggregator(inbound={'vless-inbound': [0, 1000]}), 0.0)
+
+        assert tracker.update(StatsAggregator(inbound={'vless-inbound': [0, 40]}), 2.0) is True
+        assert not tracker.inbound
+
+        tracker.update(StatsAggregator(inbound={'vless-inbound': [0, 80]}), 4.0)
+
+        assert tracker.inbound == {'vless-inbound': [0.0, 20.0]}
+
+
+class TestStatsDataPattern:
+
+    def test_builds_server_side_patterns(self):
+        assert StatsData.get_pattern() == ''
+        assert StatsData.get_pattern(StatsData.SubjectType.OUTBOUND) == 'outbound>>>'
+        assert StatsData.get_pattern(StatsData.SubjectType.CLIENT, 'a.1@0.0.0.0') == 'user>>>a.1@0.0.0.0>>>'
+        assert StatsData.get_pattern(name='direct') == '>>>direct>>>'
 
 
 class TestRuleDataUsers:
@@ -174,3 +134,62 @@ class TestRuleDataUsers:
         rule = rule_data.to_model()
 
         assert rule.user == ['c1.client.0001@0.0.0.0']
+
+
+def _inbound(clients: list[Client]) -> VlessInbound:
+    return VlessInbound(
+        listen='0.0.0.0',
+        port=443,
+        settings=Settings(clients=clients),
+        stream_settings=StreamSettings(reality_settings=RealitySettings(
+            dest='example.com:443', server_names=['example.com'],
+            private_key='key', short_ids=[])))
+
+
+class TestClientIndex:
+
+    def test_maps_name_email_uuid_and_short_id_to_position(self):
+        index = ClientIndex.from_inbound(_inbound([
+            Client(id='11111111-1111-1111-1111-111111111111', email='alice.0001@0.0.0.0'),
+            Client(id='22222222-2222-2222-2222-222222222222', email='bob.smith.0002@0.0.0.0'),
+        ]))
+
+        assert index.names == ['alice', 'bob.smith']
+        assert index.short_ids == ['0001', '0002']
+        assert index.by_name == {'alice': 0, 'bob.smith': 1}
+        assert index.by_email['bob.smith.0002@0.0.0.0'] == 1
+        assert index.by_uuid['11111111-1111-1111-1111-111111111111'] == 0
+        assert index.by_short_id['0002'] == 1
+        assert 'alice' in index
+        assert 'carol' not in index
+        assert len(index) == 2
+
+    def test_gets_name_by_email(self):
+        index = ClientIndex.from_inbound(_inbound([
+            Client(id='11111111-1111-1111-1111-111111111111', email='bob.smith.0002@0.0.0.0')]))
+
+        assert index.get_name_by_email('bob.smith.0002@0.0.0.0') == 'bob.smith'
+        assert index.get_name_by_email('removed.0003@0.0.0.0') == 'removed'
+
+    def test_names_clients_without_email_like_client_data(self):
+        client = Client(id='11111111-1111-1111-1111-111111111111')
+        index = ClientIndex.from_inbound(_inbound([client]))
+
+        expected = ClientData.from_model(client, 0)
+        assert index.get_data(0) == expected
+        assert index.get_email('client_0') == expected.to_model().email
+
+    def test_get_data_matches_client_data_from_model(self):
+        client = Client(id='11111111-1111-1111-1111-111111111111', email='alice.0001@0.0.0.0')
+        index = ClientIndex.from_inbound(_inbound([client]))
+
+        assert index.to_data() == [ClientData(
+            name='alice', short_id='0001', uuid=UUID('11111111-1111-1111-1111-111111111111'))]
+        assert index.get_position('alice') == 0
+        assert index.get_position('bob') is None
+
+    def test_empty_without_inbound(self):
+        index = ClientIndex.from_inbound(None)
+
+        assert not index.names
+        assert len(index) == 0
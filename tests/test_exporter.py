@@ -0,0 +1,154 @@
+from pathlib import Path
+from socket import AF_INET6
+from threading import Thread
+from unittest.mock import MagicMock
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from pytest import fixture, raises
+from pytest_mock import MockFixture
+from typer import Exit
+
+from app.controller.commands.exporter import _parse_listen
+from app.defaults import EXIT_EXPORTER_INVALID_LISTEN
+from app.exporter import MetricsCache, ServiceState, create_metrics_server, render_metrics
+from app.model.veepeenet import TrafficStats, VeePeeNetStats
+from app.stats_journal import StatsJournal
+
+_RUNNING = {'ActiveState': 'active', 'UnitFileState': 'enabled', 'ActiveEnterTimestampMonotonic': '1000000'}
+
+
+@fixture(name='cache')
+def fixture_cache(tmp_path: Path, mocker: MockFixture) -> MetricsCache:
+    mocker.patch('app.exporter.get_xray_service_properties', return_value=_RUNNING)
+    client = MagicMock()
+    client.query_counters.return_value = [
+        ('user>>>alice.0001@0.0.0.0>>>traffic>>>uplink', 10),
+        ('inbound>>>vless-inbound>>>traffic>>>downlink', 20),
+    ]
+    return MetricsCache(client, StatsJournal(tmp_path / 'stats.json', tmp_path / 'stats.journal'))
+
+
+class TestRenderMetrics:
+
+    def test_renders_counters_and_service_state(self):
+        metrics = render_metrics(
+            {('client', 'al"ice'): [1, 2], ('outbound', 'direct'): [3, 4]},
+            ServiceState(running=True, enabled=False, uptime=12.5, api_available=True),
+            100)
+
+        assert 'veepeenet_xray_up 1\n' in metrics
+        assert 'veepeenet_xray_enabled 0\n' in metrics
+        assert 'veepeenet_xray_uptime_seconds 12.500\n' in metrics
+        assert 'veepeenet_client_traffic_bytes_total{client="al\\"ice",direction="uplink"} 1\n' in metrics
+        assert 'veepeenet_outbound_traffic_bytes_total{outbound="direct",direction="downlink"} 4\n' in metrics
+        assert '# TYPE veepeenet_inbound_traffic_bytes_total counter\n' in metrics
+
+
+class TestMetricsCache:
+
+    def test_refresh_merges_stored_and_runtime_stats(self, cache: MetricsCache):
+        with cache.journal as journal:
+            journal.append(VeePeeNetStats(client={'alice': TrafficStats(uplink=5, downlink=6)}))
+
+        cache.refresh()
+
+        metrics = cache.metrics.decode('utf-8')
+        assert 'veepeenet_client_traffic_bytes_total{client="alice",direction="uplink"} 15\n' in metrics
+        assert 'veepeenet_inbound_traffic_bytes_total{inbound="vless-inbound",direction="downlink"} 20\n' \
+            in metrics
+        assert 'veepeenet_xray_api_up 1\n' in metrics
+
+    def test_reads_journal_only_when_it_changes(self, cache: MetricsCache, mocker: MockFixture):
+        with cache.journal as journal:
+            journal.append(VeePeeNetStats(client={'alice': TrafficStats(uplink=5)}))
+        read_spy = mocker.spy(cache.journal, 'read')
+
+        cache.refresh()
+        cache.refresh()
+
+        assert read_spy.call_count == 1
+
+    def test_requeries_counters_moved_to_journal_by_collector(self, cache: MetricsCache):
+        def collect() -> list[tuple[str, int]]:
+            if cache.client.query_counters.call_count == 1:
+                with cache.journal as journal:
+                    journal.append(VeePeeNetStats(client={'alice': TrafficStats(uplink=10)}))
+                return [('user>>>alice.0001@0.0.0.0>>>traffic>>>uplink', 10)]
+            return []
+        cache.client.query_counters.side_effect = collect
+
+        cache.refresh()
+
+        assert cache.client.query_counters.call_count == 2
+        assert 'client="alice",direction="uplink"} 10\n' in cache.metrics.decode('utf-8')
+
+    def test_drops_deleted_clients(self, cache: MetricsCache):
+        cache.refresh()
+        cache.client.query_counters.return_value = []
+
+        cache.refresh()
+
+        assert 'client="alice"' not in cache.metrics.decode('utf-8')
+
+    def test_counters_drop_after_stats_reset(self, cache: MetricsCache):
+        with cache.journal as journal:
+            journal.append(VeePeeNetStats(inbound={'vless-inbound': TrafficStats(uplink=100)}))
+        cache.refresh()
+        cache.journal.reset()
+        cache.client.query_counters.return_value = []
+
+        cache.refresh()
+
+        assert 'inbound="vless-inbound"' not in cache.metrics.decode('utf-8')
+
+    def test_marks_api_down_on_query_failure(self, cache: MetricsCache):
+        cache.client.query_counters.side_effect = RuntimeError('down')
+
+        cache.refresh()
+
+        assert 'veepeenet_xray_api_up 0\n' in cache.metrics.decode('utf-8')
+
+
+class TestMetricsServer:
+
+    def test_serves_cached_metrics(self, cache: MetricsCache):
+        cache.refresh()
+        server = create_metrics_server('127.0.0.1', 0, cache)
+        Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}'
+            for _ in range(3):
+                with urlopen(f'{url}/metrics') as response:
+                    assert response.read() == cache.metrics
+                    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            with raises(HTTPError):
+                urlopen(f'{url}/other')  # pylint: disable=consider-using-with
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        cache.client.query_counters.assert_called_once()
+
+    def test_listens_on_ipv6_address(self, cache: MetricsCache):
+        server = create_metrics_server('::1', 0, cache)
+        try:
+            assert server.address_family == AF_INET6
+            assert server.server_address[0] == '::1'
+        finally:
+            server.server_close()
+
+
+class TestParseListen:
+
+    def test_parses_host_and_port(self):
+        assert _parse_listen('127.0.0.1:9550') == ('127.0.0.1', 9550)
+        assert _parse_listen('[::1]:9550') == ('::1', 9550)
+
+    def test_rejects_invalid_address(self, mocker: MockFixture):
+        mocker.patch('app.controller.commands.exporter.print_error')
+
+        with raises(Exit) as exc_info:
+            _parse_listen('9550')
+
+        assert exc_info.value.exit_code == EXIT_EXPORTER_INVALID_LISTEN
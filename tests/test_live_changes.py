@@ -0,0 +1,282 @@
+from pathlib import Path
+from uuid import UUID
+
+from pytest import fixture, mark
+from pytest_mock import MockFixture
+
+from app.controller import common
+from app.controller.common import (
+    apply_clients_changes,
+    apply_config_changes,
+    apply_routing_changes,
+    load_config,
+    save_config,
+)
+from app.controller.commands import clients as clients_commands
+from app.controller.commands.clients import add as add_clients, disable
+from app.controller.data import ClientData
+from app.model.routing import Rule
+from app.model.xray import Xray
+from app.utils import backup_config
+
+
+class TestApplyClientsChanges:
+
+    @fixture(name='applied_config')
+    def fixture_applied_config(self, mocker: MockFixture) -> Xray:
+        applied_config = load_config(Path('tests/resources/valid_xray_config_with_clients.json'))
+        mocker.patch('app.controller.common._load_applied_config', return_value=applied_config)
+        return applied_config
+
+    def test_skips_when_service_not_running(self, clients_config: Xray, mocker: MockFixture):
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=False)
+        add_mock = mocker.patch('app.controller.common.add_xray_inbound_users')
+
+        assert apply_clients_changes(clients_config, removed_emails=['a']) is False
+        add_mock.assert_not_called()
+
+    @mark.usefixtures('applied_config')
+    def test_reports_restart_required_on_failure(self, clients_config: Xray, mocker: MockFixture):
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
+        mocker.patch('app.controller.common.remove_xray_inbound_users', return_value=False)
+        add_mock = mocker.patch('app.controller.common.add_xray_inbound_users')
+        backup_mock = mocker.patch('app.controller.common.backup_config')
+        print_mock = mocker.patch('app.controller.common.stdout_console.print')
+
+        assert apply_clients_changes(
+            clients_config, removed_emails=['a'], refresh_backup=True) is False
+
+        add_mock.assert_not_called()
+        backup_mock.assert_not_called()
+        assert 'restart required' in str(print_mock.call_args[0][0])
+
+    @mark.usefixtures('applied_config')
+    def test_refreshes_backup_after_success(self, clients_config: Xray, mocker: MockFixture):
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
+        mocker.patch('app.controller.common.remove_xray_inbound_users', return_value=True)
+        mocker.patch('app.controller.common.add_xray_inbound_users', return_value=True)
+        backup_mock = mocker.patch('app.controller.common.backup_config')
+        mocker.patch('app.controller.common.stdout_console.print')
+
+        assert apply_clients_changes(clients_config, refresh_backup=True) is True
+
+        backup_mock.assert_called_once()
+
+    def test_new_short_ids_require_restart(
+            self, clients_config: Xray, applied_config: Xray, mocker: MockFixture):
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
+        add_mock = mocker.patch('app.controller.common.add_xray_inbound_users')
+        backup_mock = mocker.patch('app.controller.common.backup_config')
+        print_mock = mocker.patch('app.controller.common.stdout_console.print')
+        inbound = clients_config.get_vless_inbound()
+        assert inbound is not None and inbound.settings.clients
+        new_client = ClientData(name='new', namespace=UUID(int=0))
+        inbound.settings.clients.append(new_client.to_model())
+        inbound.stream_settings.reality_settings.short_ids.append(new_client.short_id)
+        applied_inbound = applied_config.get_vless_inbound()
+        assert applied_inbound is not None
+        assert new_client.short_id not in applied_inbound.stream_settings.reality_settings.short_ids
+
+        assert apply_clients_changes(
+            clients_config, added_clients=[new_client.to_model()], refresh_backup=True) is False
+
+        add_mock.assert_not_called()
+        backup_mock.assert_not_called()
+        assert 'restart required' in str(print_mock.call_args[0][0])
+
+    def test_add_clients_pushes_only_new_clients(
+            self, clients_config: Xray, mocker: MockFixture):
+        mocker.patch('app.controller.commands.clients.check_root')
+        mocker.patch('app.controller.commands.clients.check_xray_config')
+        mocker.patch(
+            'app.controller.commands.clients.load_config', return_value=clients_config)
+        mocker.patch('app.controller.commands.clients.save_config')
+        mocker.patch('app.controller.commands.clients.is_config_applied', return_value=True)
+        mocker.patch('app.controller.commands.clients.stdout_console.print')
+        apply_mock = mocker.patch('app.controller.commands.clients.apply_clients_changes')
+
+        add_clients(['new1'], _debug=True)
+
+        added_clients = apply_mock.call_args.kwargs['added_clients']
+        assert [client.email.split('.')[0] for client in added_clients] == ['new1']
+        assert apply_mock.call_args.kwargs['refresh_backup'] is True
+
+    def test_disable_pushes_routing_to_running_service(
+            self, clients_config: Xray, mocker: MockFixture):
+        mocker.patch('app.controller.commands.clients.check_root')
+        mocker.patch('app.controller.commands.clients.check_xray_config')
+        mocker.patch(
+            'app.controller.commands.clients.load_config', return_value=clients_config)
+        mocker.patch('app.controller.commands.clients.save_config')
+        mocker.patch('app.controller.commands.clients.stdout_console.print')
+        clients_apply_mock = mocker.patch('app.controller.commands.clients.apply_clients_changes')
+        routing_apply_mock = mocker.patch('app.controller.commands.clients.apply_routing_changes')
+
+        disable(['c1.client'], _debug=True)
+
+        clients_apply_mock.assert_not_called()
+        applied_config: Xray = routing_apply_mock.call_args[0][0]
+        assert applied_config.routing is not None and applied_config.routing.rules is not None
+        assert applied_config.routing.rules[0].user == ['c1.client.0001@0.0.0.0']
+
+
+class TestLiveClientsCommands:
+
+    @fixture(name='running_config_path')
+    def fixture_running_config_path(
+            self, managed_config_path: Path, clients_config: Xray, mocker: MockFixture) -> Path:
+        save_config(clients_config, managed_config_path)
+        backup_config(managed_config_path, managed_config_path.with_name('config.json.bak'))
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
+        return managed_config_path
+
+    def test_remove_pushes_to_running_service(self, running_config_path: Path, mocker: MockFixture):
+        remove_mock = mocker.patch('app.controller.common.remove_xray_inbound_users', return_value=True)
+        mocker.patch('app.controller.common.add_xray_inbound_users', return_value=True)
+        apply_mock = mocker.spy(clients_commands, 'apply_clients_changes')
+
+        clients_commands._remove_clients(  # pylint: disable=protected-access
+            ['c1.client'], running_config_path)
+
+        assert apply_mock.spy_return is True
+        assert remove_mock.call_args[0][3] == ['c1.client.0001@0.0.0.0']
+        applied_inbound = load_config(running_config_path.with_name('config.json.bak')).get_vless_inbound()
+        assert applied_inbound is not None and not applied_inbound.settings.clients
+
+    def test_add_reports_restart_for_new_short_ids(self, running_config_path: Path, mocker: MockFixture):
+        add_mock = mocker.patch('app.controller.common.add_xray_inbound_users', return_value=True)
+        print_mock = mocker.patch('app.controller.common.stdout_console.print')
+        apply_mock = mocker.spy(clients_commands, 'apply_clients_changes')
+
+        clients_commands._add_clients(['new1'], running_config_path)  # pylint: disable=protected-access
+
+        assert apply_mock.spy_return is False
+        add_mock.assert_not_called()
+        message = str(print_mock.call_args[0][0])
+        assert 'short ids of new clients' in message and 'restart required' in message
+
+
+class TestApplyRoutingChanges:
+
+    @fixture(name='applied_config_path')
+    def fixture_applied_config_path(self, tmp_path: Path, mocker: MockFixture) -> Path:
+        backup_path = tmp_path / 'config.json.bak'
+        backup_path.write_text(
+            Path('tests/resources/valid_xray_config_with_clients.json').read_text(encoding='utf-8'),
+            encoding='utf-8')
+        mocker.patch('app.controller.common.XRAY_CONFIG_BACKUP_PATH', backup_path)
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
+        mocker.patch('app.controller.common.stdout_console.print')
+        return backup_path
+
+    def test_skips_when_service_not_running(self, applied_config_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=False)
+        replace_mock = mocker.patch('app.controller.common.replace_xray_routing_rules')
+
+        assert apply_routing_changes(load_config(applied_config_path)) is False
+        replace_mock.assert_not_called()
+
+    def test_replaces_rules_and_refreshes_backup(self, applied_config_path: Path, mocker: MockFixture):
+        replace_mock = mocker.patch('app.controller.common.replace_xray_routing_rules', return_value=True)
+        backup_mock = mocker.patch('app.controller.common.backup_config')
+        xray_config = load_config(applied_config_path)
+        assert xray_config.routing is not None and xray_config.routing.rules is not None
+        xray_config.routing.rules.append(Rule(tag='new.5', outbound_tag='direct', domain=['example.com']))
+
+        assert apply_routing_changes(xray_config) is True
+
+        assert replace_mock.call_args[0][2] == xray_config.routing.rules
+        backup_mock.assert_called_once()
+
+    def test_requires_restart_when_not_only_rules_changed(
+            self, applied_config_path: Path, mocker: MockFixture):
+        replace_mock = mocker.patch('app.controller.common.replace_xray_routing_rules')
+        restart_mock = mocker.patch('app.controller.common.print_restart_required')
+        xray_config = load_config(applied_config_path)
+        assert xray_config.routing is not None
+        xray_config.routing.domain_strategy = 'IPOnDemand'
+
+        assert apply_routing_changes(xray_config) is False
+
+        replace_mock.assert_not_called()
+        restart_mock.assert_called_once()
+
+    def test_requires_restart_when_api_call_failed(self, applied_config_path: Path, mocker: MockFixture):
+        mocker.patch('app.controller.common.replace_xray_routing_rules', return_value=False)
+        backup_mock = mocker.patch('app.controller.common.backup_config')
+        restart_mock = mocker.patch('app.controller.common.print_restart_required')
+
+        assert apply_routing_changes(load_config(applied_config_path)) is False
+
+        backup_mock.assert_not_called()
+        restart_mock.assert_called_once()
+
+
+class TestApplyConfigChanges:
+
+    @fixture(name='applied_config')
+    def fixture_applied_config(self, managed_config_path: Path, mocker: MockFixture) -> Xray:
+        managed_config_path.with_name('config.json.bak').write_bytes(managed_config_path.read_bytes())
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
+        return load_config(managed_config_path)
+
+    @staticmethod
+    def _save(xray_config: Xray) -> None:
+        save_config(xray_config, common.XRAY_CONFIG_PATH)
+
+    def test_pushes_clients_and_rules_without_restart(self, applied_config: Xray, mocker: MockFixture):
+        remove_mock = mocker.patch('app.controller.common.remove_xray_inbound_users', return_value=True)
+        add_mock = mocker.patch('app.controller.common.add_xray_inbound_users', return_value=True)
+        replace_mock = mocker.patch('app.controller.common.replace_xray_routing_rules', return_value=True)
+        backup_mock = mocker.patch('app.controller.common.backup_config')
+        restart_mock = mocker.patch('app.controller.common.restart_service')
+        inbound = applied_config.get_vless_inbound()
+        assert inbound is not None and inbound.settings.clients and applied_config.routing is not None
+        removed_client = inbound.settings.clients.pop(0)
+        inbound.stream_settings.reality_settings.short_ids.pop(0)
+        applied_config.routing.rules = [Rule(tag='new.5', outbound_tag='direct', domain=['example.com'])]
+        self._save(applied_config)
+
+        apply_config_changes(applied_config)
+
+        assert remove_mock.call_args[0][3] == [removed_client.email]
+        assert add_mock.call_args[0][3] == []
+        assert replace_mock.call_args[0][2] == applied_config.routing.rules
+        backup_mock.assert_called_once()
+        restart_mock.assert_not_called()
+
+    def test_restarts_when_not_only_clients_and_rules_changed(
+            self, applied_config: Xray, mocker: MockFixture):
+        add_mock = mocker.patch('app.controller.common.add_xray_inbound_users')
+        restart_mock = mocker.patch('app.controller.common.restart_service')
+        applied_config.outbounds.reverse()
+        self._save(applied_config)
+
+        apply_config_changes(applied_config)
+
+        add_mock.assert_not_called()
+        restart_mock.assert_called_once_with(test_config=False)
+
+    def test_restarts_when_short_ids_added(self, applied_config: Xray, mocker: MockFixture):
+        add_mock = mocker.patch('app.controller.common.add_xray_inbound_users')
+        backup_mock = mocker.patch('app.controller.common.backup_config')
+        restart_mock = mocker.patch('app.controller.common.restart_service')
+        inbound = applied_config.get_vless_inbound()
+        assert inbound is not None and inbound.settings.clients is not None
+        new_client = ClientData(name='new', namespace=UUID(int=0))
+        inbound.settings.clients.append(new_client.to_model())
+        inbound.stream_settings.reality_settings.short_ids.append(new_client.short_id)
+        self._save(applied_config)
+
+        apply_config_changes(applied_config)
+
+        add_mock.assert_not_called()
+        backup_mock.assert_not_called()
+        restart_mock.assert_called_once_with(test_config=False)
+
+    def test_skips_applied_config(self, applied_config: Xray, mocker: MockFixture):
+        restart_mock = mocker.patch('app.controller.common.restart_service')
+
+        apply_config_changes(applied_config)
+
+        restart_mock.assert_not_called()
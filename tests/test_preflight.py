@@ -0,0 +1,120 @@
+import json
+from pathlib import Path
+from typing import Any
+
+from pytest import fixture, mark, raises
+
+from app.model.xray import Xray
+from app.preflight import get_config_problems, read_geo_tags
+
+
+def _encode_varint(value: int) -> bytes:
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append(value & 0x7f | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _write_geo_data(geo_data_path: Path, *codes: str) -> Path:
+    content = bytearray()
+    for code in codes:
+        entry = b'\x0a' + _encode_varint(len(code)) + code.encode('utf-8') + b'\x12\x03abc' * 50
+        content += b'\x0a' + _encode_varint(len(entry)) + entry
+    geo_data_path.write_bytes(bytes(content))
+    return geo_data_path
+
+
+@fixture(name='config_data')
+def fixture_config_data() -> dict[str, Any]:
+    return json.loads(Path('tests/resources/valid_xray_config_with_clients.json').read_text(encoding='utf-8'))
+
+
+@fixture(name='geo_paths')
+def fixture_geo_paths(tmp_path: Path) -> tuple[Path, Path]:
+    return (_write_geo_data(tmp_path / 'geoip.dat', 'PRIVATE', 'CN'),
+            _write_geo_data(tmp_path / 'geosite.dat', 'GOOGLE', 'CATEGORY-ADS-ALL'))
+
+
+def _get_problems(config_data: dict[str, Any], geo_paths: tuple[Path, Path]) -> list[str]:
+    return get_config_problems(Xray.model_validate(config_data, by_alias=True), *geo_paths)
+
+
+class TestReadGeoTags:
+
+    def test_reads_country_codes(self, tmp_path: Path):
+        geo_data_path = _write_geo_data(tmp_path / 'geosite.dat', 'google', 'CATEGORY-ADS-ALL', 'X' * 200)
+
+        assert read_geo_tags(geo_data_path) == {'GOOGLE', 'CATEGORY-ADS-ALL', 'X' * 200}
+
+    def test_truncated_file(self, tmp_path: Path):
+        geo_data_path = _write_geo_data(tmp_path / 'geosite.dat', 'GOOGLE')
+        geo_data_path.write_bytes(geo_data_path.read_bytes() + b'\x0a\xff')
+
+        with raises(ValueError):
+            read_geo_tags(geo_data_path)
+
+
+class TestGetConfigProblems:
+
+    def test_valid_config(self, config_data: dict[str, Any], geo_paths: tuple[Path, Path]):
+        assert not _get_problems(config_data, geo_paths)
+
+    def test_reports_all_problems(self, config_data: dict[str, Any], geo_paths: tuple[Path, Path]):
+        config_data['inbounds'][0]['streamSettings']['realitySettings']['shortIds'] = []
+        config_data['outbounds'].append({'tag': 'direct', 'protocol': 'freedom'})
+        config_data['routing']['rules'].extend([
+            {'tag': 'to-missing', 'outboundTag': 'missing'},
+            {'tag': 'bad-port', 'outboundTag': 'direct', 'port': '443,2000-1000'},
+            {'outboundTag': 'direct', 'domain': ['geosite:google@ads', 'geosite:unknown'],
+             'ip': ['geoip:!cn', 'geoip:unknown']},
+        ])
+
+        problems = _get_problems(config_data, geo_paths)
+
+        assert problems == [
+            'Duplicate outbound tag "direct"',
+            'Routing rule "to-missing" uses unknown outbound "missing"',
+            'Routing rule "bad-port" has malformed port "443,2000-1000"',
+            'Vless inbound has 1 clients but 0 short ids',
+            f'Tag "geoip:unknown" not found in {geo_paths[0]}',
+            f'Tag "geosite:unknown" not found in {geo_paths[1]}',
+        ]
+
+    @mark.parametrize('port, listen, conflict', [
+        (10085, '0.0.0.0', True),
+        ('10000-10100', '127.0.0.1', True),
+        (10085, '10.0.0.1', False),
+        (443, '0.0.0.0', False),
+    ])
+    def test_api_port_conflict(
+            self, config_data: dict[str, Any], geo_paths: tuple[Path, Path],
+            port: int | str, listen: str, conflict: bool):
+        config_data['api'] = {'tag': 'api', 'listen': '127.0.0.1:10085'}
+        config_data['inbounds'][0].update(port=port, listen=listen)
+
+        problems = _get_problems(config_data, geo_paths)
+
+        assert bool(problems) is conflict
+        assert all('conflicts with API listener' in problem for problem in problems)
+
+    @mark.parametrize('port', ['abc', '0-70000', '443,', '-443'])
+    def test_malformed_inbound_port(
+            self, config_data: dict[str, Any], geo_paths: tuple[Path, Path], port: str):
+        config_data['inbounds'][0]['port'] = port
+
+        assert _get_problems(config_data, geo_paths) == [
+            f'Inbound "vless-inbound" has malformed port "{port}"']
+
+    def test_duplicate_inbound_and_rule_tags(self, config_data: dict[str, Any], geo_paths: tuple[Path, Path]):
+        config_data['api'] = {'tag': 'vless-inbound', 'listen': '127.0.0.1:10085'}
+        config_data['routing']['rules'].extend([{'tag': 'rule', 'outboundTag': 'direct'}] * 2)
+
+        assert _get_problems(config_data, geo_paths) == [
+            'Duplicate inbound tag "vless-inbound"', 'Duplicate routing rule tag "rule"']
+
+    def test_missing_geo_data(self, config_data: dict[str, Any], tmp_path: Path):
+        problems = _get_problems(config_data, (tmp_path / 'geoip.dat', tmp_path / 'geosite.dat'))
+
+        assert problems == [f'Geodata file {tmp_path / "geoip.dat"} is not installed']
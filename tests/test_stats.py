@@ -0,0 +1,402 @@
+import json
+from fcntl import LOCK_EX, LOCK_NB, flock
+from pathlib import Path
+from time import time
+
+from pytest import fixture, mark, raises
+from pytest_mock import MockFixture
+from typer import Exit
+
+from app.controller.common import get_runtime_stats, load_config
+from app.controller.commands.clients import show as list_clients
+from app.controller.commands.outbound import show as list_outbounds
+from app.controller.data import StatsData
+from app.controller.commands.state import reset_stats, store_stats
+from app.controller.commands.stats import history as stats_history, live_top, top as stats_top
+from app.defaults import (
+    EXIT_CLIENTS_ERROR,
+    EXIT_STATS_INVALID_DURATION,
+    EXIT_STATS_API_UNAVAILABLE,
+)
+from app.model.veepeenet import VeePeeNetStats, TrafficStats
+from app.model.xray import Xray
+from app.stats_history import StatsHistory
+from app.stats_journal import StatsJournal, to_stats_record
+
+
+@fixture(name='stats_paths')
+def fixture_stats_paths(tmp_path: Path, mocker: MockFixture) -> tuple[Path, Path]:
+    stats_path = tmp_path / 'stats.json'
+    journal_path = tmp_path / 'stats.journal'
+    mocker.patch('app.controller.common.VEEPEENET_STATS_PATH', stats_path)
+    mocker.patch('app.controller.common.VEEPEENET_STATS_JOURNAL_PATH', journal_path)
+    mocker.patch('app.controller.common.VEEPEENET_STATS_HISTORY_PATH', tmp_path / 'history')
+    mocker.patch('app.controller.commands.stats.VEEPEENET_STATS_PATH', stats_path)
+    mocker.patch('app.controller.commands.stats.VEEPEENET_STATS_JOURNAL_PATH', journal_path)
+    return stats_path, journal_path
+
+
+class TestCollectAndSaveStats:
+
+    def test_does_nothing_if_service_not_running(self, stats_paths: tuple[Path, Path], mocker: MockFixture):
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=False)
+        query_mock = mocker.patch('app.controller.common.query_xray_stats')
+
+        from app.controller.common import _store_runtime_stats # type: ignore # pylint: disable=import-outside-toplevel
+        _store_runtime_stats()
+
+        query_mock.assert_not_called()
+        assert not stats_paths[1].exists()
+
+    def test_appends_runtime_stats_to_journal(self, stats_paths: tuple[Path, Path], mocker: MockFixture):
+        from app.controller.common import _store_runtime_stats # type: ignore # pylint: disable=import-outside-toplevel
+        from app.controller.common import get_stored_stats # pylint: disable=import-outside-toplevel
+
+        stats_path, journal_path = stats_paths
+        stats_path.write_text(
+            json.dumps({'client': {'c1.client': {'uplink': 1, 'downlink': 2}}}), encoding='utf-8')
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
+        query_mock = mocker.patch('app.controller.common.query_xray_stats', side_effect=[
+            [('user>>>c1.client.1@0.0.0.0>>>traffic>>>uplink', 100),
+             ('user>>>c1.client.1@0.0.0.0>>>traffic>>>downlink', 200)],
+            [('user>>>c1.client.1@0.0.0.0>>>traffic>>>uplink', 100),
+             ('user>>>c1.client.1@0.0.0.0>>>traffic>>>downlink', 200)],
+        ])
+
+        _store_runtime_stats()
+
+        assert query_mock.call_args_list[0].kwargs.get('reset', False) is False
+        assert query_mock.call_args_list[1].kwargs['reset'] is True
+        assert json.loads(stats_path.read_text(encoding='utf-8'))['client']['c1.client']['uplink'] == 1
+        assert len(journal_path.read_text(encoding='utf-8').splitlines()) == 2
+        stored_stats = get_stored_stats()
+        assert stored_stats.client['c1.client'].uplink == 101
+        assert stored_stats.client['c1.client'].downlink == 202
+        history = StatsHistory(stats_path.parent / 'history').total(time() - 3600, subject='client')
+        assert history.client == {'c1.client': TrafficStats(uplink=100, downlink=200)}
+
+
+class TestStoreStatsCommand:
+
+    @mark.usefixtures('stats_paths')
+    def test_stores_counters_before_reset(self, stats_paths: tuple[Path, Path], mocker: MockFixture):
+        from app.controller.common import get_stored_stats # pylint: disable=import-outside-toplevel
+
+        check_root_mock = mocker.patch('app.controller.commands.state.check_root')
+        query_mock = mocker.patch('app.controller.common.query_xray_stats', side_effect=[
+            [('user>>>alice.123@0.0.0.0>>>traffic>>>uplink', 100),
+             ('inbound>>>vless-inbound>>>traffic>>>downlink', 200)],
+            [('user>>>alice.123@0.0.0.0>>>traffic>>>uplink', 150),
+             ('inbound>>>vless-inbound>>>traffic>>>downlink', 20),
+             ('outbound>>>direct>>>traffic>>>uplink', 5)],
+        ])
+
+        store_stats()
+
+        check_root_mock.assert_called_once()
+        assert query_mock.call_args_list[1].kwargs['reset'] is True
+        assert [json.loads(line) for line in stats_paths[1].read_text(encoding='utf-8').splitlines()[1:]] == [
+            to_stats_record(VeePeeNetStats(client={'alice': TrafficStats(uplink=100)},
+                           inbound={'vless-inbound': TrafficStats(downlink=200)})),
+            to_stats_record(VeePeeNetStats(client={'alice': TrafficStats(uplink=50)},
+                           inbound={'vless-inbound': TrafficStats(downlink=20)},
+                           outbound={'direct': TrafficStats(uplink=5)})),
+        ]
+        assert get_stored_stats().client == {'alice': TrafficStats(uplink=150)}
+
+    def test_holds_journal_lock_while_resetting(self, stats_paths: tuple[Path, Path], mocker: MockFixture):
+        mocker.patch('app.controller.commands.state.check_root')
+        lock_held = []
+
+        def query(*_, reset: bool = False, **__) -> list[tuple[str, int]]:
+            # A collector of the same counters must wait until they are reset and journaled
+            with StatsJournal(*stats_paths) as journal, open(journal.lock_path, 'rb') as lock_file:
+                try:
+                    flock(lock_file, LOCK_EX | LOCK_NB)
+                except BlockingIOError:
+                    lock_held.append(reset)
+            return [('user>>>alice.123@0.0.0.0>>>traffic>>>uplink', 100)]
+
+        mocker.patch('app.controller.common.query_xray_stats', side_effect=query)
+
+        store_stats()
+
+        assert lock_held == [False, True]
+
+    def test_keeps_stored_counters_when_reset_fails(
+            self, stats_paths: tuple[Path, Path], mocker: MockFixture):
+        from app.controller.common import get_stored_stats # pylint: disable=import-outside-toplevel
+
+        mocker.patch('app.controller.commands.state.check_root')
+        mocker.patch('app.controller.common.query_xray_stats', side_effect=[
+            [('user>>>alice.123@0.0.0.0>>>traffic>>>uplink', 100)],
+            RuntimeError('crash'),
+        ])
+
+        with raises(RuntimeError):
+            store_stats(_debug=True)
+
+        assert stats_paths[1].exists()
+        assert get_stored_stats().client == {'alice': TrafficStats(uplink=100)}
+
+    def test_does_nothing_when_api_has_no_stats(self, stats_paths: tuple[Path, Path], mocker: MockFixture):
+        mocker.patch('app.controller.commands.state.check_root')
+        mocker.patch('app.controller.common.query_xray_stats', return_value=[])
+
+        store_stats()
+
+        assert not stats_paths[1].exists()
+
+    def test_raises_when_not_root(self, mocker: MockFixture):
+        mocker.patch(
+            'app.controller.commands.state.check_root',
+            side_effect=Exit(code=1))
+        query_mock = mocker.patch('app.controller.common.query_xray_stats')
+
+        with raises(Exit) as exc_info:
+            store_stats(_debug=True)
+
+        assert exc_info.value.exit_code == 1
+        query_mock.assert_not_called()
+
+
+class TestScopedStatsQueries:
+
+    @fixture(name='config_with_clients')
+    def fixture_config_with_clients(self) -> Xray:
+        return load_config(Path('tests/resources/valid_xray_config_with_clients.json'))
+
+    def test_runtime_stats_query_uses_pattern_and_filters_result(self, mocker: MockFixture):
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
+        query_mock = mocker.patch('app.controller.common.query_xray_stats', return_value=[
+            ('outbound>>>direct>>>traffic>>>uplink', 10),
+            ('inbound>>>xoutbound>>>traffic>>>uplink', 20),
+        ])
+
+        result = get_runtime_stats(subject=StatsData.SubjectType.OUTBOUND)
+
+        assert query_mock.call_args.kwargs == {'reset': False, 'pattern': 'outbound>>>'}
+        assert result == VeePeeNetStats(outbound={'direct': TrafficStats(uplink=10)})
+
+    def test_single_client_list_queries_one_client(self, config_with_clients: Xray, mocker: MockFixture):
+        mocker.patch('app.controller.commands.clients.check_xray_config')
+        mocker.patch('app.controller.commands.clients.load_config', return_value=config_with_clients)
+        mocker.patch('app.controller.commands.clients.get_stored_stats', return_value=VeePeeNetStats())
+        mocker.patch('app.utils.gen_xray_password', return_value='random-password-1')
+        print_json_mock = mocker.patch('app.controller.commands.clients.stdout_console.print_json')
+        runtime_stats_mock = mocker.patch(
+            'app.controller.commands.clients.get_runtime_stats',
+            return_value=VeePeeNetStats(client={'c1.client': TrafficStats(downlink=7)}))
+
+        list_clients(['c1.client'], json=True, _debug=True)
+
+        runtime_stats_mock.assert_called_once_with(
+            subject=StatsData.SubjectType.CLIENT, name='c1.client.0001@0.0.0.0')
+        clients_json = json.loads(print_json_mock.call_args[0][0])['clients']
+        assert [client['name'] for client in clients_json] == ['c1.client']
+        assert clients_json[0]['stats'] == {'uplink': 0, 'downlink': 7}
+
+    def test_unknown_client_in_list_exits(self, config_with_clients: Xray, mocker: MockFixture):
+        mocker.patch('app.controller.commands.clients.check_xray_config')
+        mocker.patch('app.controller.commands.clients.load_config', return_value=config_with_clients)
+        mocker.patch('app.controller.commands.clients.print_error')
+
+        with raises(Exit) as exc_info:
+            list_clients(['missing'], _debug=True)
+
+        assert exc_info.value.exit_code == EXIT_CLIENTS_ERROR
+
+    def test_list_commands_skip_stats(self, config_with_clients: Xray, mocker: MockFixture):
+        for module in ('clients', 'outbound'):
+            mocker.patch(f'app.controller.commands.{module}.check_xray_config')
+            mocker.patch(f'app.controller.commands.{module}.load_config', return_value=config_with_clients)
+        mocker.patch('app.utils.gen_xray_password', return_value='random-password-1')
+        mocker.patch('app.controller.commands.clients.stdout_console.print_json')
+        print_view_mock = mocker.patch('app.controller.commands.outbound.print_view')
+        stored_mocks = [mocker.patch(f'app.controller.commands.{module}.get_stored_stats')
+                        for module in ('clients', 'outbound')]
+        runtime_mocks = [mocker.patch(f'app.controller.commands.{module}.get_runtime_stats')
+                         for module in ('clients', 'outbound')]
+
+        list_clients(json=True, no_stats=True, _debug=True)
+        list_outbounds(no_stats=True, _debug=True)
+
+        for mock in stored_mocks + runtime_mocks:
+            mock.assert_not_called()
+        assert all(outbound.stats is None for outbound in print_view_mock.call_args[0][0].outbounds)
+
+
+class TestStatsHistoryCommands:
+
+    @fixture(name='history_dir')
+    def fixture_history_dir(self, tmp_path: Path, mocker: MockFixture) -> Path:
+        history_dir = tmp_path / 'history'
+        mocker.patch('app.controller.commands.stats.VEEPEENET_STATS_HISTORY_PATH', history_dir)
+        now = time()
+        history = StatsHistory(history_dir)
+        history.record(VeePeeNetStats(
+            client={'alice': TrafficStats(uplink=1, downlink=2), 'bob': TrafficStats(uplink=10, downlink=20)},
+            outbound={'direct': TrafficStats(uplink=11, downlink=22)}), at=now - 600)
+        history.record(VeePeeNetStats(client={'alice': TrafficStats(uplink=3, downlink=4)}), at=now - 5 * 3600)
+        return history_dir
+
+    @mark.usefixtures('history_dir')
+    def test_history_shows_client_buckets(self, mocker: MockFixture):
+        print_json_mock = mocker.patch('app.controller.common.stdout_console.print_json')
+
+        stats_history(client='alice', since='1h', json=True, _debug=True)
+
+        history_json = json.loads(print_json_mock.call_args[0][0])
+        assert history_json['subject'] == 'client'
+        assert history_json['resolution'] == '5m'
+        assert history_json['total'] == {'uplink': 1, 'downlink': 2}
+        assert len(history_json['buckets']) == 1
+
+    @mark.usefixtures('history_dir')
+    def test_history_rejects_invalid_window(self, mocker: MockFixture):
+        mocker.patch('app.controller.commands.stats.print_error')
+
+        with raises(Exit) as exc_info:
+            stats_history(since='yesterday', _debug=True)
+
+        assert exc_info.value.exit_code == EXIT_STATS_INVALID_DURATION
+
+    @mark.usefixtures('history_dir')
+    def test_top_ranks_clients_in_window(self, mocker: MockFixture):
+        print_json_mock = mocker.patch('app.controller.common.stdout_console.print_json')
+
+        stats_top(window='1h', json=True, _debug=True)
+
+        rank_json = json.loads(print_json_mock.call_args[0][0])
+        assert [item['name'] for item in rank_json['items']] == ['bob', 'alice']
+        assert rank_json['items'][1]['stats'] == {'uplink': 1, 'downlink': 2}
+
+        stats_top(window='1d', limit=1, json=True, _debug=True)
+
+        rank_json = json.loads(print_json_mock.call_args[0][0])
+        assert [item['name'] for item in rank_json['items']] == ['bob']
+
+
+class TestLiveTopCommand:
+
+    @mark.usefixtures('stats_paths')
+    def test_prints_top_rates_without_resetting_counters(self, mocker: MockFixture):
+        client_mock = mocker.patch('app.controller.commands.stats.get_stats_client').return_value
+        client_mock.query_counters.side_effect = [
+            [('user>>>alice.1@0.0.0.0>>>traffic>>>downlink', 0),
+             ('user>>>bob.2@0.0.0.0>>>traffic>>>downlink', 0),
+             ('outbound>>>direct>>>traffic>>>uplink', 0)],
+            [('user>>>alice.1@0.0.0.0>>>traffic>>>downlink', 400),
+             ('user>>>bob.2@0.0.0.0>>>traffic>>>downlink', 4000),
+             ('outbound>>>direct>>>traffic>>>uplink', 0)],
+        ]
+        mocker.patch('app.controller.commands.stats.monotonic', side_effect=[0.0, 2.0])
+        mocker.patch('app.controller.commands.stats.sleep')
+        print_json_mock = mocker.patch('app.controller.common.stdout_console.print_json')
+
+        live_top(interval=2, limit=1, json=True, _debug=True)
+
+        client_mock.query_counters.assert_called_with()
+        rates_json = json.loads(print_json_mock.call_args[0][0])
+        assert rates_json['clients'] == [{'name': 'bob', 'uplink': 0.0, 'downlink': 2000.0}]
+        assert rates_json['outbounds'] == []
+
+    def test_counts_traffic_moved_to_journal_by_collector(
+            self, stats_paths: tuple[Path, Path], mocker: MockFixture):
+        with StatsJournal(*stats_paths) as journal:
+            journal.append(VeePeeNetStats(client={'alice': TrafficStats(downlink=5000)}))
+        counters = [
+            [('user>>>alice.1@0.0.0.0>>>traffic>>>downlink', 1000)],
+            [('user>>>alice.1@0.0.0.0>>>traffic>>>downlink', 1200)],
+            [('user>>>alice.1@0.0.0.0>>>traffic>>>downlink', 100)],
+        ]
+
+        def query_counters() -> list[tuple[str, int]]:
+            if len(counters) == 2:
+                # The collector resets the counters and journals them after the second query
+                with StatsJournal(*stats_paths) as collector_journal:
+                    collector_journal.append(VeePeeNetStats(client={'alice': TrafficStats(downlink=1300)}))
+            return counters.pop(0)
+
+        client_mock = mocker.patch('app.controller.commands.stats.get_stats_client').return_value
+        client_mock.query_counters.side_effect = query_counters
+        mocker.patch('app.controller.commands.stats.monotonic', side_effect=[0.0, 2.0])
+        mocker.patch('app.controller.commands.stats.sleep')
+        print_json_mock = mocker.patch('app.controller.common.stdout_console.print_json')
+
+        live_top(interval=2, json=True, _debug=True)
+
+        rates_json = json.loads(print_json_mock.call_args[0][0])
+        assert rates_json['clients'] == [{'name': 'alice', 'uplink': 0.0, 'downlink': 200.0}]
+
+    def test_exits_when_api_is_unavailable(self, mocker: MockFixture):
+        client_mock = mocker.patch('app.controller.commands.stats.get_stats_client').return_value
+        client_mock.query_counters.side_effect = RuntimeError('down')
+        mocker.patch('app.controller.commands.stats.print_error')
+
+        with raises(Exit) as exc_info:
+            live_top(json=True, _debug=True)
+
+        assert exc_info.value.exit_code == EXIT_STATS_API_UNAVAILABLE
+
+
+class TestClearStats:
+
+    @fixture(name='stored_stats')
+    def fixture_stored_stats(self, stats_paths: tuple[Path, Path]) -> tuple[Path, Path]:
+        with StatsJournal(*stats_paths) as journal:
+            journal.append(VeePeeNetStats(client={'alice': TrafficStats(uplink=1)}))
+        return stats_paths
+
+    def test_resets_only_stats_file_if_service_not_running(
+            self, stored_stats: tuple[Path, Path], mocker: MockFixture):
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=False)
+        reset_mock = mocker.patch('app.controller.common.reset_xray_stats')
+        print_mock = mocker.patch('app.controller.common.stdout_console.print')
+
+        from app.controller.common import clear_stats, get_stored_stats # pylint: disable=import-outside-toplevel
+        clear_stats()
+
+        reset_mock.assert_not_called()
+        assert get_stored_stats() == VeePeeNetStats()
+        assert len(stored_stats[1].read_text(encoding='utf-8').splitlines()) == 1
+        print_mock.assert_called_once()
+
+    @mark.usefixtures('stored_stats')
+    def test_resets_stats_file_and_api_if_service_running(self, mocker: MockFixture):
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
+        reset_mock = mocker.patch('app.controller.common.reset_xray_stats', return_value=True)
+        mocker.patch('app.controller.common.stdout_console.print')
+
+        from app.controller.common import clear_stats, get_stored_stats # pylint: disable=import-outside-toplevel
+        clear_stats()
+
+        reset_mock.assert_called_once()
+        assert get_stored_stats() == VeePeeNetStats()
+
+    def test_raises_if_api_reset_fails(self, stored_stats: tuple[Path, Path], mocker: MockFixture):
+        mocker.patch('app.controller.common.is_xray_service_running', return_value=True)
+        mocker.patch('app.controller.common.reset_xray_stats', return_value=False)
+
+        from app.controller.common import clear_stats, get_stored_stats # pylint: disable=import-outside-toplevel
+        with raises(RuntimeError, match='Failed to reset Xray API stats'):
+            clear_stats()
+
+        assert get_stored_stats().client['alice'].uplink == 1
+        assert stored_stats[0].exists() is False
+
+
+class TestResetStatsCommand:
+
+    def test_runs_checks_and_clears_stats(self, mocker: MockFixture):
+        check_root_mock = mocker.patch('app.controller.commands.state.check_root')
+        check_xray_config_mock = mocker.patch('app.controller.commands.state.check_xray_config')
+        check_distrib_mock = mocker.patch('app.controller.commands.state.check_distrib')
+        clear_stats_mock = mocker.patch('app.controller.commands.state.clear_stats')
+
+        reset_stats()
+
+        check_root_mock.assert_called_once()
+        check_xray_config_mock.assert_called_once()
+        check_distrib_mock.assert_called_once()
+        clear_stats_mock.assert_called_once()
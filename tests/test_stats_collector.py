@@ -0,0 +1,111 @@
+from fcntl import LOCK_EX, LOCK_NB, flock
+from pathlib import Path
+from threading import Timer
+from unittest.mock import MagicMock
+
+from pytest import fixture
+from pytest_mock import MockFixture
+
+from app.model.veepeenet import TrafficStats
+from app.stats_collector import StatsCollector
+from app.stats_history import StatsHistory
+from app.stats_journal import StatsJournal
+
+
+def _stats(uplink: int = 1, downlink: int = 2) -> list[tuple[str, int]]:
+    return [
+        ('user>>>alice.0001@0.0.0.0>>>traffic>>>uplink', uplink),
+        ('user>>>alice.0001@0.0.0.0>>>traffic>>>downlink', downlink),
+    ]
+
+
+@fixture(name='collector')
+def fixture_collector(tmp_path: Path) -> StatsCollector:
+    return StatsCollector(
+        MagicMock(),
+        StatsJournal(tmp_path / 'stats.json', tmp_path / 'stats.journal'),
+        StatsHistory(tmp_path / 'history'),
+        interval=0.01,
+        flush_interval=3600,
+        console=MagicMock())
+
+
+class TestStatsCollector:
+
+    def test_journals_each_poll_and_flushes_history_once(self, collector: StatsCollector):
+        collector.client.query_counters.side_effect = [_stats(), _stats(uplink=3, downlink=0)]
+
+        assert collector.poll() is True
+        assert collector.poll() is True
+
+        collector.client.query_counters.assert_called_with(reset=True)
+        assert len(collector.journal.journal_path.read_text(encoding='utf-8').splitlines()) == 3
+        assert collector.journal.read().client == {'alice': TrafficStats(uplink=4, downlink=2)}
+        assert not collector.history.total(0, subject='client').client
+
+        collector.flush()
+
+        history_total = collector.history.total(0, subject='client')
+        assert history_total.client == {'alice': TrafficStats(uplink=4, downlink=2)}
+
+    def test_polled_stats_survive_crash_before_flush(self, collector: StatsCollector, tmp_path: Path):
+        collector.client.query_counters.return_value = _stats()
+
+        collector.poll()
+
+        journal = StatsJournal(tmp_path / 'stats.json', tmp_path / 'stats.journal')
+        assert journal.read().client == {'alice': TrafficStats(uplink=1, downlink=2)}
+
+    def test_resets_counters_under_journal_lock(self, collector: StatsCollector):
+        lock_held = []
+
+        def query_counters(reset: bool) -> list[tuple[str, int]]:
+            with open(collector.journal.lock_path, 'rb') as lock_file:
+                try:
+                    flock(lock_file, LOCK_EX | LOCK_NB)
+                except BlockingIOError:
+                    lock_held.append(reset)
+            return _stats()
+
+        collector.client.query_counters.side_effect = query_counters
+
+        assert collector.poll() is True
+        assert lock_held == [True]
+
+    def test_keeps_running_while_api_is_unavailable(self, collector: StatsCollector):
+        collector.client.query_counters.side_effect = [RuntimeError('down'), RuntimeError('down'), _stats()]
+
+        assert collector.poll() is False
+        assert collector.poll() is False
+        assert collector.poll() is True
+
+        assert collector.console.print.call_count == 2
+
+    def test_stop_persists_last_interval(self, collector: StatsCollector):
+        collector.client.query_counters.return_value = _stats()
+        Timer(0.1, collector.stop).start()
+
+        collector.run()
+
+        collector.client.close.assert_called_once()
+        assert collector.journal.read().client['alice'].uplink == collector.client.query_counters.call_count
+
+
+class TestStatsCollectorCommand:
+
+    def test_stops_collector_on_sigterm(self, mocker: MockFixture):
+        from app.controller.commands.stats import stats_collector  # pylint: disable=import-outside-toplevel
+        mocker.patch('app.controller.commands.stats.check_root')
+        mocker.patch('app.controller.commands.stats.XrayStatsClient')
+        mocker.patch('app.controller.commands.stats.stdout_console')
+        collector_mock = mocker.patch('app.controller.commands.stats.StatsCollector')
+        signal_mock = mocker.patch('app.controller.commands.stats.signal')
+
+        stats_collector(interval=5, flush_interval=1, _debug=True)
+
+        assert collector_mock.call_args.kwargs == {'interval': 5, 'flush_interval': 5}
+        collector_mock.return_value.run.assert_called_once()
+        handlers = {call.args[0].name: call.args[1] for call in signal_mock.call_args_list}
+        assert set(handlers) == {'SIGTERM', 'SIGINT'}
+        handlers['SIGTERM'](15, None)
+        collector_mock.return_value.stop.assert_called_once()
@@ -0,0 +1,90 @@
+from datetime import UTC, datetime
+from pathlib import Path
+
+from pytest import fixture
+from pytest_mock import MockFixture
+
+from app.model.veepeenet import TrafficStats, VeePeeNetStats
+from app.stats_history import StatsHistory
+
+_DAY_START = datetime(2026, 3, 10, tzinfo=UTC).timestamp()
+
+
+def _delta(client: str = 'alice', uplink: int = 1, downlink: int = 2) -> VeePeeNetStats:
+    return VeePeeNetStats(
+        client={client: TrafficStats(uplink=uplink, downlink=downlink)},
+        inbound={'vless-inbound': TrafficStats(uplink=uplink, downlink=downlink)})
+
+
+@fixture(name='history')
+def fixture_history(tmp_path: Path) -> StatsHistory:
+    return StatsHistory(tmp_path / 'history')
+
+
+class TestStatsHistory:
+
+    def test_records_deltas_into_five_minute_buckets(self, history: StatsHistory):
+        assert history.record(_delta(), at=_DAY_START + 10) is True
+        assert history.record(_delta(), at=_DAY_START + 200) is True
+        assert history.record(_delta(uplink=5), at=_DAY_START + 400) is True
+        assert history.record(VeePeeNetStats(client={'bob': TrafficStats()}), at=_DAY_START) is False
+
+        buckets = history.query(_DAY_START, _DAY_START + 3600, subject='client', name='alice')
+
+        assert [bucket.start for bucket in buckets] == [_DAY_START, _DAY_START + 300]
+        assert buckets[0].stats.client['alice'] == TrafficStats(uplink=2, downlink=4)
+        assert buckets[1].stats.client['alice'] == TrafficStats(uplink=5, downlink=2)
+        assert not buckets[0].stats.inbound
+
+    def test_rolls_completed_days_up_to_hours_and_days(self, history: StatsHistory):
+        history.record(_delta(), at=_DAY_START + 60)
+        history.record(_delta(), at=_DAY_START + 3 * 3600)
+        history.record(_delta('bob'), at=_DAY_START + 86400 + 60)
+
+        hours = history.history_dir / '1h' / '2026-03.ndjson'
+        days = history.history_dir / '1d' / '2026.ndjson'
+        assert len(hours.read_text(encoding='utf-8').splitlines()) == 2
+        assert len(days.read_text(encoding='utf-8').splitlines()) == 1
+
+        buckets = history.query(_DAY_START, _DAY_START + 2 * 86400, resolution='1d')
+        assert [bucket.start for bucket in buckets] == [_DAY_START, _DAY_START + 86400]
+        assert buckets[0].stats.client == {'alice': TrafficStats(uplink=2, downlink=4)}
+        assert buckets[1].stats.client == {'bob': TrafficStats(uplink=1, downlink=2)}
+
+    def test_reads_only_partitions_in_window(self, history: StatsHistory, mocker: MockFixture):
+        for day in range(5):
+            history.record(_delta(), at=_DAY_START + day * 86400)
+        read_partition = mocker.spy(history, '_read_partition')
+
+        history.query(_DAY_START + 4 * 86400, _DAY_START + 4 * 86400 + 3600)
+
+        assert {call.args[1] for call in read_partition.call_args_list} == {'2026-03-14'}
+
+    def test_prunes_expired_partitions(self, history: StatsHistory):
+        history.record(_delta(), at=_DAY_START)
+        history.record(_delta(), at=_DAY_START + 10 * 86400)
+
+        assert not (history.history_dir / '5m' / '2026-03-10.ndjson').exists()
+        assert (history.history_dir / '5m' / '2026-03-20.ndjson').exists()
+        total = history.total(_DAY_START, _DAY_START + 11 * 86400, subject='client')
+        assert total.client == {'alice': TrafficStats(uplink=2, downlink=4)}
+
+    def test_rollup_is_idempotent_after_crash(self, history: StatsHistory, mocker: MockFixture):
+        history.record(_delta(), at=_DAY_START)
+        mocker.patch('app.stats_history.write_text_file_atomic', side_effect=OSError('crash'))
+        try:
+            history.record(_delta(), at=_DAY_START + 86400)
+        except OSError:
+            pass
+        mocker.stopall()
+
+        history.record(_delta(), at=_DAY_START + 86400 + 300)
+
+        total = history.total(_DAY_START, _DAY_START + 2 * 86400 + 1, subject='client')
+        assert total.client == {'alice': TrafficStats(uplink=3, downlink=6)}
+        for resolution in ('1h', '1d'):
+            buckets = history.query(_DAY_START, _DAY_START + 86400, resolution=resolution, subject='client')
+            assert [bucket.stats.client for bucket in buckets] == [
+                {'alice': TrafficStats(uplink=1, downlink=2)}]
+        for partition in ('1h/2026-03.ndjson', '1d/2026.ndjson'):
+            assert len((history.history_dir / partition).read_text(encoding='utf-8').splitlines()) == 1
@@ -0,0 +1,155 @@
+import json
+from pathlib import Path
+from threading import Thread
+
+from pytest import fixture, raises
+from pytest_mock import MockFixture
+
+from app.model.veepeenet import TrafficStats, VeePeeNetStats
+from app.stats_journal import StatsJournal
+
+
+def _delta(uplink: int = 1, downlink: int = 2) -> VeePeeNetStats:
+    return VeePeeNetStats(
+        client={'alice': TrafficStats(uplink=uplink, downlink=downlink)},
+        outbound={'direct': TrafficStats(downlink=downlink)})
+
+
+@fixture(name='stats_path')
+def fixture_stats_path(tmp_path: Path) -> Path:
+    return tmp_path / 'stats.json'
+
+
+@fixture(name='journal_path')
+def fixture_journal_path(tmp_path: Path) -> Path:
+    return tmp_path / 'stats.journal'
+
+
+class TestStatsJournal:
+
+    def test_appends_deltas_without_rewriting_snapshot(self, stats_path: Path, journal_path: Path):
+        stats_path.write_text(
+            json.dumps({'client': {'alice': {'uplink': 10, 'downlink': 20}}}), encoding='utf-8')
+        snapshot = stats_path.read_bytes()
+
+        with StatsJournal(stats_path, journal_path) as journal:
+            assert journal.append(_delta()) is True
+            assert journal.append(_delta(uplink=3, downlink=0)) is True
+            assert journal.append(VeePeeNetStats(client={'bob': TrafficStats()})) is False
+
+        assert stats_path.read_bytes() == snapshot
+        assert len(journal_path.read_text(encoding='utf-8').splitlines()) == 3
+        assert StatsJournal(stats_path, journal_path).read() == VeePeeNetStats(
+            client={'alice': TrafficStats(uplink=14, downlink=22)},
+            outbound={'direct': TrafficStats(downlink=2)})
+
+    def test_reads_cached_until_files_change(self, stats_path: Path, journal_path: Path, mocker: MockFixture):
+        journal = StatsJournal(stats_path, journal_path)
+        read_spy = mocker.spy(journal, 'read')
+
+        stored = journal.read_cached()
+        assert journal.read_cached() is stored
+        with journal:
+            journal.append(_delta())
+        assert journal.read_cached() == _delta()
+        assert read_spy.call_count == 2
+
+    def test_ignores_torn_last_record(self, stats_path: Path, journal_path: Path):
+        with StatsJournal(stats_path, journal_path) as journal:
+            journal.append(_delta())
+        with journal_path.open('ab') as journal_file:
+            journal_file.write(b'{"client":{"alice":[100')
+
+        assert StatsJournal(stats_path, journal_path).read().client['alice'].uplink == 1
+
+        with StatsJournal(stats_path, journal_path) as journal:
+            journal.append(_delta())
+
+        assert StatsJournal(stats_path, journal_path).read().client['alice'].uplink == 2
+
+    def test_compacts_journal_into_snapshot(self, stats_path: Path, journal_path: Path):
+        with StatsJournal(stats_path, journal_path, compact_size=200) as journal:
+            for _ in range(10):
+                journal.append(_delta())
+
+        assert journal_path.stat().st_size < 200
+        snapshot = json.loads(stats_path.read_text(encoding='utf-8'))
+        assert snapshot['journalGeneration']
+        assert StatsJournal(stats_path, journal_path).read() == _delta(uplink=10, downlink=20)
+
+    def test_crash_between_snapshot_and_rotation_does_not_double_count(
+            self, stats_path: Path, journal_path: Path, mocker: MockFixture):
+        with StatsJournal(stats_path, journal_path) as journal:
+            journal.append(_delta())
+            journal.append(_delta())
+            mocker.patch('app.stats_journal.write_text_file_atomic', side_effect=OSError('crash'))
+            with raises(OSError):
+                journal.compact()
+            mocker.stopall()
+
+        assert json.loads(stats_path.read_text(encoding='utf-8'))['client']['alice']['uplink'] == 2
+        assert StatsJournal(stats_path, journal_path).read() == _delta(uplink=2, downlink=4)
+
+        with StatsJournal(stats_path, journal_path) as journal:
+            journal.append(_delta())
+
+        assert StatsJournal(stats_path, journal_path).read() == _delta(uplink=3, downlink=6)
+
+    def test_reads_journal_without_header_as_corrupt(self, stats_path: Path, journal_path: Path):
+        stats_path.write_text(json.dumps({'journalOffset': 100}), encoding='utf-8')
+        journal_path.write_text('{"client":{"alice":[1,2]}}\n', encoding='utf-8')
+
+        assert StatsJournal(stats_path, journal_path).read().client['alice'].uplink == 1
+
+        with StatsJournal(stats_path, journal_path) as journal:
+            journal.append(_delta())
+
+        assert json.loads(journal_path.read_text(encoding='utf-8').splitlines()[0])['generation']
+        assert StatsJournal(stats_path, journal_path).read().client['alice'].uplink == 2
+
+    def test_reopens_journal_rotated_by_another_writer(self, stats_path: Path, journal_path: Path):
+        with StatsJournal(stats_path, journal_path) as writer, StatsJournal(stats_path, journal_path) as other:
+            writer.append(_delta())
+            other.append(_delta())
+            other.compact()
+            writer.append(_delta())
+
+        assert StatsJournal(stats_path, journal_path).read() == _delta(uplink=3, downlink=6)
+
+    def test_reset_clears_snapshot_and_journal(self, stats_path: Path, journal_path: Path):
+        with StatsJournal(stats_path, journal_path) as journal:
+            journal.append(_delta())
+            journal.reset()
+
+        assert StatsJournal(stats_path, journal_path).read() == VeePeeNetStats()
+
+    def test_reads_legacy_snapshot_without_journal(self, stats_path: Path, journal_path: Path):
+        stats_path.write_text(
+            json.dumps({'client': {'alice': {'uplink': 5, 'downlink': 6}}}), encoding='utf-8')
+
+        assert StatsJournal(stats_path, journal_path).read() == VeePeeNetStats(
+            client={'alice': TrafficStats(uplink=5, downlink=6)})
+
+    def test_batches_fsync(self, stats_path: Path, journal_path: Path, mocker: MockFixture):
+        fsync_mock = mocker.patch('app.stats_journal.fsync')
+
+        with StatsJournal(stats_path, journal_path, sync_interval=3600) as journal:
+            for _ in range(5):
+                journal.append(_delta())
+            fsync_mock.assert_not_called()
+
+        fsync_mock.assert_called_once()
+
+    def test_concurrent_writers_do_not_lose_deltas(self, stats_path: Path, journal_path: Path):
+        def _write() -> None:
+            with StatsJournal(stats_path, journal_path, sync_interval=3600, compact_size=500) as journal:
+                for _ in range(50):
+                    journal.append(_delta())
+
+        threads = [Thread(target=_write) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert StatsJournal(stats_path, journal_path).read() == _delta(uplink=200, downlink=400)
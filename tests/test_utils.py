@@ -4,25 +4,30 @@ import json
 from io import BytesIO
 from pathlib import Path
 from time import sleep
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, call
 from zipfile import ZipFile
 
 import pytest
 from pytest_mock import MockFixture
 from requests import HTTPError
 
-from app.defaults import XRAY_BINARY_PATH
+from app.defaults import XRAY_BINARY_PATH, XRAY_GEO_IP_DATA_PATH, XRAY_GEO_SITE_DATA_PATH
+from app.model.routing import Rule
 from app.model.veepeenet import TrafficStats, VeePeeNetStats
+from app.model.vless_inbound import Client
 from app.model.xray import Xray
 from app.utils import (
+    load_json_cache,
+    save_json_cache,
     gen_xray_private_key,
     gen_xray_password,
     is_xray_service_running,
     get_xray_service_uptime,
+    get_xray_service_properties,
     restart_xray_service,
     enable_xray_service,
     disable_xray_service,
-    get_vless_client_url,
+    get_reality_password,
     is_valid_vless_client_url,
     ufw_open_port,
     detect_ssh_port,
@@ -39,6 +44,9 @@ from app.utils import (
     run_command,
     detect_veepeenet_versions,
     is_xray_service_enabled,
+    read_client_names,
+    parse_client_names,
+    parse_duration,
     remove_duplicates,
     get_new_items,
     get_existing_items,
@@ -49,10 +57,19 @@ from app.utils import (
     restore_config,
     get_xray_service_journal,
     is_json_content_same,
+    is_config_digest_same,
+    get_config_digest,
+    get_json_digest,
+    get_config_test_key,
+    is_config_tested,
+    save_config_tested,
     query_xray_stats,
     reset_xray_stats,
     load_stats,
     save_stats,
+    add_xray_inbound_users,
+    remove_xray_inbound_users,
+    replace_xray_routing_rules,
 )
 
 
@@ -79,76 +96,35 @@ def _make_streaming_mock(data: bytes, chunk_size: int = 1024 * 1024) -> MagicMoc
 
 class TestGenXrayPrivateKey:
 
-    def test_gen_xray_private_key_success(self, mocker: MockFixture):
-        expected_key = 'aAbBcCdDeEfF123456789gGhHiIjJkKlL=='
-        mock_run_command = mocker.patch(
-            'app.utils.run_command', return_value=(0, f'PrivateKey: {expected_key}', ''))
+    def test_gen_xray_private_key_does_not_run_xray(self, mocker: MockFixture):
+        mock_run_command = mocker.patch('app.utils.run_command')
 
         result = gen_xray_private_key()
 
-        assert result == expected_key
-        mock_run_command.assert_called_once_with(f'{XRAY_BINARY_PATH} x25519')
-
-    def test_gen_xray_private_key_command_failure(self, mocker: MockFixture):
-        mocker.patch('app.utils.run_command', return_value=(1, '', 'Error message'))
-
-        with pytest.raises(RuntimeError, match='Error generating private key') as exc_info:
-            gen_xray_private_key()
-
-        error_text = str(exc_info.value)
-        assert 'code:1' in error_text
-        assert 'Error message' in error_text
-
-    def test_gen_xray_private_key_unexpected_output(self, mocker: MockFixture):
-        mocker.patch('app.utils.run_command', return_value=(0, 'Unexpected output', ''))
-
-        with pytest.raises(RuntimeError) as exc_info:
-            gen_xray_private_key()
-
-        assert 'Unexpected stdout' in str(exc_info.value)
+        assert len(result) == 43
+        mock_run_command.assert_not_called()
 
 
 class TestGenXrayPassword:
 
-    def test_gen_xray_password_success_0(self, mocker: MockFixture):
-        private_key = 'aAbBcCdDeEfF123456789gGhHiIjJkKlL=='
-        expected_pass = 'xXyYzZ987654321aBcDeFgHiJkLmNoOpP=='
-        mock_run_command = mocker.patch(
-            'app.utils.run_command', return_value=(0, f'Password: {expected_pass}', ''))
+    def test_gen_xray_password_success(self, mocker: MockFixture):
+        private_key = 'dwdtCnMYpX08FsFyUbJmRd9ML4frwJkqsXf7pR25LCo'
+        mock_run_command = mocker.patch('app.utils.run_command')
 
         result = gen_xray_password(private_key)
 
-        assert result == expected_pass
-        mock_run_command.assert_called_once_with(f'{XRAY_BINARY_PATH} x25519 -i {private_key}')
+        assert result == 'hSDwCYkwp1R0i33ctD73Wg2_Og0mOBr066SpjqqbTmo'
+        mock_run_command.assert_not_called()
 
-    def test_gen_xray_password_success_1(self, mocker: MockFixture):
-        private_key = 'aAbBcCdDeEfF123456789gGhHiIjJkKlL=='
-        expected_pass = 'xXyYzZ987654321aBcDeFgHiJkLmNoOpP=='
-        mock_run_command = mocker.patch(
-            'app.utils.run_command', return_value=(0, f'Password (PublicKey): {expected_pass}', ''))
+    def test_gen_xray_password_matches_generated_key(self):
+        private_key = gen_xray_private_key()
 
-        result = gen_xray_password(private_key)
+        assert len(gen_xray_password(private_key)) == 43
 
-        assert result == expected_pass
-        mock_run_command.assert_called_once_with(f'{XRAY_BINARY_PATH} x25519 -i {private_key}')
-
-    def test_gen_xray_password_command_failure(self, mocker: MockFixture):
-        mocker.patch('app.utils.run_command', return_value=(1, '', 'Error message'))
-
-        with pytest.raises(RuntimeError, match='Error generating password') as exc_info:
+    def test_gen_xray_password_invalid_key(self):
+        with pytest.raises(RuntimeError, match='Error generating password'):
             gen_xray_password('test_key')
 
-        error_text = str(exc_info.value)
-        assert 'Error message' in error_text
-
-    def test_gen_xray_password_unexpected_output(self, mocker: MockFixture):
-        mocker.patch('app.utils.run_command', return_value=(0, 'Unexpected output', ''))
-
-        with pytest.raises(RuntimeError) as exc_info:
-            gen_xray_password('test_key')
-
-        assert 'Unexpected stdout' in str(exc_info.value)
-
 
 class TestIsXrayRunning:
 
@@ -276,61 +252,47 @@ class TestDisableXrayService:
         mock_run_command.assert_called_once_with('systemctl disable xray -q', check=True)
 
 
-class TestGetVlessClientUrl:
+class TestGetRealityPassword:
 
-    def test_get_vless_client_url_success(
+    def test_caches_password_in_veepeenet_section(
             self, mocker: MockFixture, valid_xray_config_with_clients_path: Path):
-        mocker.patch('app.utils.gen_xray_password', return_value='random-password-1')
-        expected_client_url = (
-            'vless://random-uuid-1@0.0.0.0:443?flow=xtls-rprx-vision'
-            '&type=raw'
-            '&security=reality'
-            '&fp=chrome'
-            '&sni=yahoo.com'
-            '&pbk=random-password-1'
-            '&sid=0001'
-            '&spx=%2Fc1.client'
-            '#c1.client@0.0.0.0'
-        )
-        xray_config_content = valid_xray_config_with_clients_path.read_text(
-            encoding='utf-8')
-
-        actual_url = get_vless_client_url(
-            'c1.client', Xray.model_validate_json(xray_config_content))
+        gen_mock = mocker.patch('app.utils.gen_xray_password', return_value='random-password-1')
+        xray_config = Xray.model_validate_json(
+            valid_xray_config_with_clients_path.read_text(encoding='utf-8'))
 
-        assert actual_url == expected_client_url
+        assert get_reality_password(xray_config) == 'random-password-1'
 
-    def test_get_vless_client_url_not_found(self, valid_xray_config_with_clients_path: Path):
-        xray_config_content = valid_xray_config_with_clients_path.read_text(
-            encoding='utf-8')
+        assert xray_config.veepeenet is not None
+        assert xray_config.veepeenet.reality_password == 'random-password-1'
+        assert xray_config.veepeenet.reality_key_hash
+        gen_mock.assert_called_once()
 
-        actual_url = get_vless_client_url(
-            'nonexistent_client', Xray.model_validate_json(xray_config_content))
+    def test_uses_cached_password_after_reload(
+            self, mocker: MockFixture, valid_xray_config_with_clients_path: Path):
+        mocker.patch('app.utils.gen_xray_password', return_value='random-password-1')
+        xray_config = Xray.model_validate_json(
+            valid_xray_config_with_clients_path.read_text(encoding='utf-8'))
+        get_reality_password(xray_config)
+        reloaded_config = Xray.model_validate_json(
+            xray_config.model_dump_json(by_alias=True, exclude_none=True))
+        gen_mock = mocker.patch('app.utils.gen_xray_password', return_value='other-password')
 
-        assert actual_url is None
+        assert get_reality_password(reloaded_config) == 'random-password-1'
+        gen_mock.assert_not_called()
 
-    def test_get_vless_client_url_uses_server_name_in_fragment(
+    def test_regenerates_password_when_private_key_rotated(
             self, mocker: MockFixture, valid_xray_config_with_clients_path: Path):
         mocker.patch('app.utils.gen_xray_password', return_value='random-password-1')
-        expected_client_url = (
-            'vless://random-uuid-1@0.0.0.0:443?flow=xtls-rprx-vision'
-            '&type=raw'
-            '&security=reality'
-            '&fp=chrome'
-            '&sni=yahoo.com'
-            '&pbk=random-password-1'
-            '&sid=0001'
-            '&spx=%2Fc1.client'
-            '#c1.client@My VPN Server'
-        )
         xray_config = Xray.model_validate_json(
             valid_xray_config_with_clients_path.read_text(encoding='utf-8'))
-        assert xray_config.veepeenet is not None
-        xray_config.veepeenet.name = 'My VPN Server'
+        get_reality_password(xray_config)
+        inbound = xray_config.get_vless_inbound()
+        assert inbound is not None
+        inbound.stream_settings.reality_settings.private_key = 'rotated-private-key'
+        gen_mock = mocker.patch('app.utils.gen_xray_password', return_value='random-password-2')
 
-        actual_url = get_vless_client_url('c1.client', xray_config)
-
-        assert actual_url == expected_client_url
+        assert get_reality_password(xray_config) == 'random-password-2'
+        gen_mock.assert_called_once_with('rotated-private-key')
 
 
 class TestIsValidVlessClientUrl:
@@ -634,6 +596,54 @@ class TestWriteTextFile:
         assert file_path.read_text(encoding='utf-8') == 'content'
 
 
+class TestJsonCache:
+
+    def test_json_cache_hit(self, tmp_path: Path):
+        cache_path = tmp_path / '.config.json.cache'
+        content = b'{"a": [1, 2]}'
+
+        assert save_json_cache(cache_path, content, {'a': [1, 2]})
+
+        assert load_json_cache(cache_path, content) == {'a': [1, 2]}
+
+    def test_json_cache_content_changed(self, tmp_path: Path):
+        cache_path = tmp_path / '.config.json.cache'
+        save_json_cache(cache_path, b'{"a": 1}', {'a': 1})
+
+        assert load_json_cache(cache_path, b'{"a": 2}') is None
+
+    def test_json_cache_other_version(self, tmp_path: Path, mocker: MockFixture):
+        cache_path = tmp_path / '.config.json.cache'
+        mocker.patch('app.utils._get_cache_version', return_value='v1.0.0')
+        save_json_cache(cache_path, b'{}', {})
+        mocker.patch('app.utils._get_cache_version', return_value='v1.1.0')
+
+        assert load_json_cache(cache_path, b'{}') is None
+
+    def test_json_cache_missing(self, tmp_path: Path):
+        assert load_json_cache(tmp_path / '.config.json.cache', b'{}') is None
+
+    def test_json_cache_corrupted(self, tmp_path: Path):
+        cache_path = tmp_path / '.config.json.cache'
+        save_json_cache(cache_path, b'{}', {})
+        cache_path.write_bytes(cache_path.read_bytes().splitlines()[0] + b'\ngarbage')
+
+        assert load_json_cache(cache_path, b'{}') is None
+
+    def test_json_cache_world_writable(self, tmp_path: Path):
+        cache_path = tmp_path / '.config.json.cache'
+        save_json_cache(cache_path, b'{}', {})
+        cache_path.chmod(0o666)
+
+        assert load_json_cache(cache_path, b'{}') is None
+
+    def test_json_cache_save_failed(self, tmp_path: Path):
+        cache_path = tmp_path / 'file' / '.config.json.cache'
+        (tmp_path / 'file').write_text('')
+
+        assert not save_json_cache(cache_path, b'{}', {})
+
+
 class TestGetXrayDistribVersion:
 
     def test_returns_version_string(self, mocker: MockFixture):
@@ -816,6 +826,7 @@ class TestIsXrayServiceInstalled:
         service_content = '[Unit]\nDescription=Xray Service\n'
         unit_path = tmp_path / 'xray.service'
         unit_path.write_text(service_content, encoding='utf-8')
+        (tmp_path / 'veepeenet-stats.service').write_text(service_content, encoding='utf-8')
         mocker.patch(
             'app.utils.app_resources.joinpath'
         ).return_value.read_text.return_value = service_content
@@ -844,6 +855,18 @@ class TestIsXrayServiceInstalled:
 
         assert result is False
 
+    def test_is_xray_service_installed_without_stats_collector(self, mocker: MockFixture, tmp_path: Path):
+        service_content = '[Unit]\nDescription=Xray Service\n'
+        unit_path = tmp_path / 'xray.service'
+        unit_path.write_text(service_content, encoding='utf-8')
+        mocker.patch(
+            'app.utils.app_resources.joinpath'
+        ).return_value.read_text.return_value = service_content
+
+        result = is_xray_service_installed(unit_path)
+
+        assert result is False
+
 
 class TestInstallXrayService:
 
@@ -860,9 +883,22 @@ class TestInstallXrayService:
         assert unit_path.exists()
         assert unit_path.read_text(encoding='utf-8') == service_content
         assert unit_path.stat().st_mode & 0o777 == 0o644
+        assert (tmp_path / 'veepeenet-stats.service').read_text(encoding='utf-8') == service_content
         mock_run_command.assert_called_once_with('systemctl daemon-reload', check=True)
 
 
+class TestGetXrayServiceProperties:
+
+    def test_parses_systemctl_show_output(self, mocker: MockFixture):
+        mock_run_command = mocker.patch(
+            'app.utils.run_command', return_value=(0, 'ActiveState=active\nUnitFileState=enabled', ''))
+
+        result = get_xray_service_properties('ActiveState', 'UnitFileState')
+
+        assert result == {'ActiveState': 'active', 'UnitFileState': 'enabled'}
+        mock_run_command.assert_called_once_with('systemctl show xray --property=ActiveState,UnitFileState')
+
+
 class TestStopXrayService:
 
     def test_stop_xray_service_success(self, mocker: MockFixture):
@@ -979,6 +1015,48 @@ class TestDetectVeepeenetVersions:
         mock_validate.assert_called_once_with(versions_json)
 
 
+class TestReadClientNames:
+
+    def test_parses_plain_names_and_ndjson(self):
+        lines = ['alice\n', '\n', '# comment\n', '{"name": "bob"}\n', '"carol"\n', '  dave  \n']
+
+        assert list(parse_client_names(lines)) == ['alice', 'bob', 'carol', 'dave']
+
+    def test_invalid_json_line(self):
+        with pytest.raises(ValueError, match='line 2'):
+            list(parse_client_names(['alice', '{"name": ']))
+
+    def test_ndjson_without_name(self):
+        with pytest.raises(ValueError, match='Missing client name at line 1'):
+            list(parse_client_names(['{"id": "x"}']))
+
+    def test_reads_file(self, tmp_path: Path):
+        names_file = tmp_path / 'users.txt'
+        names_file.write_text('alice\n{"name": "bob"}\n', encoding='utf-8')
+
+        assert list(read_client_names(str(names_file))) == ['alice', 'bob']
+
+    def test_reads_stdin(self, mocker: MockFixture):
+        mocker.patch('app.utils.sys_stdin', ['alice\n', 'bob\n'])
+
+        assert list(read_client_names('-')) == ['alice', 'bob']
+
+
+class TestParseDuration:
+
+    def test_parses_units(self):
+        assert parse_duration('45') == 45
+        assert parse_duration('30m') == 1800
+        assert parse_duration('24h') == 86400
+        assert parse_duration('7D') == 604800
+        assert parse_duration('2w') == 1209600
+
+    def test_rejects_invalid_values(self):
+        for value in ('', '0h', '-1h', '1y', 'h', '1.5h'):
+            with pytest.raises(ValueError):
+                parse_duration(value)
+
+
 class TestRemoveDuplicates:
 
     def test_remove_duplicates_empty_list(self):
@@ -1716,84 +1794,129 @@ class TestIsJsonContentSame:
         assert result is False
 
 
-class TestQueryXrayStats:
+class TestInboundUsers:
 
-    def test_returns_parsed_stats(self, mocker: MockFixture):
-        raw_json = json.dumps({'stat': [
-            {'name': 'inbound>>>vless-inbound>>>traffic>>>uplink', 'value': 1000},
-            {'name': 'user>>>alice.abc@0.0.0.0>>>traffic>>>downlink', 'value': 500},
-        ]})
-        mocker.patch('app.utils.run_command', return_value=(0, raw_json, ''))
+    def test_add_users_adds_new_clients_to_inbound(
+            self, mocker: MockFixture, valid_xray_config_with_clients_path: Path):
+        inbound = Xray.model_validate_json(
+            valid_xray_config_with_clients_path.read_text(encoding='utf-8')).get_vless_inbound()
+        assert inbound is not None
+        new_client = Client(id='12345678-1234-5678-1234-567812345678', email='new.0002@0.0.0.0')
+        client_mock = mocker.patch('app.utils.get_handler_client')
 
-        result = query_xray_stats('127.0.0.1', 10085)
+        assert add_xray_inbound_users('127.0.0.1', 10085, inbound, [new_client]) is True
 
-        assert len(result) == 2
-        assert result[0].name == 'inbound>>>vless-inbound>>>traffic>>>uplink'
-        assert result[0].value == 1000
-        assert result[1].name == 'user>>>alice.abc@0.0.0.0>>>traffic>>>downlink'
-        assert result[1].value == 500
+        client_mock.assert_called_once_with('127.0.0.1', 10085)
+        client_mock.return_value.add_user.assert_called_once_with(
+            inbound.tag, 'new.0002@0.0.0.0', '12345678-1234-5678-1234-567812345678', 'xtls-rprx-vision')
 
-    def test_returns_empty_on_command_failure(self, mocker: MockFixture):
-        mocker.patch('app.utils.run_command', return_value=(1, '', 'connection refused'))
+    def test_add_users_returns_false_on_failure(
+            self, mocker: MockFixture, valid_xray_config_with_clients_path: Path):
+        inbound = Xray.model_validate_json(
+            valid_xray_config_with_clients_path.read_text(encoding='utf-8')).get_vless_inbound()
+        assert inbound is not None
+        client_mock = mocker.patch('app.utils.get_handler_client')
+        client_mock.return_value.add_user.side_effect = RuntimeError('unavailable')
 
-        result = query_xray_stats('127.0.0.1', 10085)
+        assert add_xray_inbound_users(
+            '127.0.0.1', 10085, inbound, [Client(id='x', email='a.1@0.0.0.0')]) is False
 
-        assert result == []
+    def test_add_without_users_does_nothing(self, mocker: MockFixture):
+        client_mock = mocker.patch('app.utils.get_handler_client')
 
-    def test_returns_empty_on_invalid_json(self, mocker: MockFixture):
-        mocker.patch('app.utils.run_command', return_value=(0, 'not json', ''))
+        assert add_xray_inbound_users('127.0.0.1', 10085, MagicMock(), []) is True
+        client_mock.return_value.add_user.assert_not_called()
 
-        result = query_xray_stats('127.0.0.1', 10085)
+    def test_remove_users(self, mocker: MockFixture):
+        client_mock = mocker.patch('app.utils.get_handler_client')
 
-        assert result == []
+        assert remove_xray_inbound_users(
+            '127.0.0.1', 10085, 'vless-inbound', ['a.1@0.0.0.0', 'b.2@0.0.0.0']) is True
+
+        assert client_mock.return_value.remove_user.call_args_list == [
+            call('vless-inbound', 'a.1@0.0.0.0'), call('vless-inbound', 'b.2@0.0.0.0')]
 
-    def test_passes_reset_true(self, mocker: MockFixture):
-        mock_run = mocker.patch('app.utils.run_command', return_value=(0, '{}', ''))
+    def test_remove_users_returns_false_on_failure(self, mocker: MockFixture):
+        client_mock = mocker.patch('app.utils.get_handler_client')
+        client_mock.return_value.remove_user.side_effect = RuntimeError('unavailable')
 
-        query_xray_stats('127.0.0.1', 10085, reset=True)
+        assert remove_xray_inbound_users('127.0.0.1', 10085, 'vless-inbound', ['a.1@0.0.0.0']) is False
 
-        args = mock_run.call_args[0][0]
-        assert '-reset=true' in args
 
-    def test_passes_reset_false_by_default(self, mocker: MockFixture):
-        mock_run = mocker.patch('app.utils.run_command', return_value=(0, '{}', ''))
+class TestReplaceXrayRoutingRules:
+
+    def test_replaces_rules(self, mocker: MockFixture):
+        client_mock = mocker.patch('app.utils.get_routing_client')
+        rules = [Rule(tag='ru.1', outbound_tag='direct', domain=['geosite:category-ru'])]
+
+        assert replace_xray_routing_rules('127.0.0.1', 10085, rules) is True
+
+        client_mock.assert_called_once_with('127.0.0.1', 10085)
+        client_mock.return_value.replace_rules.assert_called_once_with(
+            [{'tag': 'ru.1', 'outboundTag': 'direct', 'domain': ['geosite:category-ru']}],
+            XRAY_GEO_IP_DATA_PATH,
+            XRAY_GEO_SITE_DATA_PATH,
+        )
 
-        query_xray_stats('127.0.0.1', 10085)
+    @pytest.mark.parametrize('error', [
+        RuntimeError('unavailable'), ValueError('Geodata entry RU not found'), FileNotFoundError()])
+    def test_returns_false_on_failure(self, mocker: MockFixture, error: Exception):
+        client_mock = mocker.patch('app.utils.get_routing_client')
+        client_mock.return_value.replace_rules.side_effect = error
 
-        args = mock_run.call_args[0][0]
-        assert '-reset=false' in args
+        assert replace_xray_routing_rules('127.0.0.1', 10085, []) is False
 
-    def test_empty_stat_list(self, mocker: MockFixture):
-        mocker.patch('app.utils.run_command', return_value=(0, '{"stat": []}', ''))
+
+class TestQueryXrayStats:
+
+    def test_returns_client_stats(self, mocker: MockFixture):
+        stats = [
+            ('inbound>>>vless-inbound>>>traffic>>>uplink', 1000),
+            ('user>>>alice.abc@0.0.0.0>>>traffic>>>downlink', 500),
+        ]
+        client_mock = mocker.patch('app.utils.get_stats_client')
+        client_mock.return_value.query_counters.return_value = stats
 
         result = query_xray_stats('127.0.0.1', 10085)
 
-        assert result == []
+        assert result == stats
+        client_mock.assert_called_once_with('127.0.0.1', 10085)
+        client_mock.return_value.query_counters.assert_called_once_with(pattern='', reset=False)
 
+    def test_passes_reset_and_pattern(self, mocker: MockFixture):
+        client_mock = mocker.patch('app.utils.get_stats_client')
+        client_mock.return_value.query_counters.return_value = []
 
-class TestResetXrayStats:
+        query_xray_stats('127.0.0.1', 10085, reset=True, pattern='outbound>>>')
 
-    def test_returns_true_on_success(self, mocker: MockFixture):
-        mocker.patch('app.utils.run_command', return_value=(0, '', ''))
+        client_mock.return_value.query_counters.assert_called_once_with(pattern='outbound>>>', reset=True)
 
-        result = reset_xray_stats('127.0.0.1', 10085)
+    def test_returns_empty_on_request_failure(self, mocker: MockFixture):
+        client_mock = mocker.patch('app.utils.get_stats_client')
+        client_mock.return_value.query_counters.side_effect = RuntimeError('unavailable')
 
-        assert result is True
+        assert query_xray_stats('127.0.0.1', 10085) == []
 
-    def test_returns_false_on_failure(self, mocker: MockFixture):
-        mocker.patch('app.utils.run_command', return_value=(1, '', 'connection refused'))
+    def test_returns_empty_on_malformed_response(self, mocker: MockFixture):
+        client_mock = mocker.patch('app.utils.get_stats_client')
+        client_mock.return_value.query_counters.side_effect = ValueError('Truncated protobuf message')
 
-        result = reset_xray_stats('127.0.0.1', 10085)
+        assert query_xray_stats('127.0.0.1', 10085) == []
 
-        assert result is False
 
-    def test_uses_reset_flag(self, mocker: MockFixture):
-        mock_run = mocker.patch('app.utils.run_command', return_value=(0, '', ''))
+class TestResetXrayStats:
 
-        reset_xray_stats('127.0.0.1', 10085)
+    def test_returns_true_on_success(self, mocker: MockFixture):
+        client_mock = mocker.patch('app.utils.get_stats_client')
 
-        args = mock_run.call_args[0][0]
-        assert '-reset=true' in args
+        assert reset_xray_stats('127.0.0.1', 10085) is True
+        client_mock.return_value.query_counters.assert_called_once_with(reset=True)
+
+    def test_returns_false_on_failure(self, mocker: MockFixture):
+        client_mock = mocker.patch('app.utils.get_stats_client')
+        client_mock.return_value.query_counters.side_effect = RuntimeError('unavailable')
+
+        assert reset_xray_stats('127.0.0.1', 10085) is False
 
 
 class TestStatsFileStorage:
@@ -1861,3 +1984,111 @@ class TestVeePeeNetStatsIadd:
         a += b
         assert a.client['alice'].uplink == 100
         assert a.client['bob'].uplink == 200
+
+
+class TestConfigDigest:
+
+    def test_json_digest_key_order_stable(self):
+        assert (get_json_digest({'a': 1, 'b': {'c': 2, 'd': 3}})
+                == get_json_digest({'b': {'d': 3, 'c': 2}, 'a': 1}))
+
+    def test_json_digest_excluded_keys(self):
+        assert (get_json_digest({'a': 1, 'veepeenet': {'host': 'a'}}, {'veepeenet'})
+                == get_json_digest({'a': 1}, {'veepeenet'}))
+
+    def test_config_digest_stored(self, tmp_path: Path, mocker: MockFixture):
+        config_path = tmp_path / 'config.json'
+        config_path.write_text('{"a": 1}', encoding='utf-8')
+        digest = get_config_digest(config_path)
+        json_loads_mock = mocker.patch('app.utils.json_loads')
+
+        assert get_config_digest(config_path) == digest
+        assert (tmp_path / '.config.json.digest').exists()
+        json_loads_mock.assert_not_called()
+
+    def test_config_digest_outdated(self, tmp_path: Path):
+        config_path = tmp_path / 'config.json'
+        config_path.write_text('{"a": 1}', encoding='utf-8')
+        digest = get_config_digest(config_path)
+        config_path.write_text('{"a": 2}', encoding='utf-8')
+
+        assert get_config_digest(config_path) != digest
+
+    def test_config_digest_invalid(self, tmp_path: Path):
+        config_path = tmp_path / 'config.json'
+        config_path.write_text('{', encoding='utf-8')
+
+        assert get_config_digest(config_path) is None
+        assert get_config_digest(tmp_path / 'missing.json') is None
+
+    def test_digest_same_ignores_veepeenet_and_key_order(self, tmp_path: Path):
+        config_path = tmp_path / 'config.json'
+        backup_path = tmp_path / 'config.json.bak'
+        config_path.write_text('{"veepeenet": {"host": "a"}, "log": {}, "api": {}}', encoding='utf-8')
+        backup_path.write_text('{"api": {}, "log": {}, "veepeenet": {"host": "b"}}', encoding='utf-8')
+
+        assert is_config_digest_same(config_path, backup_path)
+
+        config_path.write_text('{"log": {"loglevel": "debug"}, "api": {}}', encoding='utf-8')
+
+        assert not is_config_digest_same(config_path, backup_path)
+
+    def test_digest_same_missing_backup(self, tmp_path: Path):
+        config_path = tmp_path / 'config.json'
+        config_path.write_text('{}', encoding='utf-8')
+
+        assert not is_config_digest_same(config_path, tmp_path / 'config.json.bak')
+
+    def test_backup_config_copies_digest(self, tmp_path: Path, mocker: MockFixture):
+        config_path = tmp_path / 'config.json'
+        backup_path = tmp_path / 'config.json.bak'
+        config_path.write_text('{"a": 1}', encoding='utf-8')
+        get_config_digest(config_path)
+
+        backup_config(config_path, backup_path)
+        json_loads_mock = mocker.patch('app.utils.json_loads')
+
+        assert is_config_digest_same(config_path, backup_path)
+        json_loads_mock.assert_not_called()
+
+
+class TestConfigTested:
+
+    def test_test_key_depends_on_all_files(self, tmp_path: Path):
+        config_path = tmp_path / 'config.json'
+        geo_path = tmp_path / 'geoip.dat'
+        config_path.write_text('{}', encoding='utf-8')
+        geo_path.write_bytes(b'geo')
+        test_key = get_config_test_key(config_path, [geo_path])
+
+        assert get_config_test_key(config_path, [geo_path]) == test_key
+        geo_path.write_bytes(b'new geo')
+        assert get_config_test_key(config_path, [geo_path]) != test_key
+        geo_path.unlink()
+        assert get_config_test_key(config_path, [geo_path]) not in (None, test_key)
+        assert get_config_test_key(tmp_path / 'missing.json', [geo_path]) is None
+
+    def test_tested_keys_stored(self, tmp_path: Path):
+        config_path = tmp_path / 'config.json'
+
+        assert not is_config_tested(config_path, 'a')
+        save_config_tested(config_path, 'a')
+        save_config_tested(config_path, 'b')
+
+        assert is_config_tested(config_path, 'a') and is_config_tested(config_path, 'b')
+        assert (tmp_path / '.config.json.tested').exists()
+
+    def test_tested_keys_limited(self, tmp_path: Path):
+        config_path = tmp_path / 'config.json'
+        for number in range(20):
+            save_config_tested(config_path, str(number))
+
+        assert not is_config_tested(config_path, '0')
+        assert is_config_tested(config_path, '19')
+
+    def test_tested_keys_world_writable(self, tmp_path: Path):
+        config_path = tmp_path / 'config.json'
+        save_config_tested(config_path, 'a')
+        (tmp_path / '.config.json.tested').chmod(0o666)
+
+        assert not is_config_tested(config_path, 'a')
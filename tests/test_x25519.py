@@ -0,0 +1,72 @@
+from base64 import urlsafe_b64decode
+
+import pytest
+
+from app.x25519 import (
+    KEY_SIZE,
+    x25519,
+    clamp,
+    decode_key,
+    encode_key,
+    derive_public_key,
+    gen_private_key,
+)
+
+_BASE_POINT = (9).to_bytes(KEY_SIZE, 'little')
+_ALICE_PRIVATE = bytes.fromhex('77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a')
+_ALICE_PUBLIC = bytes.fromhex('8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a')
+_BOB_PRIVATE = bytes.fromhex('5dab087e624a8a4b79e17f8b83800ee66f3bb1292618b6fd1c2f8b27ff88e0eb')
+_BOB_PUBLIC = bytes.fromhex('de9edb7d7b7dc1b4d35b61c2ece435373f8343c85b78674dadfc7e146f882b4f')
+_SHARED_SECRET = bytes.fromhex('4a5d9d5ba4ce2de1728e3bf480350f25e07e21c947d19e3376f09b3c1e161742')
+
+
+class TestX25519:
+
+    def test_rfc7748_one_iteration(self):
+        result = x25519(_BASE_POINT, _BASE_POINT)
+        assert result.hex() == '422c8e7a6227d7bca1350b3e2bb7279f7897b87bb6854b783c60e80311ae3079'
+
+    def test_rfc7748_public_keys(self):
+        assert x25519(_ALICE_PRIVATE, _BASE_POINT) == _ALICE_PUBLIC
+        assert x25519(_BOB_PRIVATE, _BASE_POINT) == _BOB_PUBLIC
+
+    def test_rfc7748_shared_secret(self):
+        assert x25519(_ALICE_PRIVATE, _BOB_PUBLIC) == _SHARED_SECRET
+        assert x25519(_BOB_PRIVATE, _ALICE_PUBLIC) == _SHARED_SECRET
+
+    def test_invalid_input_length(self):
+        with pytest.raises(ValueError):
+            x25519(b'short', _BASE_POINT)
+
+
+class TestXrayKeys:
+
+    def test_derive_public_key_uses_raw_url_base64(self):
+        private_key = encode_key(_ALICE_PRIVATE)
+
+        public_key = derive_public_key(private_key)
+
+        assert public_key == 'hSDwCYkwp1R0i33ctD73Wg2_Og0mOBr066SpjqqbTmo'
+        assert len(public_key) == 43
+        assert '=' not in public_key
+
+    def test_derive_public_key_accepts_padded_key(self):
+        private_key = encode_key(_ALICE_PRIVATE) + '='
+
+        assert derive_public_key(private_key) == encode_key(_ALICE_PUBLIC)
+
+    def test_gen_private_key_is_clamped(self):
+        private_key = gen_private_key()
+
+        raw = urlsafe_b64decode(private_key + '=')
+        assert len(private_key) == 43
+        assert raw == clamp(raw)
+        assert derive_public_key(private_key)
+
+    def test_gen_private_key_is_random(self):
+        assert gen_private_key() != gen_private_key()
+
+    @pytest.mark.parametrize('key', ['', 'test_key', encode_key(b'\x01' * 16)])
+    def test_decode_key_invalid(self, key: str):
+        with pytest.raises(ValueError):
+            decode_key(key)
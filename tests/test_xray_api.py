@@ -0,0 +1,308 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+import grpc
+from pytest import fixture, raises
+
+from app.model.api import Stats
+from app.xray_api import (
+    HANDLER_SERVICE_NAME,
+    ROUTING_SERVICE_NAME,
+    STATS_SERVICE_NAME,
+    XrayHandlerClient,
+    XrayRoutingClient,
+    XrayStatsClient,
+    decode_query_stats_request,
+    decode_query_stats_response,
+    encode_add_rule_request,
+    encode_add_user_request,
+    encode_query_stats_request,
+    encode_query_stats_response,
+    encode_remove_user_request,
+    encode_router_config,
+)
+
+
+class StubStatsService:
+
+    def __init__(self, stats: list[Stats]):
+        self.stats = stats
+        self.requests: list[tuple[str, bool]] = []
+
+    def query_stats(self, request: bytes, _context: grpc.ServicerContext) -> bytes:
+        pattern, reset = decode_query_stats_request(request)
+        self.requests.append((pattern, reset))
+        matched = [stat for stat in self.stats if pattern in stat.name]
+        if reset:
+            self.stats = [Stats(name=stat.name, value=0) for stat in self.stats]
+        return encode_query_stats_response(matched)
+
+
+@fixture(name='stats_service')
+def fixture_stats_service() -> StubStatsService:
+    return StubStatsService([
+        Stats(name='inbound>>>vless-inbound>>>traffic>>>uplink', value=1000),
+        Stats(name='user>>>alice.abc@0.0.0.0>>>traffic>>>downlink', value=500),
+        Stats(name='outbound>>>direct>>>traffic>>>downlink', value=0),
+    ])
+
+
+@fixture(name='stats_client')
+def fixture_stats_client(stats_service: StubStatsService) -> Iterator[XrayStatsClient]:
+    server = grpc.server(ThreadPoolExecutor(max_workers=2))
+    server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(
+        STATS_SERVICE_NAME,
+        {'QueryStats': grpc.unary_unary_rpc_method_handler(stats_service.query_stats)},
+    ),))
+    port = server.add_insecure_port('127.0.0.1:0')
+    server.start()
+    client = XrayStatsClient('127.0.0.1', port)
+    yield client
+    client.close()
+    server.stop(None)
+
+
+
+class StubRequestsService:
+
+    def __init__(self):
+        self.requests: list[bytes] = []
+
+    def handle(self, request: bytes, _context: grpc.ServicerContext) -> bytes:
+        self.requests.append(request)
+        return b''
+
+
+@fixture(name='api_service')
+def fixture_api_service() -> StubRequestsService:
+    return StubRequestsService()
+
+
+@fixture(name='api_port')
+def fixture_api_port(api_service: StubRequestsService) -> Iterator[int]:
+    server = grpc.server(ThreadPoolExecutor(max_workers=2))
+    server.add_generic_rpc_handlers((
+        grpc.method_handlers_generic_handler(
+            HANDLER_SERVICE_NAME, {'AlterInbound': grpc.unary_unary_rpc_method_handler(api_service.handle)}),
+        grpc.method_handlers_generic_handler(
+            ROUTING_SERVICE_NAME, {'AddRule': grpc.unary_unary_rpc_method_handler(api_service.handle)}),
+    ))
+    port = server.add_insecure_port('127.0.0.1:0')
+    server.start()
+    yield port
+    server.stop(None)
+
+
+@fixture(name='geo_paths')
+def fixture_geo_paths(tmp_path: Path) -> tuple[Path, Path]:
+    geo_ip_path = tmp_path / 'geoip.dat'
+    geo_ip_path.write_bytes(
+        _field(1, _field(1, b'PRIVATE') + _field(2, _CIDR_10_8)) + _field(1, _field(1, b'RU')))
+    geo_site_path = tmp_path / 'geosite.dat'
+    geo_site_path.write_bytes(_field(1, _field(1, b'EXAMPLE') + _GEO_SITE_DOMAIN + _GEO_SITE_ADS_DOMAIN))
+    return geo_ip_path, geo_site_path
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    size = len(payload)
+    length = bytes([size]) if size < 0x80 else bytes([size & 0x7f | 0x80, size >> 7])
+    return bytes([number << 3 | 2]) + length + payload
+
+
+# router.CIDR{ip=10.0.0.0, prefix=8}
+_CIDR_10_8 = bytes.fromhex('0a040a0000001008')
+# router.CIDR{ip=::1, prefix=128}
+_CIDR_LOCALHOST_128 = _field(1, bytes(15) + b'\x01') + bytes.fromhex('108001')
+# router.Domain{type=Domain, value=example.com}
+_GEO_SITE_DOMAIN = _field(2, bytes.fromhex('0802') + _field(2, b'example.com'))
+# router.Domain{type=Full, value=ads.example.com, attribute=[{key=ads}]}
+_GEO_SITE_ADS_DOMAIN = _field(
+    2, bytes.fromhex('0803') + _field(2, b'ads.example.com') + _field(3, _field(1, b'ads')))
+
+
+def _router_config(*rules: bytes) -> bytes:
+    return b''.join(_field(2, rule) for rule in rules)
+
+class TestXrayStatsClient:
+
+    def test_query_stats(self, stats_client: XrayStatsClient, stats_service: StubStatsService):
+        result = stats_client.query_stats()
+
+        assert result == stats_service.stats
+        assert stats_service.requests == [('', False)]
+
+    def test_query_stats_with_pattern_and_reset(
+            self, stats_client: XrayStatsClient, stats_service: StubStatsService):
+        result = stats_client.query_stats(pattern='user>>>', reset=True)
+
+        assert result == [Stats(name='user>>>alice.abc@0.0.0.0>>>traffic>>>downlink', value=500)]
+        assert stats_service.requests == [('user>>>', True)]
+        assert all(stat.value == 0 for stat in stats_service.stats)
+
+    def test_query_counters_returns_tuples(
+            self, stats_client: XrayStatsClient, stats_service: StubStatsService):
+        result = stats_client.query_counters()
+
+        assert result == [(stat.name, stat.value) for stat in stats_service.stats]
+
+    def test_reuses_channel_between_queries(
+            self, stats_client: XrayStatsClient, stats_service: StubStatsService):
+        stats_client.query_stats()
+        channel = stats_client._channel  # pylint: disable=protected-access
+        stats_client.query_stats()
+
+        assert channel is not None
+        assert stats_client._channel is channel  # pylint: disable=protected-access
+        assert len(stats_service.requests) == 2
+
+    def test_raises_runtime_error_when_unavailable(self, stats_client: XrayStatsClient):
+        unavailable_client = XrayStatsClient('127.0.0.1', 1, timeout=1)
+
+        with raises(RuntimeError, match='Xray StatsService request to 127.0.0.1:1 failed'):
+            unavailable_client.query_stats()
+
+        unavailable_client.close()
+        assert stats_client.query_stats()
+
+
+class TestStatsCodec:
+
+    def test_encode_request_matches_protobuf_wire_format(self):
+        assert encode_query_stats_request() == b''
+        assert encode_query_stats_request('user', True) == bytes.fromhex('0a04757365721001')
+
+    def test_decode_response_with_absent_and_negative_values(self):
+        data = bytes.fromhex('0a030a0161') + bytes.fromhex('0a0e0a016210ffffffffffffffffff01')
+
+        assert decode_query_stats_response(data) == [
+            Stats(name='a', value=0),
+            Stats(name='b', value=-1),
+        ]
+
+    def test_response_round_trip(self):
+        stats = [
+            Stats(name='user>>>имя.1@0.0.0.0>>>traffic>>>uplink', value=2 ** 40),
+            Stats(name='x', value=0),
+        ]
+
+        assert decode_query_stats_response(encode_query_stats_response(stats)) == stats
+
+    def test_skips_unknown_fields(self):
+        data = bytes.fromhex('1005') + bytes.fromhex('0a0e0a01611801' + '210000000000000000')
+
+        assert decode_query_stats_response(data) == [Stats(name='a', value=0)]
+
+    def test_raises_on_truncated_message(self):
+        with raises(ValueError):
+            decode_query_stats_response(bytes.fromhex('0a050a0161'))
+
+
+class TestXrayHandlerClient:
+
+    def test_add_and_remove_user(self, api_port: int, api_service: StubRequestsService):
+        client = XrayHandlerClient('127.0.0.1', api_port)
+
+        client.add_user('vless-inbound', 'a.1@0.0.0.0', 'id', 'xtls-rprx-vision')
+        client.remove_user('vless-inbound', 'a.1@0.0.0.0')
+        client.close()
+
+        assert api_service.requests == [
+            encode_add_user_request('vless-inbound', 'a.1@0.0.0.0', 'id', 'xtls-rprx-vision'),
+            encode_remove_user_request('vless-inbound', 'a.1@0.0.0.0'),
+        ]
+
+    def test_raises_runtime_error_when_unavailable(self):
+        client = XrayHandlerClient('127.0.0.1', 1, timeout=1)
+
+        with raises(RuntimeError, match='Xray HandlerService request to 127.0.0.1:1 failed'):
+            client.remove_user('vless-inbound', 'a.1@0.0.0.0')
+
+        client.close()
+
+
+class TestXrayRoutingClient:
+
+    def test_replaces_rules(
+            self, api_port: int, api_service: StubRequestsService, geo_paths: tuple[Path, Path]):
+        client = XrayRoutingClient('127.0.0.1', api_port)
+        rules = [{'tag': 'direct.1', 'outboundTag': 'direct', 'protocol': ['bittorrent']}]
+
+        client.replace_rules(rules, *geo_paths)
+        client.close()
+
+        assert api_service.requests == [encode_add_rule_request(encode_router_config(rules, *geo_paths))]
+
+
+class TestHandlerCodec:
+
+    def test_encode_add_user_request_matches_protobuf_wire_format(self):
+        account = _field(1, b'xray.proxy.vless.Account') + _field(2, _field(1, b'id') + _field(2, b'flow'))
+        user = _field(2, b'a@b') + _field(3, account)
+        operation = _field(1, b'xray.app.proxyman.command.AddUserOperation') + _field(2, _field(1, user))
+
+        assert encode_add_user_request('in', 'a@b', 'id', 'flow') == (
+            _field(1, b'in') + _field(2, operation))
+
+    def test_encode_remove_user_request_matches_protobuf_wire_format(self):
+        operation = (
+            _field(1, b'xray.app.proxyman.command.RemoveUserOperation') + _field(2, _field(1, b'a@b')))
+
+        assert encode_remove_user_request('in', 'a@b') == _field(1, b'in') + _field(2, operation)
+
+
+class TestRouterCodec:
+
+    def test_encode_add_rule_request_replaces_rules(self):
+        assert encode_add_rule_request(b'') == _field(1, _field(1, b'xray.app.router.Config'))
+        assert encode_add_rule_request(b'\x12\x00', append=True) == _field(
+            1, _field(1, b'xray.app.router.Config') + _field(2, b'\x12\x00')) + bytes.fromhex('1001')
+
+    def test_encodes_rule_fields(self, geo_paths: tuple[Path, Path]):
+        rule = {
+            'tag': 'mixed.1',
+            'outboundTag': 'direct',
+            'domain': ['example.com', 'domain:a.com', 'full:b.com', 'regexp:^c', 'keyword:d'],
+            'ip': ['10.0.0.0/8', '::1'],
+            'user': ['a.1@0.0.0.0'],
+            'protocol': ['bittorrent'],
+            'port': '53,1000-2000',
+        }
+
+        assert encode_router_config([rule], *geo_paths) == _router_config(
+            _field(1, b'direct')
+            + _field(2, _field(2, b'example.com'))
+            + _field(2, bytes.fromhex('0802') + _field(2, b'a.com'))
+            + _field(2, bytes.fromhex('0803') + _field(2, b'b.com'))
+            + _field(2, bytes.fromhex('0801') + _field(2, b'^c'))
+            + _field(2, _field(2, b'd'))
+            + _field(10, _field(2, _CIDR_10_8) + _field(2, _CIDR_LOCALHOST_128))
+            + _field(7, b'a.1@0.0.0.0')
+            + _field(9, b'bittorrent')
+            + _field(14, _field(1, bytes.fromhex('08351035')) + _field(1, bytes.fromhex('08e80710d00f'))))
+
+    def test_resolves_geodata(self, geo_paths: tuple[Path, Path]):
+        rule = {'outboundTag': 'block', 'domain': ['geosite:example'], 'ip': ['geoip:private', 'geoip:!ru']}
+
+        assert encode_router_config([rule], *geo_paths) == _router_config(
+            _field(1, b'block')
+            + _GEO_SITE_DOMAIN + _GEO_SITE_ADS_DOMAIN
+            + _field(10, _field(1, b'PRIVATE') + _field(2, _CIDR_10_8))
+            + _field(10, _field(1, b'RU') + bytes.fromhex('1801')))
+
+    def test_filters_geosite_attributes(self, geo_paths: tuple[Path, Path]):
+        with_ads = encode_router_config(
+            [{'outboundTag': 'block', 'domain': ['geosite:EXAMPLE@ads']}], *geo_paths)
+        without_ads = encode_router_config(
+            [{'outboundTag': 'direct', 'domain': ['geosite:example@!ads']}], *geo_paths)
+
+        assert with_ads == _router_config(_field(1, b'block') + _GEO_SITE_ADS_DOMAIN)
+        assert without_ads == _router_config(_field(1, b'direct') + _GEO_SITE_DOMAIN)
+
+    def test_raises_on_unsupported_entries(self, geo_paths: tuple[Path, Path]):
+        with raises(ValueError, match='Geodata entry UNKNOWN not found'):
+            encode_router_config([{'outboundTag': 'block', 'domain': ['geosite:unknown']}], *geo_paths)
+        with raises(ValueError, match='Unsupported routing domain'):
+            encode_router_config([{'outboundTag': 'block', 'domain': ['ext:custom.dat:tag']}], *geo_paths)
+        with raises(ValueError, match='Unsupported routing IP'):
+            encode_router_config([{'outboundTag': 'block', 'ip': ['not-an-ip']}], *geo_paths)
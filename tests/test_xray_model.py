@@ -1,3 +1,5 @@
+from app.model.base import TrackedList
+from app.model.routing import Routing, Rule
 from app.model.shared import Log, Dns, DnsOutbound, DnsServer, ApiConfig, Policy, StatsConfig
 from app.model.veepeenet import TrafficStats, VeePeeNetStats, VeePeeNet
 from app.model.vless_inbound import VlessInbound, Client, StreamSettings, RealitySettings
@@ -85,7 +87,11 @@ class TestApiConfig:
         data = api.model_dump(by_alias=True)
         assert data['tag'] == 'api'
         assert data['listen'] == '127.0.0.1:10085'
-        assert data['services'] == ['StatsService']
+        assert data['services'] == ['HandlerService', 'RoutingService', 'StatsService']
+
+    def test_api_config_adds_required_services(self):
+        api = ApiConfig.model_validate({'services': ['StatsService', 'LoggerService']})
+        assert api.services == ['StatsService', 'LoggerService', 'HandlerService', 'RoutingService']
 
 
 class TestPolicy:
@@ -269,3 +275,52 @@ class TestDnsOutbound:
         actual_map = dns_outbound.model_dump(by_alias=True, exclude_none=True)
 
         assert actual_map == expected_map
+
+
+class TestDirtyTracking:
+
+    def test_new_model_is_dirty(self):
+        assert Routing().is_dirty()
+
+    def test_clean_until_attribute_changed(self):
+        routing = Routing()
+        routing.mark_clean()
+        assert not routing.is_dirty()
+
+        routing.domain_strategy = 'AsIs'
+
+        assert routing.is_dirty()
+
+    def test_nested_list_change(self):
+        routing = Routing.model_validate({'rules': [{'outboundTag': 'direct', 'domain': ['a.com']}]})
+        assert routing.rules is not None
+        assert isinstance(routing.rules, TrackedList)
+        routing.mark_clean()
+
+        assert routing.rules[0].domain is not None
+        routing.rules[0].domain.append('b.com')
+
+        assert routing.is_dirty()
+
+    def test_assigned_list_is_tracked(self):
+        routing = Routing()
+        routing.rules = [Rule(outbound_tag='direct')]
+        routing.mark_clean()
+
+        assert routing.rules is not None
+        routing.rules.pop()
+
+        assert isinstance(routing.rules, TrackedList)
+        assert routing.is_dirty()
+
+    def test_other_source_is_dirty(self):
+        routing = Routing()
+        routing.mark_clean('a')
+
+        assert not routing.is_dirty('a')
+        assert routing.is_dirty('b')
+
+    def test_tracked_list_serialized(self):
+        routing = Routing(rules=TrackedList([Rule(outbound_tag='direct')]))
+
+        assert routing.model_dump(by_alias=True, exclude_none=True) == {'rules': [{'outboundTag': 'direct'}]}